@@ -0,0 +1,65 @@
+import argparse
+import gc
+import os
+import sys
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                '..'))
+
+from ghyamlgen import *
+
+
+def build_steps(n):
+  steps = []
+  for i in range(n):
+    steps.append(
+        JobShellStep(name="Step {}".format(i),
+                     run="echo {}".format(i),
+                     working_directory='build' if i % 4 == 0 else None))
+    if i % 10 == 0:
+      steps.append(Checkout())
+  return steps
+
+
+def build_jobs(n, steps_per_job=50):
+  return {
+      'job_{}'.format(i):
+          Job(id='job_{}'.format(i),
+              name='Job {}'.format(i),
+              runs_on='ubuntu-latest',
+              steps=build_steps(steps_per_job))
+      for i in range(n // steps_per_job)
+  }
+
+
+def measure(fn, *args):
+  gc.collect()
+  tracemalloc.start()
+  before, _ = tracemalloc.get_traced_memory()
+  result = fn(*args)
+  after, peak = tracemalloc.get_traced_memory()
+  tracemalloc.stop()
+  return result, after - before, peak - before
+
+
+def main():
+  parser = argparse.ArgumentParser(
+      description='Memory held by renderable trees of increasing size')
+  parser.add_argument('sizes',
+                      nargs='*',
+                      type=int,
+                      default=[1000, 10000, 50000])
+  args = parser.parse_args()
+
+  print('{:>8}  {:>12}  {:>10}  {:>12}'.format('steps', 'retained', 'B/step',
+                                               'resolve peak'))
+  for n in args.sizes:
+    jobs, retained, _ = measure(build_jobs, n)
+    _, _, peak = measure(resolve, jobs)
+    print('{:>8}  {:>12}  {:>10.1f}  {:>12}'.format(n, retained, retained / n,
+                                                    peak))
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,152 @@
+import argparse
+import gc
+import io
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+import tracemalloc
+
+from workloads import build_shared_workflow, build_workflow
+
+import yaml
+from ghyamlgen import Dumper, ResolveCache, render, resolve
+
+# Every metric is sampled --repeat times. It regresses only when its best
+# sample exceeds the baseline median by more than the threshold plus the
+# relative spread between samples, in either run, or this floor if larger.
+NOISE_FLOOR = 0.05
+
+BASELINES = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                         'baselines')
+
+
+def summarize(samples):
+  median = statistics.median(samples)
+  spread = (max(samples) - min(samples)) / median if median else 0.0
+  return {'median': median, 'min': min(samples), 'spread': spread}
+
+
+def timed(fn, *args, repeat=1):
+  samples = []
+  for _ in range(repeat):
+    gc.collect()
+    start = time.perf_counter()
+    result = fn(*args)
+    samples.append(time.perf_counter() - start)
+  return result, summarize(samples)
+
+
+def peak_memory(steps, repeat=1):
+  # Peak traced allocation for building and rendering, measured in its own
+  # passes since tracemalloc distorts the timings.
+  samples = []
+  for _ in range(repeat):
+    gc.collect()
+    tracemalloc.start()
+    render(build_workflow(steps), io.StringIO())
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    samples.append(peak)
+  return summarize(samples)
+
+
+def measure(steps, repeat):
+  workflow, construct = timed(build_workflow, steps, repeat=repeat)
+  native, resolved = timed(resolve, workflow, repeat=repeat)
+  dump = lambda: yaml.dump(native, Dumper=Dumper, sort_keys=False, width=1024)
+  _, dumped = timed(dump, repeat=repeat)
+  _, rendered = timed(render, workflow, io.StringIO(), repeat=repeat)
+  # Jobs sharing frozen steps, resolved plainly and through a warm cache.
+  shared = build_shared_workflow(steps)
+  cache = ResolveCache()
+  resolve(shared, cache)
+  _, shared_resolved = timed(resolve, shared, repeat=repeat)
+  _, cached = timed(resolve, shared, cache, repeat=repeat)
+  return {
+      'construct_s': construct,
+      'resolve_s': resolved,
+      'dump_s': dumped,
+      'render_s': rendered,
+      'shared_resolve_s': shared_resolved,
+      'cached_resolve_s': cached,
+      'peak_bytes': peak_memory(steps, repeat),
+  }
+
+
+def compare(results, baseline, threshold):
+  regressions = []
+  for size, metrics in results.items():
+    reference = baseline.get(size, {})
+    for metric, value in metrics.items():
+      previous = reference.get(metric)
+      # Baselines saved before metrics were sampled hold bare numbers.
+      if not isinstance(previous, dict) or not previous['median']:
+        continue
+      noise = max(NOISE_FLOOR, previous['spread'], value['spread'])
+      if value['min'] > previous['median'] * (1 + threshold + noise):
+        regressions.append((size, metric, previous['median'], value['min']))
+  return regressions
+
+
+def main():
+  parser = argparse.ArgumentParser(
+      description='Generation throughput and memory benchmarks')
+  parser.add_argument('--sizes',
+                      nargs='+',
+                      type=int,
+                      default=[10, 1000, 100000],
+                      help='Workflow sizes, in steps')
+  parser.add_argument('--repeat',
+                      type=int,
+                      default=5,
+                      help='Samples per metric')
+  parser.add_argument(
+      '--baseline',
+      default=os.path.join(BASELINES, '{}.json'.format(platform.node())),
+      help='Baseline JSON; timings only compare on the same machine')
+  parser.add_argument('--threshold',
+                      type=float,
+                      default=0.25,
+                      help='Allowed relative slowdown before failing')
+  parser.add_argument('--save',
+                      action='store_true',
+                      help='Overwrite the baseline with this run')
+  args = parser.parse_args()
+
+  results = {}
+  print('{:>8}  {:>10}  {:>10}  {:>10}  {:>10}  {:>12}  {:>10}  {:>10}'.format(
+      'steps', 'construct', 'resolve', 'dump', 'render', 'peak', 'shared',
+      'cached'))
+  for steps in args.sizes:
+    metrics = measure(steps, args.repeat)
+    results[str(steps)] = metrics
+    medians = {k: v['median'] for k, v in metrics.items()}
+    print('{:>8}  {construct_s:>9.4f}s  {resolve_s:>9.4f}s  {dump_s:>9.4f}s  '
+          '{render_s:>9.4f}s  {peak_bytes:>12.0f}  {shared_resolve_s:>9.4f}s  '
+          '{cached_resolve_s:>9.4f}s'.format(steps, **medians))
+
+  baseline = {}
+  if os.path.exists(args.baseline):
+    with open(args.baseline) as fp:
+      baseline = json.load(fp)
+
+  regressions = compare(results, baseline, args.threshold)
+  for size, metric, previous, value in regressions:
+    print('REGRESSION {} steps {}: {:.4g} -> {:.4g} (+{:.0%})'.format(
+        size, metric, previous, value, value / previous - 1))
+
+  if args.save:
+    os.makedirs(os.path.dirname(args.baseline), exist_ok=True)
+    with open(args.baseline, 'w') as fp:
+      json.dump(results, fp, indent=2, sort_keys=True)
+      fp.write('\n')
+    print('Saved baseline to {}'.format(args.baseline))
+
+  return 1 if regressions and not args.save else 0
+
+
+if __name__ == '__main__':
+  sys.exit(main())
@@ -0,0 +1,106 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                '..'))
+
+from ghyamlgen import *
+
+STEPS_PER_JOB = 50
+
+
+def ccache_steps(identifier):
+  env = lambda x: GitHubExpr(GitHubMapping(x, context='env'))
+  config = {
+      "compilercheck": env("ccache_compilercheck"),
+      "basedir": env("ccache_basedir"),
+      "dir": env("ccache_dir"),
+      "compress": env("ccache_compress"),
+      "compresslevel": env("ccache_compresslevel"),
+      "maxsize": env("ccache_maxsize"),
+  }
+  keys = [
+      GitHubExpr(GitHubMapping(identifier, context='matrix')),
+      GitHubExpr('steps.ccache_vars.outputs.hash'),
+      GitHubExpr('github.ref'),
+      GitHubExpr('steps.ccache_vars.outputs.timestamp')
+  ]
+  return [
+      CcacheVars(config["compilercheck"]),
+      GHCache(keys, config["dir"]),
+      CcacheEnv(config),
+      CCacheProlog(),
+  ]
+
+
+def job_steps(index, count):
+  # A realistic mix: checkout, ccache prolog, build commands (some
+  # multi-line), ccache epilog and a BRT group, truncated to count.
+  steps = [Checkout()]
+  steps.extend(ccache_steps('identifier'))
+  builds = max(count - len(steps) - 5, 0)
+  for i in range(builds):
+    run = 'make -j2 target_{}_{}'.format(index, i)
+    if i % 3 == 0:
+      run = '\n'.join(['mkdir -p build', 'cd build', run])
+    condition = None
+    if i % 5 == 0:
+      condition = GitHubExpr("matrix.unittests == 'true'")
+    steps.append(
+        JobShellStep(name='Build {} of job {}'.format(i, index),
+                     run=run,
+                     working_directory='build' if i % 2 else None,
+                     condition=condition))
+  steps.append(CCacheEpilog())
+  steps.extend(BRT(GitHubExpr('matrix.identifier'), QuotedExpr("'#wasm'")))
+  return steps[:count]
+
+
+def build_workflow(steps):
+  jobs = {}
+  index = 0
+  while steps > 0:
+    count = min(steps, STEPS_PER_JOB)
+    jobid = 'job_{}'.format(index)
+    if index % 2:
+      matrix = {
+          "include": [{
+              "name": 'Job {} {}'.format(index, variant),
+              "os": 'ubuntu-20.04',
+              "identifier": '{}_{}'.format(jobid, variant),
+              "unittests": 'true' if variant == 'full' else 'false',
+          } for variant in ['full', 'minimal']]
+      }
+      job = MatrixJob(id=jobid, matrix=matrix, steps=job_steps(index, count))
+    else:
+      job = Job(id=jobid,
+                name='Job {}'.format(index),
+                runs_on='ubuntu-latest',
+                steps=job_steps(index, count))
+    jobs[job.id()] = job
+    steps -= count
+    index += 1
+
+  on = On(push={"branches": ['main']}, pull_request={"branches": ['main']})
+  env = {
+      "ccache_dir": QuotedExpr('${{ github.workspace }}/.ccache'),
+      "ccache_compresslevel": 9,
+  }
+  return Workflow(name='benchmark', on=on, env=env, jobs=jobs)
+
+
+def build_shared_workflow(steps):
+  # Jobs built from one frozen group of steps, as variants of the same build
+  # are; only the first two steps of each job are its own.
+  common = Group(job_steps(0, STEPS_PER_JOB)[1:]).freeze()
+  jobs = {}
+  for index in range(max(steps // STEPS_PER_JOB, 1)):
+    jobid = 'job_{}'.format(index)
+    configure = JobShellStep(name='Configure job {}'.format(index),
+                             run='cmake -B build -DJOB={}'.format(index))
+    jobs[jobid] = Job(id=jobid,
+                      name='Job {}'.format(index),
+                      runs_on='ubuntu-latest',
+                      steps=Group(Checkout(), configure, common))
+  on = On(push={"branches": ['main']})
+  return Workflow(name='benchmark', on=on, jobs=jobs)
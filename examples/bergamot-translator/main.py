@@ -1,26 +1,20 @@
 import sys
 import os
-from copy import deepcopy
 
 basedir = os.path.dirname(os.path.abspath(__file__))
 root = os.path.join(basedir, "../../")
 sys.path.insert(0, root)
 
 from ghyamlgen import *
-
-
-def merge(*xs):
-  ys = []
-  for x in xs:
-    if isinstance(x, list):
-      ys.extend(x)
-    else:
-      ys.append(x)
-  return ys
+from ghyamlgen.changes import path_filters
+from ghyamlgen.compilercache import Ccache
+from ghyamlgen.deps import apt_cache, brew_cache, mkl_cache
+from ghyamlgen.driver import Make, Ninja
+from ghyamlgen.planner import plan
+from ghyamlgen.shard import ShardedBRT, fan_in, shard_matrix
 
 
 def ccache(build):
-  build = deepcopy(build)
 
   def build_ccache_config():
     f = lambda x: GitHubExpr(GitHubMapping(x, context='env'))
@@ -48,25 +42,30 @@ def ccache(build):
     return ccache_config
 
   config = build_ccache_config()
-  build = [
-      CcacheVars(config["compilercheck"], cmd=config["is_command"]),
-      GHCache(config["keys"], config["dir"]),
-      CcacheEnv(config),
-      CCacheProlog(),
-      *build,
-      CCacheEpilog(),
-  ]
-
-  return build
+  return Ccache(config, GitHubExpr('matrix.identifier')).wrap(build)
 
 
 class MarianBuild:
 
-  def __init__(self, id, name, os, env, setup, build, build_epilog, brt):
+  def __init__(self,
+               id,
+               name,
+               os,
+               env,
+               setup,
+               build,
+               build_epilog,
+               brt,
+               driver=None):
     self.id = id
     self.name = name
     self.os = os
     self.env = env
+    # A driver (ghyamlgen.driver) sizes the build to the runner and adds
+    # the step that runs it after the configure steps in build.
+    if driver is not None:
+      setup = [setup, driver.setup()]
+      build = [build, driver.build()]
     self.setup = setup
     self.build = build
     self.build_epilog = build_epilog
@@ -83,9 +82,9 @@ class MarianBuild:
     return Job(
         id=id,
         name=name,
-        env=env,
+        env=self.env,
         runs_on=self.os,
-        steps=merge(Checkout(), self.setup, build, self.build_epilog, self.brt))
+        steps=Group(Checkout(), self.setup, build, self.build_epilog, self.brt))
 
   def constructMatrixJob(self, matrix, with_cache=False):
     build = ccache(self.build) if with_cache else self.build
@@ -94,7 +93,7 @@ class MarianBuild:
     if not with_cache:
       id = '{}_fresh'.format(id)
       # name = '{} (fresh build)'.format(name)
-    steps = merge(Checkout(), self.setup, build, self.build_epilog, self.brt)
+    steps = Group(Checkout(), self.setup, build, self.build_epilog, self.brt)
 
     return MatrixJob(id=id, matrix=matrix, steps=steps)
 
@@ -103,48 +102,45 @@ class MarianBuild:
     cached = self.constructJob(with_cache=True)
     fresh = self.constructJob(with_cache=False)
     return {cached.id(): cached}
-    # return cached_flow(cached, fresh)
-
-
-def cached_flow(cached: Job, fresh: Job):
-  fresh.needs(job=cached, OpExpr=RunIfFailed),
-  log = Job(
-      id='{}_log'.format(self.id),
-      name='Log a few contexts',
-      env=None,
-      runs_on=self.os,
-      steps=[LogContext('needs'),
-             Evaluate("needs.cached.result == 'failure'")])
-
-  log.needs(job=cached, OpExpr=Always)
-
-  jobs = [
-      cached,
-      # fresh,
-      #log
-  ]
-  jobdict = {job.id(): job for job in jobs}
-  return jobdict
+    # return self.cached_flow(cached, fresh)
+
+  def cached_flow(self, cached: Job, fresh: Job):
+    # The fresh build runs only if the cached one failed; the log job always
+    # runs after it.
+    fresh = fresh.needs(cached, OpExpr=RunIfFailed)
+    log = Job(id='{}_log'.format(self.id),
+              name='Log a few contexts',
+              env=None,
+              runs_on=self.os,
+              steps=[
+                  LogContext('needs'),
+                  Evaluate("needs.{}.result == 'failure'".format(cached.id()))
+              ])
+    log = log.needs(cached, OpExpr=Always)
+
+    jobs = [cached, fresh, log]
+    return {job.id(): job for job in jobs}
 
 
 def ubuntu():
+  os = GitHubExpr(GitHubMapping('os', context='matrix'))
   setup = [
-      ImportedSnippet(
-          "Install Dependencies",
-          "examples/bergamot-translator/native-ubuntu/00-install-deps.sh"),
-      ImportedSnippet(
-          "Install MKL",
-          "examples/bergamot-translator/native-ubuntu/01-install-mkl.sh"),
+      apt_cache(
+          ImportedSnippet(
+              "Install Dependencies",
+              "examples/bergamot-translator/native-ubuntu/00-install-deps.sh"),
+          os),
+      mkl_cache(
+          ImportedSnippet(
+              "Install MKL",
+              "examples/bergamot-translator/native-ubuntu/01-install-mkl.sh"),
+          os),
   ]
 
   build = [
       ImportedSnippet(
           "cmake",
           "examples/bergamot-translator/native-ubuntu/10-cmake-run.sh"),
-      ImportedSnippet(
-          "Build from source",
-          "examples/bergamot-translator/native-ubuntu/20-build.sh",
-          working_directory="build"),
   ]
 
   def build_epilog(context):
@@ -198,33 +194,14 @@ def ubuntu():
 
   # print(yaml.dump(matrix, sort_keys=False))
 
-  def build_env_jobs():
-    jobs = {}
-    for version in ['18.04', '20.04']:
-      for env_name, env in configs.items():
-        platform = platform_ubuntu(version, env_name)
-        tags = GitHubExpr(GitHubMapping('brt_tags', context='env'))
-        jobid = GitHubExpr(GitHubMapping('job', context='github'))
-
-        # env = None
-        variations = MarianBuild(
-            platform["id"],
-            platform["name"],
-            platform["os"],
-            env,
-            setup,
-            build,
-            build_epilog(context='env'),
-            BRT(jobid, tags))
-        jobs.update(variations.generate())
-    return jobs
-
   def build_matrix_jobs(matrix):
     name = GitHubExpr(GitHubMapping('name', context='matrix'))
     os = GitHubExpr(GitHubMapping('os', context='matrix'))
     env = None
     jobid = GitHubExpr(GitHubMapping('identifier', context='matrix'))
     tags = GitHubExpr(GitHubMapping('brt_tags', context='matrix'))
+    # The regression tests are split over two runners per platform, and a
+    # fan-in job per build merges their logs.
     matrix_build = MarianBuild(
         "ubuntu",
         name,
@@ -233,18 +210,27 @@ def ubuntu():
         setup,
         build,
         build_epilog(context='matrix'),
-        BRT(jobid, tags))
-    matrix_job = matrix_build.constructMatrixJob(matrix, with_cache=True)
-    return {matrix_job.id(): matrix_job}
+        ShardedBRT(jobid, tags, shards=2),
+        driver=Ninja())
+    matrix_job = matrix_build.constructMatrixJob(shard_matrix(matrix, 2),
+                                                 with_cache=True)
+    jobs = {}
+    for job in plan(matrix_job).jobs.values():
+      merge = fan_in(job)
+      jobs.update({job.id(): job, merge.id(): merge})
+    return jobs
 
   return build_matrix_jobs(matrix)
 
 
 def mac():
+  os = GitHubExpr(GitHubMapping('os', context='matrix'))
   setup = [
-      ImportedSnippet(
-          "Install Dependencies",
-          "examples/bergamot-translator/native-mac/00-install-deps.sh"),
+      brew_cache(
+          ImportedSnippet(
+              "Install Dependencies",
+              "examples/bergamot-translator/native-mac/00-install-deps.sh"),
+          os),
       JobShellStep(
           name="Setup path with gnu",
           run='\n'.join([
@@ -262,8 +248,6 @@ def mac():
   build = [
       ImportedSnippet(
           "cmake", "examples/bergamot-translator/native-mac/10-cmake-run.sh"),
-      JobShellStep(
-          name="Build from source", run="make -j2", working_directory="build"),
   ]
 
   def build_epilog(context):
@@ -337,26 +321,15 @@ def mac():
         setup,
         build,
         build_epilog(context='matrix'),
-        BRT(jobid, tags))
+        BRT(jobid, tags),
+        driver=Make())
     matrix_job = matrix_build.constructMatrixJob(matrix, with_cache=True)
-    return {matrix_job.id(): matrix_job}
-
-  # def __init__(self, id, name, env, setup, build_deps, build, build_epilog, brt):
-  def build_env_job():
-    jobs = {}
-    for env_name, env in configs.items():
-      tags = GitHubExpr(GitHubMapping('brt_tags', context='env'))
-      jobid = GitHubExpr(GitHubMapping('job', context='github'))
-      variations = MarianBuild(platform["id"], platform["name"],
-                               platform["os"], env, setup, build, build_epilog,
-                               BRT(jobid, tags))
-      jobs.update(variations.generate())
-    return jobs
+    return plan(matrix_job).jobs
 
   return build_matrix_jobs(matrix)
 
 
-if __name__ == '__main__':
+def native():
   on = On(push={"branches": ['main']}, pull_request={"branches": ['main']})
   # on = On(push={"branches": ['main']}, workflow_dispatch={
   #     "inputs": {
@@ -391,5 +364,19 @@ if __name__ == '__main__':
   jobs.update(ubuntu())
   jobs.update(mac())
 
+  # Both builds depend on the same sources; changes to docs and the like run
+  # nothing.
+  sources = [
+      'src/**', 'app/**', '3rd_party/**', 'cmake/**', '**/CMakeLists.txt',
+      'bergamot-translator-tests', '.gitmodules', '.github/**'
+  ]
   workflow = Workflow(name='default', on=on, env=env, jobs=jobs)
-  print(yaml.dump(resolve(workflow), sort_keys=False, width=1024))
+  return path_filters(workflow, {jobid: sources for jobid in jobs})
+
+
+def workflows():
+  return {'native.yml': native()}
+
+
+if __name__ == '__main__':
+  dump(native(), sys.stdout)
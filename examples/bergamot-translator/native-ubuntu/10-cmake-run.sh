@@ -1,3 +1,3 @@
 mkdir -p build
 cd build
-cmake -L .. ${{ matrix.cmake }} ${{ env.ccache_cmake }}
+cmake -L .. ${{ matrix.cmake }} ${{ env.ccache_cmake }} ${{ env.build_cmake }}
@@ -1 +0,0 @@
-make -j2
@@ -1 +1 @@
-make test
+ctest --output-on-failure
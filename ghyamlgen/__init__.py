@@ -1,27 +1,155 @@
+import copy
+
 import yaml
 
 from .yml import GitHubExpr, Snippet, QuotedExpr, GitHubMapping
-
-yaml.add_representer(Snippet, Snippet.representer)
-yaml.add_representer(GitHubExpr, GitHubExpr.representer)
-yaml.add_representer(QuotedExpr, QuotedExpr.representer)
-yaml.add_representer(GitHubMapping, GitHubMapping.representer)
+from .yml import Dumper, PyDumper, CDumper
 
 
 class YAMLRenderable:
-  pass
+  # Nodes are slotted and keep only the fields that are set. The key order
+  # of the first full fields dict a class builds is remembered, so fields
+  # set later still render in their usual position.
+  __slots__ = ('_fields', '_frozen')
+  _keys = ()
+
+  def __new__(cls, *args, **kwargs):
+    node = super().__new__(cls)
+    node._frozen = False
+    return node
+
+  @property
+  def fields(self):
+    return self._fields
+
+  @fields.setter
+  def fields(self, fields):
+    if self._frozen:
+      raise AttributeError('fields of a frozen {} cannot be set'.format(
+          type(self).__name__))
+    cls = type(self)
+    if '_keys' not in cls.__dict__:
+      cls._keys = tuple(fields)
+    self._fields = {k: v for k, v in fields.items() if v is not None}
+
+  def _merged(self, fields):
+    merged = {**self._fields, **fields}
+    order = {k: i for i, k in enumerate(type(self)._keys)}
+    return {
+        k: merged[k]
+        for k in sorted(merged, key=lambda k: order.get(k, len(order)))
+    }
+
+  def freeze(self):
+    # A frozen node cannot be modified: its fields cannot be set, and they
+    # and everything below them are frozen too (dicts and lists become
+    # read-only). Helpers such as Job.needs() return an updated copy
+    # instead, so the node can be shared between variants.
+    if not self._frozen:
+      self._fields = _freeze(self._fields)
+      self._frozen = True
+    return self
+
+  def updated(self, fields):
+    # Shallow copy with some fields replaced; every other child is shared
+    # with self, not copied. The copy is never frozen.
+    node = copy.copy(self)
+    node._frozen = False
+    node.fields = self._merged(fields)
+    return node
+
+
+def _read_only(self, *args, **kwargs):
+  raise TypeError('fields of a frozen node are read-only')
+
+
+class _FrozenDict(dict):
+  __slots__ = ()
+  __setitem__ = __delitem__ = __ior__ = _read_only
+  clear = pop = popitem = setdefault = update = _read_only
+
+  def __reduce_ex__(self, protocol):
+    return _FrozenDict, (dict(self),)
+
+
+class _FrozenList(list):
+  __slots__ = ()
+  __setitem__ = __delitem__ = __iadd__ = __imul__ = _read_only
+  append = extend = insert = pop = remove = clear = sort = reverse = _read_only
+
+  def __reduce_ex__(self, protocol):
+    return _FrozenList, (list(self),)
 
 
-def resolve(cls):
+def _freeze(value):
+  if isinstance(value, YAMLRenderable):
+    return value.freeze()
+  if isinstance(value, dict):
+    return _FrozenDict((k, _freeze(v)) for k, v in value.items())
+  if isinstance(value, list):
+    return _FrozenList(_freeze(v) for v in value)
+  return value
+
+
+def _flatten(parts):
+  for part in parts:
+    if isinstance(part, Group):
+      yield from _flatten(part.renderables)
+    elif isinstance(part, list):
+      yield from _flatten(part)
+    elif part is not None:
+      yield part
+
+
+class Group(YAMLRenderable):
+  # Concatenation of steps, lists of steps and other groups that renders as
+  # one flat sequence. Parts are referenced, never copied, and a Group
+  # placed inside a list is spliced into it.
+  __slots__ = ('renderables',)
+
+  def __init__(self, *renderables):
+    self.renderables = renderables
+
+  def __iter__(self):
+    return _flatten(self.renderables)
+
+  def __add__(self, other):
+    return Group(self, other)
+
+  @property
+  def fields(self):
+    return list(self)
+
+  def freeze(self):
+    if not self._frozen:
+      self.renderables = tuple(_freeze(part) for part in self.renderables)
+      self._frozen = True
+    return self
+
+
+def resolve(cls, cache=None):
+  if cache is not None:
+    return cache.resolve(cls)
+  if profile.current is not None:
+    return profile.current.resolve(cls)
+  return _resolve(cls)
+
+
+def _resolve(cls):
   native = None
   if isinstance(cls, YAMLRenderable):
-    native = resolve(cls.fields)
+    native = _resolve(cls.fields)
 
   elif isinstance(cls, list):
-    native = [resolve(v) for v in cls if v is not None]
+    native = []
+    for v in cls:
+      if isinstance(v, Group):
+        native.extend(_resolve(v))
+      elif v is not None:
+        native.append(_resolve(v))
 
   elif isinstance(cls, dict):
-    native = {k: resolve(v) for k, v in cls.items() if v is not None}
+    native = {k: _resolve(v) for k, v in cls.items() if v is not None}
 
   else:
     native = cls
@@ -29,5 +157,23 @@ def resolve(cls):
   return native
 
 
+def walk(cls):
+  # Yields every node reachable from cls (renderables, containers and
+  # leaves) in document order, skipping None fields like resolve() does.
+  stack = [cls]
+  while stack:
+    node = stack.pop()
+    yield node
+    if isinstance(node, YAMLRenderable):
+      stack.append(node.fields)
+    elif isinstance(node, list):
+      stack.extend(v for v in reversed(node) if v is not None)
+    elif isinstance(node, dict):
+      stack.extend(v for v in reversed(list(node.values())) if v is not None)
+
+
+from . import profile
+from .cache import ResolveCache
+from .emit import dump, render
 from .gh import *
 from .ccache import *
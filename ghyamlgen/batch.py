@@ -0,0 +1,169 @@
+import glob
+import hashlib
+import importlib.util
+import os
+import time
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from . import profile
+from .emit import render
+from .files import write_atomic
+from .gh import prefetch_snippets
+from .incremental import module_paths, package_paths, snippet_paths
+
+SpecResult = namedtuple('SpecResult',
+                        ['spec', 'seconds', 'outputs', 'error', 'deps'],
+                        defaults=[None])
+OutputResult = namedtuple('OutputResult',
+                          ['path', 'seconds', 'digest', 'written'])
+
+UP_TO_DATE = 'up-to-date'
+
+
+def discover(paths):
+  # A directory contributes every non-private *.py file directly inside it;
+  # modules without a workflow hook are skipped when they are loaded.
+  specs = []
+  for path in paths:
+    if os.path.isdir(path):
+      for fpath in sorted(glob.glob(os.path.join(path, '*.py'))):
+        if not os.path.basename(fpath).startswith('_'):
+          specs.append(fpath)
+    else:
+      specs.append(path)
+  return specs
+
+
+def load_spec(path):
+  path = os.path.abspath(path)
+  digest = hashlib.sha1(path.encode()).hexdigest()[:12]
+  name = 'ghyamlgen_spec_{}'.format(digest)
+  spec = importlib.util.spec_from_file_location(name, path)
+  module = importlib.util.module_from_spec(spec)
+  spec.loader.exec_module(module)
+  return module
+
+
+def spec_workflows(module):
+  # Spec modules expose either workflows() -> {filename: Workflow} or a
+  # single workflow(), which is written to <module-stem>.yml.
+  if hasattr(module, 'workflows'):
+    return module.workflows()
+  if hasattr(module, 'workflow'):
+    stem = os.path.splitext(os.path.basename(module.__file__))[0]
+    return {'{}.yml'.format(stem): module.workflow()}
+  return {}
+
+
+def write_if_changed(path, data):
+  # Leaves identical outputs alone, so their mtime (and anything watching
+  # it) is not disturbed.
+  encoded = data.encode('utf-8')
+  try:
+    with open(path, 'rb') as fp:
+      if fp.read() == encoded:
+        return hashlib.sha1(encoded).hexdigest(), False
+  except OSError:
+    pass
+  write_atomic(path, data)
+  return hashlib.sha1(encoded).hexdigest(), True
+
+
+def render_spec(path, output_dir=None):
+  start = time.perf_counter()
+  try:
+    workflows = spec_workflows(load_spec(path))
+    prefetch_snippets(*workflows.values())
+    output_dir = output_dir or os.path.dirname(path)
+    outputs = []
+    deps = module_paths(path) | package_paths()
+    for fname, workflow in workflows.items():
+      tick = time.perf_counter()
+      opath = os.path.join(output_dir, fname)
+      digest, written = write_if_changed(opath, render(workflow))
+      outputs.append(
+          OutputResult(opath,
+                       time.perf_counter() - tick, digest, written))
+      deps.update(os.path.abspath(p) for p in snippet_paths(workflow))
+  except Exception as e:
+    return SpecResult(path,
+                      time.perf_counter() - start, [],
+                      '{}: {}'.format(type(e).__name__, e))
+  return SpecResult(path, time.perf_counter() - start, outputs, None, deps)
+
+
+def render_all(specs, output_dir=None, jobs=None, manifest=None):
+  # With a manifest, specs whose recorded inputs and outputs are unchanged
+  # are reported as up to date without being loaded.
+  pending = []
+  for spec in specs:
+    if manifest is not None and manifest.up_to_date(spec, output_dir):
+      yield SpecResult(spec, 0.0, [], None)
+    else:
+      pending.append(spec)
+
+  for result in _render_pending(pending, output_dir, jobs):
+    if manifest is not None and result.error is None:
+      manifest.update(result.spec, output_dir, result.deps,
+                      [(o.path, o.digest) for o in result.outputs])
+    yield result
+
+
+def _render_pending(specs, output_dir, jobs):
+  if jobs == 1 or len(specs) <= 1:
+    for spec in specs:
+      yield render_spec(spec, output_dir)
+    return
+
+  if profile.current is None:
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+      futures = [
+          executor.submit(render_spec, spec, output_dir) for spec in specs
+      ]
+      for future in as_completed(futures):
+        yield future.result()
+    return
+
+  # Workers profile each spec on their own and send the profile back, to be
+  # merged into the one active here.
+  profiler = profile.current
+  with ProcessPoolExecutor(max_workers=jobs,
+                           initializer=profile.disable) as executor:
+    futures = [
+        executor.submit(_render_profiled, spec, output_dir) for spec in specs
+    ]
+    for future in as_completed(futures):
+      result, snapshot = future.result()
+      profiler.merge(snapshot)
+      yield result
+
+
+def _render_profiled(spec, output_dir):
+  with profile.profiling() as profiler:
+    result = render_spec(spec, output_dir)
+  return result, profiler.snapshot()
+
+
+def summarize(results, seconds, stream):
+  failed = 0
+  count = 0
+  for result in sorted(results, key=lambda r: r.spec):
+    status = 'ok'
+    if result.error is not None:
+      status = 'FAILED'
+    elif result.deps is None:
+      status = UP_TO_DATE
+    stream.write('{:8.3f}s  {}  [{}]\n'.format(result.seconds, result.spec,
+                                               status))
+    if result.error is not None:
+      failed += 1
+      stream.write('           {}\n'.format(result.error))
+    for output in result.outputs:
+      count += 1
+      stream.write('{:8.3f}s    -> {}{}\n'.format(
+          output.seconds, output.path,
+          '' if output.written else ' (unchanged)'))
+  stream.write('{:8.3f}s  total: {} spec(s), {} output(s), {} failed\n'.format(
+      seconds, len(results), count, failed))
+  return failed
@@ -0,0 +1,163 @@
+from collections import OrderedDict, namedtuple
+
+from . import YAMLRenderable, Group
+
+CacheInfo = namedtuple('CacheInfo', ['hits', 'misses', 'maxsize', 'currsize'])
+
+
+def _steps(parts):
+  # Like Group iteration, over a list that may hold groups.
+  for part in parts:
+    if isinstance(part, Group):
+      yield from part
+    elif part is not None:
+      yield part
+
+
+def _copy(native):
+  if isinstance(native, dict):
+    return {k: _copy(v) for k, v in native.items()}
+  if isinstance(native, list):
+    return [_copy(v) for v in native]
+  return native
+
+
+def _static(node):
+  # Frozen nodes whose fields are stored, not computed when read as
+  # ImportedSnippet's are, keep their content for good.
+  return node._frozen and type(node).fields is YAMLRenderable.fields
+
+
+class ResolveCache:
+  # Caches the resolved form of each node under a key for the content of
+  # its fields, so identical subtrees are resolved once: within a call,
+  # across calls, and whether or not they are the same objects. Nodes may
+  # change between calls, so each is hashed again on every call, but only
+  # once per call however often it occurs. Frozen nodes (see
+  # YAMLRenderable.freeze) cannot change and keep their hash.
+  #
+  # A cached native sits in at most one place, and is copied wherever else
+  # it is needed, so results dump without YAML aliases. Results are shared
+  # between calls, though: do not modify them.
+
+  def __init__(self, maxsize=1024):
+    self.maxsize = maxsize
+    self._entries = OrderedDict()  # digest -> [native, placed]
+    self._digests = OrderedDict()  # id(node) -> (node, digest), static nodes
+    self._keys = {}  # content key -> digest
+    self._next = 0
+    self._hits = 0
+    self._misses = 0
+
+  def cache_info(self):
+    return CacheInfo(self._hits, self._misses, self.maxsize, len(self._entries))
+
+  def cache_clear(self):
+    self._entries.clear()
+    self._digests.clear()
+    self._keys.clear()
+    self._hits = 0
+    self._misses = 0
+
+  def resolve(self, cls):
+    return _Resolution(self).resolve(cls)
+
+  def _intern(self, key):
+    # Numbers are never reused, so once the table is dropped for growing too
+    # large, old entries can only miss, never match another content.
+    digest = self._keys.get(key)
+    if digest is None:
+      if len(self._keys) >= 16 * self.maxsize:
+        self._keys.clear()
+      digest = self._keys[key] = self._next
+      self._next += 1
+    return digest
+
+
+class _Resolution:
+  # The state of one ResolveCache.resolve() call.
+
+  def __init__(self, cache):
+    self.cache = cache
+    self.digests = {}  # id(node) -> (node, digest), other nodes
+
+  def resolve(self, cls):
+    if isinstance(cls, YAMLRenderable) and not isinstance(cls, Group):
+      return self.entry(cls)[0]
+    return self.build(cls)
+
+  def entry(self, node):
+    cache = self.cache
+    digest = self.digest(node)
+    entry = cache._entries.get(digest)
+    if entry is not None:
+      cache._entries.move_to_end(digest)
+      cache._hits += 1
+      return entry
+
+    cache._misses += 1
+    entry = cache._entries[digest] = [self.build(node.fields), False]
+    if len(cache._entries) > cache.maxsize:
+      cache._entries.popitem(last=False)
+    return entry
+
+  def place(self, value):
+    # The native of value, to put inside another native.
+    if isinstance(value, YAMLRenderable) and not isinstance(value, Group):
+      entry = self.entry(value)
+      if entry[1]:
+        return _copy(entry[0])
+      entry[1] = True
+      return entry[0]
+    return self.build(value)
+
+  def build(self, value):
+    if isinstance(value, (Group, list)):
+      return [self.place(v) for v in _steps(value)]
+    if isinstance(value, dict):
+      return {k: self.place(v) for k, v in value.items() if v is not None}
+    if isinstance(value, YAMLRenderable):
+      return self.place(value)
+    return value
+
+  def digest(self, node):
+    key = id(node)
+    if _static(node):
+      known = self.cache._digests
+    else:
+      known = self.digests
+    entry = known.get(key)
+    if entry is not None:
+      return entry[1]
+
+    digest = self.content(node.fields)
+    # Entries hold on to their node, so its id is not reused meanwhile.
+    known[key] = (node, digest)
+    if known is self.cache._digests and len(known) > self.cache.maxsize:
+      known.popitem(last=False)
+    return digest
+
+  def content(self, value):
+    # Content keys are interned: each distinct content gets a number, and
+    # containers are keyed on their children's numbers, so a key never
+    # grows with the size of the subtree below it. Scalars go in with their
+    # type, since str subclasses (Snippet, QuotedExpr, ...) are represented
+    # differently.
+    if isinstance(value, YAMLRenderable) and not isinstance(value, Group):
+      # The class does not change the rendered output, only its fields do,
+      # so identical steps built by different subclasses share an entry.
+      return self.digest(value)
+    item = self.item
+    if isinstance(value, (Group, list)):
+      key = ('L',) + tuple(item(v) for v in _steps(value))
+    elif isinstance(value, dict):
+      key = ('D',) + tuple(
+          (type(k), k, item(v)) for k, v in value.items() if v is not None)
+    else:
+      key = ('S', type(value), value)
+    return self.cache._intern(key)
+
+  def item(self, value):
+    if isinstance(value, (YAMLRenderable, list, dict)):
+      return self.content(value)
+    return (type(value), value)
@@ -0,0 +1,194 @@
+import datetime
+import json
+from collections import Counter, namedtuple
+
+from . import GitHubExpr
+from .expr import render_template
+from .gh import GHCache
+
+# Replays a history of CI runs against GHCache key schemes, following
+# actions/cache: an exact key match restores and skips the save; otherwise
+# restore-keys are tried in order as prefixes, newest entry first, and the
+# job saves under its key. Lookups search the run's ref, then its base ref,
+# then the default branch. Entries unused for a week are dropped, and once
+# the repository passes its size limit the least recently used go first.
+
+GB = 1024**3
+MB = 1024**2
+
+Run = namedtuple('Run', ['time', 'ref', 'entry', 'hash', 'bytes', 'base_ref'],
+                 defaults=(None, None))
+
+SimulationReport = namedtuple('SimulationReport', [
+    'scheme', 'runs', 'exact', 'partial', 'misses', 'hit_rate', 'sources',
+    'saves', 'stored', 'evicted', 'peak', 'final'
+])
+
+DEFAULT_SCHEME = [
+    'matrix.identifier', 'steps.ccache_vars.outputs.hash', 'github.ref',
+    'steps.ccache_vars.outputs.timestamp'
+]
+
+
+class _Entry:
+  __slots__ = ('key', 'scope', 'created', 'accessed', 'bytes')
+
+  def __init__(self, key, scope, created, size):
+    self.key = key
+    self.scope = scope
+    self.created = created
+    self.accessed = created
+    self.bytes = size
+
+
+def _timestamp(value):
+  if isinstance(value, (int, float)):
+    return float(value)
+  value = datetime.datetime.fromisoformat(value.replace('Z', '+00:00'))
+  if value.tzinfo is None:
+    value = value.replace(tzinfo=datetime.timezone.utc)
+  return value.timestamp()
+
+
+def load_history(path):
+  # JSON lines (or one JSON list) of runs: time (epoch seconds or ISO 8601),
+  # ref, hash, and either a matrix entry or just its identifier. bytes and
+  # base_ref are optional.
+  with open(path) as fp:
+    text = fp.read()
+  if text.lstrip().startswith('['):
+    records = json.loads(text)
+  else:
+    records = [json.loads(line) for line in text.splitlines() if line.strip()]
+  runs = []
+  for record in records:
+    entry = record.get('entry') or {'identifier': record.get('identifier')}
+    runs.append(
+        Run(_timestamp(record['time']), record['ref'], entry,
+            record.get('hash', ''), record.get('bytes'),
+            record.get('base_ref')))
+  return sorted(runs, key=lambda run: run.time)
+
+
+def scheme(cache):
+  # The key template and restore-key templates of a GHCache step.
+  with_ = cache.fields['with']
+  return with_['key'], str(with_.get('restore-keys') or '').splitlines()
+
+
+def scheme_from_keys(keys):
+  # keys: expressions such as 'matrix.identifier', as GHCache is given.
+  return scheme(GHCache([GitHubExpr(key) for key in keys], 'ccache'))
+
+
+def context(run):
+  when = datetime.datetime.fromtimestamp(run.time, datetime.timezone.utc)
+  return {
+      'matrix': run.entry,
+      'github': {
+          'ref': run.ref,
+          'base_ref': run.base_ref or '',
+      },
+      'steps': {
+          'ccache_vars': {
+              'outputs': {
+                  'hash': run.hash,
+                  'timestamp': when.strftime('%Y-%m-%dT%H.%M.%S'),
+              }
+          }
+      },
+  }
+
+
+def simulate(history,
+             key,
+             restore_keys=(),
+             limit=10 * GB,
+             ttl=7 * 86400,
+             default_branch='refs/heads/main',
+             size=200 * MB,
+             name=None):
+  entries = []
+  counts = Counter()
+  sources = Counter()
+  stored = evicted = peak = 0
+
+  for run in history:
+    # Entries not accessed within ttl are removed before the run starts.
+    expired = [e for e in entries if e.accessed < run.time - ttl]
+    for e in expired:
+      entries.remove(e)
+      evicted += e.bytes
+
+    ctx = context(run)
+    primary = render_template(key, ctx)
+    prefixes = [render_template(r, ctx) for r in restore_keys]
+    scopes = []
+    for scope in (run.ref, run.base_ref, default_branch):
+      if scope and scope not in scopes:
+        scopes.append(scope)
+
+    found = source = None
+    for scope in scopes:
+      in_scope = [e for e in entries if e.scope == scope]
+      exact = [e for e in in_scope if e.key == primary]
+      if exact:
+        found, source = exact[0], 'key'
+      else:
+        for i, prefix in enumerate(prefixes):
+          matches = [e for e in in_scope if e.key.startswith(prefix)]
+          if matches:
+            found = max(matches, key=lambda e: e.created)
+            source = 'restore-keys[{}]'.format(i)
+            break
+      if found is not None:
+        if scope != run.ref:
+          source += ' from {}'.format(scope)
+        break
+
+    if found is not None:
+      found.accessed = run.time
+      sources[source] += 1
+    if found is not None and source.startswith('key'):
+      counts['exact'] += 1
+      continue
+    counts['partial' if found is not None else 'misses'] += 1
+
+    # Saves never replace an existing entry for the same key and scope.
+    if any(e.key == primary and e.scope == run.ref for e in entries):
+      continue
+    entry = _Entry(primary, run.ref, run.time, run.bytes or size)
+    entries.append(entry)
+    counts['saves'] += 1
+    stored += entry.bytes
+    total = sum(e.bytes for e in entries)
+    peak = max(peak, total)
+    while total > limit and len(entries) > 1:
+      oldest = min((e for e in entries if e is not entry),
+                   key=lambda e: e.accessed)
+      entries.remove(oldest)
+      evicted += oldest.bytes
+      total -= oldest.bytes
+
+  runs = len(history)
+  hits = counts['exact'] + counts['partial']
+  return SimulationReport(name or key, runs, counts['exact'], counts['partial'],
+                          counts['misses'], hits / runs if runs else 0.0,
+                          dict(sources), counts['saves'], stored, evicted, peak,
+                          sum(e.bytes for e in entries))
+
+
+def describe(report):
+  lines = [
+      report.scheme,
+      '  {} runs: {:.1%} hit rate ({} exact, {} partial, {} misses)'.format(
+          report.runs, report.hit_rate, report.exact, report.partial,
+          report.misses),
+      '  {} saves, {:.2f} GB uploaded, {:.2f} GB evicted, peak {:.2f} GB, '
+      'final {:.2f} GB'.format(report.saves, report.stored / GB,
+                               report.evicted / GB, report.peak / GB,
+                               report.final / GB),
+  ]
+  for source, count in sorted(report.sources.items(), key=lambda sc: -sc[1]):
+    lines.append('  {:>6}  restored via {}'.format(count, source))
+  return '\n'.join(lines)
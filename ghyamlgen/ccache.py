@@ -1,7 +1,9 @@
+from . import YAMLRenderable
 from .gh import JobShellStep
 
 
 class CcacheEnv(JobShellStep):
+  __slots__ = ()
 
   def __init__(self, config):
     env = {
@@ -23,6 +25,7 @@ class CcacheEnv(JobShellStep):
 
 
 class CcacheVars(JobShellStep):
+  __slots__ = ()
 
   def __init__(self, check, cmd=False):
     # check can be string value or command, so
@@ -42,19 +45,146 @@ class CcacheVars(JobShellStep):
 
 
 class CCacheProlog(JobShellStep):
+  __slots__ = ()
 
   def __init__(self):
     commands = [
         'ccache -s # Print current cache stats',
         'ccache -z # Zero cache entry',
+        'echo "CCACHE_BUILD_START=$(date +%s)" >> $GITHUB_ENV',
+        # The log times each compilation, for the epilog's saved_seconds.
+        'rm -f "$RUNNER_TEMP/ccache.log"',
+        'echo "CCACHE_LOGFILE=$RUNNER_TEMP/ccache.log" >> $GITHUB_ENV',
     ]
     super().__init__(name="ccache prolog", run='\n'.join(commands))
 
 
+# ccache >= 3.7 prints machine-readable counters with --print-stats; older
+# releases (Ubuntu 18.04 ships 3.4) only have the `ccache -s` table, which is
+# mapped onto the same counter names. Its sizes are decimal (kB, MB, GB) or,
+# from ccache 4, binary (KiB, MiB, GiB); --print-stats counts KiB.
+_STATS_FALLBACK = """ccache -s | awk '
+  /^cache hit \\(direct\\)/ { print "direct_cache_hit\\t" $NF }
+  /^cache hit \\(preprocessed\\)/ { print "preprocessed_cache_hit\\t" $NF }
+  /^cache miss/ { print "cache_miss\\t" $NF }
+  /^cleanups performed/ { print "cleanups_performed\\t" $NF }
+  /^files in cache/ { print "files_in_cache\\t" $NF }
+  /^cache size/ {
+    unit = $NF; size = $(NF - 1)
+    scale = unit ~ /^.i/ ? 1024 : 1000
+    power = index("KMGT", toupper(substr(unit, 1, 1)))
+    print "cache_size_kibibyte\\t" int(size * scale ^ power / 1024)
+  }'"""
+
+# Compile time saved: hits times the difference between the mean time of a
+# miss and of a hit, timed from the ccache log. Each invocation logs lines
+# "[<date>T<time> <pid>] ..." from its start up to "Result: <hit or miss>".
+_SAVED = """awk -v hits="$HITS" '
+  function seconds(stamp, t) {
+    split(substr(stamp, 13), t, ":")
+    return t[1] * 3600 + t[2] * 60 + t[3]
+  }
+  /^\\[/ {
+    pid = $2; sub(/\\]$/, "", pid)
+    now = seconds($1)
+    if ($0 !~ /Result: /) {
+      if (!(pid in start)) start[pid] = now
+      next
+    }
+    if (!(pid in start)) next
+    took = now - start[pid]
+    if (took < 0) took += 86400
+    delete start[pid]
+    if ($0 ~ /hit/) { hit += took; hits_timed++ }
+    else if ($0 ~ /miss/) { miss += took; misses_timed++ }
+  }
+  END {
+    saved = 0
+    if (hits_timed && misses_timed)
+      saved = hits * (miss / misses_timed - hit / hits_timed)
+    print (saved > 0 ? int(saved) : 0)
+  }' "${CCACHE_LOGFILE:-/dev/null}\""""
+
+STATS_FILE = 'ccache-stats.json'
+
+
+def publish_stats(identifier, start, extra=()):
+  # Shell lines that expect HITS, MISSES, SIZE_KIB and SAVED (compile
+  # seconds the hits saved) to be set, and the build start time in the
+  # environment variable start. They publish the counters as step outputs
+  # and write STATS_FILE; extra adds (key, JSON value) pairs to it.
+  fields = [
+      ('identifier', '"{}"'.format(identifier or '${GITHUB_JOB}')),
+      ('ref', '"${GITHUB_REF}"'),
+      ('sha', '"${GITHUB_SHA}"'),
+      ('run_id', '"${GITHUB_RUN_ID}"'),
+      ('time', '$NOW'),
+      ('hits', '$HITS'),
+      ('misses', '$MISSES'),
+      ('size_kib', '$SIZE_KIB'),
+      ('elapsed_seconds', '$ELAPSED'),
+      ('saved_seconds', '$SAVED'),
+  ] + list(extra)
+  return [
+      'NOW=$(date +%s)',
+      'ELAPSED=$((NOW - ${%s:-$NOW}))' % start,
+      'echo "::set-output name=hits::$HITS"',
+      'echo "::set-output name=misses::$MISSES"',
+      'echo "::set-output name=size_kib::$SIZE_KIB"',
+      'echo "::set-output name=saved_seconds::$SAVED"',
+      'cat > {} << EOF'.format(STATS_FILE),
+      '{',
+      ',\n'.join('  "{}": {}'.format(key, value) for key, value in fields),
+      '}',
+      'EOF',
+  ]
+
+
 class CCacheEpilog(JobShellStep):
+  __slots__ = ()
 
-  def __init__(self):
+  def __init__(self, identifier=None):
+    # Besides printing the stats, exposes them as outputs of the step (id
+    # ccache_stats) and writes them to ccache-stats.json.
     commands = [
         'ccache -s # Print current cache stats',
-    ]
-    super().__init__(name="ccache epilog", run='\n'.join(commands))
+        'ccache --print-stats > ccache-stats.tsv 2> /dev/null ||',
+        '  {} > ccache-stats.tsv'.format(_STATS_FALLBACK),
+        'counter() {',
+        "  awk -v k=\"$1\" '$1 == k { v = $2 } END { print v + 0 }' \\",
+        '    ccache-stats.tsv',
+        '}',
+        'DIRECT=$(counter direct_cache_hit)',
+        'PREPROCESSED=$(counter preprocessed_cache_hit)',
+        'HITS=$((DIRECT + PREPROCESSED))',
+        'MISSES=$(counter cache_miss)',
+        'SIZE_KIB=$(counter cache_size_kibibyte)',
+        'SAVED=$({} 2> /dev/null || echo 0)'.format(_SAVED),
+    ] + publish_stats(identifier, 'CCACHE_BUILD_START', [
+        ('backend', '"ccache"'),
+        ('direct_hits', '$DIRECT'),
+        ('preprocessed_hits', '$PREPROCESSED'),
+        ('cleanups', '$(counter cleanups_performed)'),
+        ('files', '$(counter files_in_cache)'),
+        ('maxsize', '"${CCACHE_MAXSIZE}"'),
+        ('compress', '"${CCACHE_COMPRESS}"'),
+        ('compresslevel', '"${CCACHE_COMPRESSLEVEL}"'),
+    ])
+    super().__init__(name="ccache epilog",
+                     run='\n'.join(commands),
+                     id="ccache_stats",
+                     shell="bash")
+
+
+class CCacheStatsUpload(YAMLRenderable):
+  __slots__ = ()
+
+  def __init__(self, identifier):
+    self.fields = {
+        "name": "Upload ccache stats",
+        "uses": "actions/upload-artifact@v2",
+        "with": {
+            "name": "ccache-stats-{}".format(identifier),
+            "path": STATS_FILE,
+        },
+    }
@@ -0,0 +1,155 @@
+import json
+import os
+import re
+from collections import defaultdict, namedtuple
+
+from .ccache import STATS_FILE
+
+# Aggregates the ccache-stats.json files written by CCacheEpilog across runs
+# and flags CcacheEnv settings the numbers argue against.
+
+Trend = namedtuple('Trend', [
+    'identifier', 'runs', 'hit_rates', 'mean', 'first', 'last', 'slope',
+    'saved_seconds', 'size_kib', 'maxsize_kib', 'cleanups', 'compress',
+    'compresslevel', 'warnings'
+])
+
+_SIZE = re.compile(r'^\s*(\d+(?:\.\d+)?)\s*([kKMGT]?)(i?)B?\s*$')
+
+# Thresholds behind the warnings.
+FULL = 0.9  # the cache is effectively full above this share of maxsize
+SPARE = 0.25  # maxsize is oversized if the cache never passes this share
+LOW_HIT_RATE = 0.5
+HIGH_COMPRESSLEVEL = 9
+
+
+def parse_size(text):
+  # A ccache size setting in KiB. k, M, G and T are decimal, Ki, Mi, Gi and
+  # Ti binary, and a bare number is in gigabytes.
+  match = _SIZE.match(str(text or ''))
+  if match is None:
+    return None
+  value, unit, binary = match.groups()
+  power = 'KMGT'.index(unit.upper() or 'G') + 1
+  return float(value) * (1024 if binary else 1000)**power / 1024
+
+
+def load_stats(*paths):
+  # Reads stats files, or directories of downloaded artifacts holding them.
+  records = []
+  for path in paths:
+    if os.path.isdir(path):
+      fpaths = [
+          os.path.join(root, fname)
+          for root, _, fnames in os.walk(path)
+          for fname in sorted(fnames)
+          if fname == STATS_FILE
+      ]
+    else:
+      fpaths = [path]
+    for fpath in fpaths:
+      with open(fpath) as fp:
+        records.append(json.load(fp))
+  return records
+
+
+def _slope(values):
+  # Least-squares slope per run.
+  n = len(values)
+  if n < 2:
+    return 0.0
+  mean_x = (n - 1) / 2
+  mean_y = sum(values) / n
+  num = sum((x - mean_x) * (y - mean_y) for x, y in enumerate(values))
+  den = sum((x - mean_x)**2 for x in range(n))
+  return num / den
+
+
+def _as_int(value):
+  try:
+    return int(value)
+  except (TypeError, ValueError):
+    return None
+
+
+def warnings(trend):
+  found = []
+  usage = None
+  if trend.maxsize_kib:
+    usage = trend.size_kib / trend.maxsize_kib
+  if trend.cleanups:
+    found.append('maxsize too small: ccache evicted entries during {} of {} '
+                 'build(s)'.format(trend.cleanups, trend.runs))
+  elif usage is not None and usage >= FULL and trend.mean < LOW_HIT_RATE:
+    found.append('maxsize likely too small: cache at {:.0%} of maxsize with '
+                 'a {:.0%} hit rate'.format(usage, trend.mean))
+  if usage is not None and usage < SPARE and not trend.cleanups:
+    found.append('maxsize larger than needed: cache peaks at {:.0%} of '
+                 'maxsize, and every byte is re-uploaded to the GitHub '
+                 'cache'.format(usage))
+  level = _as_int(trend.compresslevel)
+  compressed = str(trend.compress).lower() in ('true', '1', 'yes')
+  if compressed and level is not None and level >= HIGH_COMPRESSLEVEL:
+    if usage is not None and usage < FULL:
+      found.append('compresslevel {} is aggressive while the cache uses '
+                   '{:.0%} of maxsize; a lower level compresses faster'.format(
+                       level, usage))
+  if not compressed and usage is not None and usage >= FULL:
+    found.append('compression is off and the cache is full')
+  return found
+
+
+def trends(records):
+  # Records of other backends (see compilercache) are kept apart from ccache
+  # ones with the same identifier.
+  by_identifier = defaultdict(list)
+  for record in records:
+    identifier = record.get('identifier') or '?'
+    backend = record.get('backend') or 'ccache'
+    if backend != 'ccache':
+      identifier = '{} ({})'.format(identifier, backend)
+    by_identifier[identifier].append(record)
+
+  result = []
+  for identifier, runs in sorted(by_identifier.items()):
+    runs.sort(key=lambda r: r.get('time') or 0)
+    rates = []
+    for run in runs:
+      total = run.get('hits', 0) + run.get('misses', 0)
+      if total:
+        rates.append(run.get('hits', 0) / total)
+    latest = runs[-1]
+    trend = Trend(identifier, len(runs), rates,
+                  sum(rates) / len(rates) if rates else 0.0,
+                  rates[0] if rates else 0.0, rates[-1] if rates else 0.0,
+                  _slope(rates), sum(r.get('saved_seconds', 0) for r in runs),
+                  max(r.get('size_kib', 0) for r in runs),
+                  parse_size(latest.get('maxsize')),
+                  sum(1 for r in runs if r.get('cleanups')),
+                  latest.get('compress'), latest.get('compresslevel'), [])
+    result.append(trend._replace(warnings=warnings(trend)))
+  return result
+
+
+def _sparkline(values):
+  bars = ' ▁▂▃▄▅▆▇█'
+  return ''.join(bars[min(int(v * (len(bars) - 1) + 0.5),
+                          len(bars) - 1)] for v in values)
+
+
+def describe(trend):
+  direction = 'flat'
+  if trend.slope > 0.01:
+    direction = 'improving'
+  elif trend.slope < -0.01:
+    direction = 'declining'
+  lines = [
+      '{}: {} run(s), hit rate {:.0%} -> {:.0%} (mean {:.0%}, {})'.format(
+          trend.identifier, trend.runs, trend.first, trend.last, trend.mean,
+          direction),
+      '  {}'.format(_sparkline(trend.hit_rates[-40:])),
+      '  {:.1f} min compile time saved, peak size {:.1f} MiB'.format(
+          trend.saved_seconds / 60, trend.size_kib / 1024),
+  ]
+  lines.extend('  warning: {}'.format(w) for w in trend.warnings)
+  return '\n'.join(lines)
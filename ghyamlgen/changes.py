@@ -0,0 +1,257 @@
+import json
+import re
+import subprocess
+
+from . import GitHubExpr
+from .expr import ExpressionError, parse_expression, uses_status
+from .gh import Checkout, Job, JobShellStep, needed
+from .graph import JobGraph
+
+# Skips jobs that a change cannot affect. A spec declares the paths each job
+# depends on, as GitHub filter patterns:
+#
+#   paths = {'ubuntu': ['src/**', '**/CMakeLists.txt'], 'docs': ['doc/**']}
+#
+# path_filters() turns the declaration into paths: filters on the workflow's
+# push and pull_request triggers, so nothing runs unless some job is
+# affected. gate_jobs() instead adds a job that diffs the change and outputs
+# per job whether it is affected, and makes each declared job need it and
+# run only if so. Jobs without a declaration always run.
+#
+# Patterns follow GitHub: * matches within a path segment, ** across
+# segments, ? and + repeat the preceding character, and a leading ! excludes
+# what earlier patterns matched; the last matching pattern wins.
+
+CHANGES_JOB = 'changes'
+ZERO_SHA = '0' * 40
+
+_DELIMITER = 'GHYAMLGEN_CHANGES_EOF'
+
+
+def translate(pattern):
+  # The regex matching the paths a filter pattern matches.
+  parts = []
+  i = 0
+  while i < len(pattern):
+    if pattern.startswith('**/', i):
+      parts.append('(?:.*/)?')
+      i += 3
+    elif pattern.startswith('**', i):
+      parts.append('.*')
+      i += 2
+    elif pattern[i] == '*':
+      parts.append('[^/]*')
+      i += 1
+    elif pattern[i] in '?+':
+      parts.append(pattern[i])
+      i += 1
+    elif pattern[i] == '[':
+      end = pattern.find(']', i + 1)
+      if end < 0:
+        parts.append(re.escape(pattern[i]))
+        i += 1
+      else:
+        parts.append(pattern[i:end + 1])
+        i = end + 1
+    else:
+      parts.append(re.escape(pattern[i]))
+      i += 1
+  return ''.join(parts)
+
+
+def compile_rules(patterns):
+  # [(regex, excluded)] in pattern order.
+  rules = []
+  for pattern in patterns:
+    excluded = pattern.startswith('!')
+    rules.append((translate(pattern[1:] if excluded else pattern), excluded))
+  return rules
+
+
+def matches(rules, path):
+  matched = False
+  for regex, excluded in rules:
+    if re.fullmatch(regex, path):
+      matched = not excluded
+  return matched
+
+
+def affected(paths, files):
+  # Declared jobs that any of files affects, in declaration order.
+  files = list(files)
+  return [
+      jobid for jobid, patterns in paths.items() if any(
+          matches(compile_rules(patterns), f) for f in files)
+  ]
+
+
+def _undeclared(workflow, paths, ignore=()):
+  jobs = workflow.fields.get('jobs') or {}
+  return [j for j in jobs if j not in paths and j not in ignore]
+
+
+def path_filters(workflow, paths):
+  # Workflow whose push and pull_request triggers only fire for changes to
+  # the paths of some job. Exclusions are dropped from the union, since one
+  # job's exclusion must not hide a path another job depends on; the filter
+  # may fire for a change no job depends on, but never misses one.
+  missing = _undeclared(workflow, paths)
+  if missing:
+    raise ValueError('no paths declared for job(s) {}'.format(
+        ', '.join(missing)))
+  union = []
+  for patterns in paths.values():
+    for pattern in patterns:
+      if not pattern.startswith('!') and pattern not in union:
+        union.append(pattern)
+  on = workflow.fields['on']
+  fields = {}
+  for event in ('push', 'pull_request'):
+    trigger = on.fields.get(event)
+    if trigger is not None:
+      fields[event] = {**trigger, 'paths': union}
+  return workflow.updated({'on': on.updated(fields)})
+
+
+class DetectChanges(JobShellStep):
+  __slots__ = ()
+
+  def __init__(self, paths, id='changes'):
+    # Jobs are affected by everything when there is no base to diff against:
+    # other events, the first push of a branch, or a force push whose old
+    # head was not fetched.
+    rules = {jobid: compile_rules(p) for jobid, p in paths.items()}
+    super().__init__(
+        name="Detect changed paths",
+        id=id,
+        shell="bash",
+        run='\n'.join([
+            'case "$GITHUB_EVENT_NAME" in',
+            '  pull_request) BASE="${{ github.event.pull_request.base.sha }}"'
+            ' ;;',
+            '  push) BASE="${{ github.event.before }}" ;;',
+            '  *) BASE= ;;',
+            'esac',
+            'ALL=1',
+            'if [ -n "$BASE" ] && [ "$BASE" != {} ] &&'.format(ZERO_SHA),
+            '  git cat-file -e "$BASE^{commit}" 2> /dev/null; then',
+            '  git diff --name-only "$BASE" "$GITHUB_SHA" > changed-files.txt',
+            '  ALL=0',
+            'fi',
+            'echo "Changed files:"',
+            'cat changed-files.txt 2> /dev/null ||',
+            '  echo "(nothing to diff against, every job runs)"',
+            "python3 - \"$ALL\" << '{}'".format(_DELIMITER),
+            'import json, re, sys',
+            'RULES = json.loads({!r})'.format(json.dumps(rules)),
+            'def matches(rules, path):',
+            '  matched = False',
+            '  for regex, excluded in rules:',
+            '    if re.fullmatch(regex, path):',
+            '      matched = not excluded',
+            '  return matched',
+            'files = []',
+            'if sys.argv[1] == "0":',
+            '  files = open("changed-files.txt").read().splitlines()',
+            'for job, rules in RULES.items():',
+            '  hit = sys.argv[1] != "0" or any(',
+            '      matches(rules, f) for f in files)',
+            '  print("{}: {}".format(job, "affected" if hit else "skipped"))',
+            '  print("::set-output name={}::{}".format(job, str(hit).lower()))',
+            _DELIMITER,
+        ]))
+
+
+class ChangesJob(Job):
+  # Keeps the declaration it was built from, so the jobs a diff would run
+  # can be computed from the workflow alone (see triggered()).
+  __slots__ = ('paths',)
+
+  def __init__(self, paths, id=CHANGES_JOB, runs_on='ubuntu-latest'):
+    self.paths = paths
+    step = 'detect'
+    super().__init__(
+        id=id,
+        name='Detect changes',
+        runs_on=runs_on,
+        outputs={
+            jobid: GitHubExpr('steps.{}.outputs.{}'.format(step, jobid))
+            for jobid in paths
+        },
+        steps=[
+            Checkout().updated({"with": {
+                "fetch-depth": 0
+            }}),
+            DetectChanges(paths, id=step),
+        ])
+
+
+def gate_jobs(workflow, paths, id=CHANGES_JOB, runs_on='ubuntu-latest'):
+  # Workflow that runs each declared job only when the change affects it.
+  # Jobs that need a skipped job are skipped too, as GitHub does unless
+  # their if: uses a status function.
+  jobs = workflow.fields.get('jobs') or {}
+  unknown = [j for j in paths if j not in jobs]
+  if unknown:
+    raise ValueError('paths declared for unknown job(s) {}'.format(
+        ', '.join(unknown)))
+  changes = ChangesJob(paths, id=id, runs_on=runs_on)
+  gated = {changes.id(): changes}
+  for jobid, job in jobs.items():
+    if jobid in paths:
+      gate = lambda _: "needs.{}.outputs.{} == 'true'".format(id, jobid)
+      job = job.updated({}).needs(changes, OpExpr=gate)
+    gated[jobid] = job
+  return workflow.updated({'jobs': gated})
+
+
+def changed_files(base, head='HEAD', cwd=None):
+  # Files changed on head since it forked from base, as a pull request from
+  # head into base would show them.
+  output = subprocess.check_output(
+      ['git', 'diff', '--name-only', '{}...{}'.format(base, head)],
+      cwd=cwd,
+      universal_newlines=True)
+  return output.splitlines()
+
+
+def triggered(workflow, files, event='push'):
+  # (whether event would start the workflow for files, the jobs that would
+  # run). Only paths: filters and a ChangesJob are taken into account; a job
+  # whose if: uses a status function is assumed to run.
+  files = list(files)
+  trigger = workflow.fields['on'].fields.get(event)
+  if trigger is None:
+    return False, []
+  if 'paths' in trigger:
+    rules = compile_rules(trigger['paths'])
+    if not any(matches(rules, f) for f in files):
+      return False, []
+
+  graph = JobGraph.from_workflow(workflow)
+  skipped = set()
+  for job in graph.jobs.values():
+    if isinstance(job, ChangesJob):
+      hit = set(affected(job.paths, files))
+      skipped.update(j for j in job.paths if j not in hit)
+  runs = []
+  for jobid in graph.topological_order():
+    job = graph.jobs[jobid]
+    blocked = set(needed(job)) & skipped and not _status_checked(job)
+    if jobid not in skipped and not blocked:
+      runs.append(jobid)
+    else:
+      skipped.add(jobid)
+  return True, runs
+
+
+def _status_checked(job):
+  # Whether the job's if: uses a status function, which makes GitHub run it
+  # even when a job it needs was skipped.
+  condition = job.fields.get('if')
+  if condition is None:
+    return False
+  try:
+    return uses_status(parse_expression(str(condition)))
+  except ExpressionError:
+    return False
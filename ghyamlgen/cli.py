@@ -0,0 +1,309 @@
+import argparse
+import sys
+import time
+
+from . import batch
+
+# Subcommands import what they need when they run, so that starting the CLI
+# only loads the render path.
+
+
+def cmd_render(args):
+  from . import profile
+  from .incremental import Manifest
+
+  start = time.perf_counter()
+  specs = batch.discover(args.specs)
+  manifest = None
+  if args.incremental:
+    manifest = Manifest(args.manifest)
+    if args.force:
+      manifest.entries = {}
+  profiler = profile.enable() if args.profile else None
+  results = list(
+      batch.render_all(specs, args.output_dir, args.jobs, manifest=manifest))
+  if manifest is not None:
+    manifest.save()
+  failed = batch.summarize(results, time.perf_counter() - start, sys.stderr)
+  if profiler is not None:
+    profile.disable()
+    profiler.report(sys.stderr)
+  return 1 if failed else 0
+
+
+def cmd_watch(args):
+  from .watch import Watch, make_watcher
+
+  watcher = make_watcher(poll=args.poll, interval=args.interval)
+  try:
+    Watch(args.specs, args.output_dir, watcher).run()
+  except KeyboardInterrupt:
+    pass
+  return 0
+
+
+def cmd_check(args):
+  from .expr import check_workflow
+
+  count = 0
+  for spec in batch.discover(args.specs):
+    workflows = batch.spec_workflows(batch.load_spec(spec))
+    for fname, workflow in workflows.items():
+      for problem in check_workflow(workflow):
+        count += 1
+        sys.stdout.write('{}:{}: {} ({})\n'.format(spec, fname, problem.message,
+                                                   problem.location))
+  return 1 if count else 0
+
+
+def cmd_graph(args):
+  from . import timing
+  from .graph import GraphError, JobGraph, report
+  from .planner import CostModel, job_duration
+
+  failed = 0
+  model = CostModel()
+  if args.durations:
+    database = timing.load_database(args.durations)
+    model = CostModel(durations=timing.durations(database))
+  for spec in batch.discover(args.specs):
+    workflows = batch.spec_workflows(batch.load_spec(spec))
+    for fname, workflow in workflows.items():
+      sys.stdout.write('{}:{}\n'.format(spec, fname))
+      graph = JobGraph.from_workflow(workflow)
+      try:
+        graph.validate()
+      except GraphError as e:
+        failed += 1
+        sys.stdout.write('  {}\n'.format(e))
+        continue
+      critical = graph.critical_path(lambda job: job_duration(job, model))
+      report(graph, critical, sys.stdout)
+  return 1 if failed else 0
+
+
+def cmd_changes(args):
+  from . import changes
+
+  files = args.files
+  if files is None:
+    files = changes.changed_files(args.base, args.head)
+  for spec in batch.discover(args.specs):
+    workflows = batch.spec_workflows(batch.load_spec(spec))
+    for fname, workflow in workflows.items():
+      started, runs = changes.triggered(workflow, files, args.event)
+      sys.stdout.write('{}:{}\n'.format(spec, fname))
+      if not started:
+        sys.stdout.write('  not triggered\n')
+        continue
+      jobs = workflow.fields.get('jobs') or {}
+      sys.stdout.write('  runs: {}\n'.format(', '.join(runs) or '-'))
+      skipped = [j for j in jobs if j not in runs]
+      sys.stdout.write('  skips: {}\n'.format(', '.join(skipped) or '-'))
+  return 0
+
+
+def cmd_composites(args):
+  from . import composite
+
+  for spec in batch.discover(args.specs):
+    workflows = batch.spec_workflows(batch.load_spec(spec))
+    for fname, workflow in workflows.items():
+      _, actions, report = composite.extract_composites(
+          workflow, min_length=args.min_length)
+      sys.stdout.write('{}:{}\n'.format(spec, fname))
+      for line in composite.describe(report).splitlines():
+        sys.stdout.write('  {}\n'.format(line))
+      for name, action in actions.items():
+        sys.stdout.write('  {}: {}\n'.format(name,
+                                             action.fields['description']))
+  return 0
+
+
+def cmd_cachesim(args):
+  from . import cachesim
+
+  history = cachesim.load_history(args.history)
+  schemes = args.scheme or [','.join(cachesim.DEFAULT_SCHEME)]
+  for text in schemes:
+    keys = [key.strip() for key in text.split(',') if key.strip()]
+    key, restore_keys = cachesim.scheme_from_keys(keys)
+    report = cachesim.simulate(history,
+                               key,
+                               restore_keys,
+                               limit=args.limit_gb * cachesim.GB,
+                               default_branch=args.default_branch,
+                               size=args.size_mb * cachesim.MB,
+                               name=text)
+    sys.stdout.write(cachesim.describe(report) + '\n')
+  return 0
+
+
+def cmd_ccache_stats(args):
+  from . import ccstats
+
+  trends = ccstats.trends(ccstats.load_stats(*args.paths))
+  for trend in trends:
+    sys.stdout.write(ccstats.describe(trend) + '\n')
+  return 1 if args.strict and any(t.warnings for t in trends) else 0
+
+
+def cmd_timings(args):
+  from . import timing
+
+  database = timing.load_database(args.database)
+  added = timing.merge(database, timing.load_records(*args.paths))
+  timing.save_database(args.database, database)
+  sys.stdout.write('merged {} new record(s) into {}\n'.format(
+      added, args.database))
+  sys.stdout.write(timing.describe(database) + '\n')
+  return 0
+
+
+def build_parser():
+  parser = argparse.ArgumentParser(
+      prog='ghyamlgen', description='Generate GitHub workflow YAML from specs')
+  commands = parser.add_subparsers(dest='command', required=True)
+
+  render = commands.add_parser(
+      'render', help='Render workflow spec modules to YAML, in parallel')
+  render.add_argument('specs',
+                      nargs='+',
+                      help='Spec modules, or directories containing them')
+  render.add_argument('-o',
+                      '--output-dir',
+                      default=None,
+                      help='Write outputs here instead of next to each spec')
+  render.add_argument('-j',
+                      '--jobs',
+                      type=int,
+                      default=None,
+                      help='Worker processes (default: one per CPU)')
+  render.add_argument('-i',
+                      '--incremental',
+                      action='store_true',
+                      help='Only re-render specs whose inputs changed')
+  render.add_argument('--manifest',
+                      default='.ghyamlgen-manifest.json',
+                      help='Dependency manifest used by --incremental')
+  render.add_argument('--force',
+                      action='store_true',
+                      help='Ignore the manifest and re-render everything')
+  render.add_argument('--profile',
+                      action='store_true',
+                      help='Report where rendering time goes')
+  render.set_defaults(func=cmd_render)
+
+  check = commands.add_parser(
+      'check', help='Parse and type-check every expression in the specs')
+  check.add_argument('specs',
+                     nargs='+',
+                     help='Spec modules, or directories containing them')
+  check.set_defaults(func=cmd_check)
+
+  graph = commands.add_parser(
+      'graph', help='Show job stages and the critical path of each workflow')
+  graph.add_argument('specs',
+                     nargs='+',
+                     help='Spec modules, or directories containing them')
+  graph.add_argument('--durations',
+                     default=None,
+                     help='Duration database written by `ghyamlgen timings`')
+  graph.set_defaults(func=cmd_graph)
+
+  diff = commands.add_parser(
+      'changes', help='Show the jobs a change would run under path filters')
+  diff.add_argument('specs',
+                    nargs='+',
+                    help='Spec modules, or directories containing them')
+  diff.add_argument('--base',
+                    default='origin/main',
+                    help='Diff against where HEAD forked from this ref')
+  diff.add_argument('--head', default='HEAD')
+  diff.add_argument('--files',
+                    nargs='*',
+                    default=None,
+                    help='Changed files, instead of a git diff')
+  diff.add_argument('--event', default='push', choices=('push', 'pull_request'))
+  diff.set_defaults(func=cmd_changes)
+
+  composites = commands.add_parser(
+      'composites',
+      help='Report step sequences that composite actions would factor out')
+  composites.add_argument('specs',
+                          nargs='+',
+                          help='Spec modules, or directories containing them')
+  composites.add_argument('--min-length',
+                          type=int,
+                          default=2,
+                          help='Shortest sequence to extract, in steps')
+  composites.set_defaults(func=cmd_composites)
+
+  sim = commands.add_parser(
+      'cachesim', help='Replay a run history against GHCache key schemes')
+  sim.add_argument('history', help='JSON lines of recorded runs')
+  sim.add_argument('--scheme',
+                   action='append',
+                   help='Comma-separated key expressions; may be repeated')
+  sim.add_argument('--limit-gb',
+                   type=float,
+                   default=10,
+                   help='Repository cache size limit')
+  sim.add_argument('--size-mb',
+                   type=float,
+                   default=200,
+                   help='Entry size for runs that do not record one')
+  sim.add_argument('--default-branch', default='refs/heads/main')
+  sim.set_defaults(func=cmd_cachesim)
+
+  stats = commands.add_parser(
+      'ccache-stats',
+      help='Report ccache hit-rate trends from ccache-stats.json artifacts')
+  stats.add_argument('paths',
+                     nargs='+',
+                     help='Stats files, or directories containing them')
+  stats.add_argument('--strict',
+                     action='store_true',
+                     help='Exit with 1 if any configuration is flagged')
+  stats.set_defaults(func=cmd_ccache_stats)
+
+  timings = commands.add_parser(
+      'timings',
+      help='Merge step-timings.json artifacts into a duration database')
+  timings.add_argument('paths',
+                       nargs='+',
+                       help='Timing files, or directories containing them')
+  timings.add_argument('-d',
+                       '--database',
+                       default='step-durations.json',
+                       help='Database to create or update')
+  timings.set_defaults(func=cmd_timings)
+
+  watch = commands.add_parser(
+      'watch', help='Keep running and re-render outputs when inputs change')
+  watch.add_argument('specs',
+                     nargs='+',
+                     help='Spec modules, or directories containing them')
+  watch.add_argument('-o',
+                     '--output-dir',
+                     default=None,
+                     help='Write outputs here instead of next to each spec')
+  watch.add_argument('--poll',
+                     action='store_true',
+                     help='Poll file stamps instead of using inotify')
+  watch.add_argument('--interval',
+                     type=float,
+                     default=0.1,
+                     help='Polling interval in seconds')
+  watch.set_defaults(func=cmd_watch)
+
+  return parser
+
+
+def main(argv=None):
+  args = build_parser().parse_args(argv)
+  return args.func(args)
+
+
+if __name__ == '__main__':
+  sys.exit(main())
@@ -0,0 +1,329 @@
+from . import GitHubExpr, GitHubMapping, Group, YAMLRenderable
+from .ccache import (CCacheEpilog, CCacheProlog, CCacheStatsUpload, CcacheEnv,
+                     CcacheVars, publish_stats)
+from .gh import Checkout, GHCache, Job, JobShellStep, Workflow, On
+
+# Compiler-cache backends. Each one knows the steps it needs around a build:
+# environment, setup (install, restore), prolog, epilog (stats, written to
+# the same ccache-stats.json schema whatever the backend) and persistence.
+# wrap(build) puts them together in that order.
+
+
+class ExportEnv(JobShellStep):
+  __slots__ = ()
+
+  def __init__(self, name, env):
+    commands = [
+        'echo "{}={}" >> $GITHUB_ENV'.format(key, value)
+        for key, value in env.items()
+        if value is not None
+    ]
+    super().__init__(name=name, run='\n'.join(commands))
+
+
+class CompilerCache:
+  name = None
+  launcher = None
+
+  def env(self):
+    return {}
+
+  def setup(self):
+    return []
+
+  def prolog(self):
+    return []
+
+  def epilog(self):
+    return []
+
+  def persist(self):
+    return []
+
+  def services(self):
+    return None
+
+  def launcher_env(self):
+    # CMake (>= 3.17) picks the launcher up from these variables.
+    return {
+        'CMAKE_C_COMPILER_LAUNCHER': self.launcher,
+        'CMAKE_CXX_COMPILER_LAUNCHER': self.launcher,
+    }
+
+  def wrap(self, build):
+    return Group(self.setup(), self.prolog(), build, self.epilog(),
+                 self.persist())
+
+
+class Ccache(CompilerCache):
+  # ccache, persisted through the actions cache. config is the dict the
+  # bergamot spec builds: compilercheck, basedir, dir, compress,
+  # compresslevel, maxsize, keys and is_command.
+  name = 'ccache'
+  launcher = 'ccache'
+
+  def __init__(self, config, identifier=None):
+    self.config = config
+    self.identifier = identifier
+
+  def setup(self):
+    return [
+        CcacheVars(self.config["compilercheck"],
+                   cmd=self.config.get("is_command", False)),
+        GHCache(self.config["keys"], self.config["dir"]),
+        CcacheEnv(self.config),
+    ]
+
+  def prolog(self):
+    return [CCacheProlog()]
+
+  def epilog(self):
+    steps = [CCacheEpilog(self.identifier)]
+    if self.identifier is not None:
+      steps.append(CCacheStatsUpload(self.identifier))
+    return steps
+
+
+class CcacheHTTP(Ccache):
+  # ccache (>= 4.4) backed by a remote HTTP cache such as a bazel-remote or
+  # nginx WebDAV server, instead of the actions cache.
+  name = 'ccache-http'
+
+  def __init__(self, config, url, identifier=None, remote_only=False):
+    super().__init__(config, identifier)
+    self.url = url
+    self.remote_only = remote_only
+
+  def env(self):
+    return {
+        'CCACHE_REMOTE_STORAGE': self.url,
+        'CCACHE_REMOTE_ONLY': 'true' if self.remote_only else None,
+    }
+
+  def setup(self):
+    return [
+        CcacheEnv(self.config),
+        ExportEnv('ccache remote storage', self.env()),
+    ]
+
+
+class LocalDisk:
+  name = 'disk'
+
+  def __init__(self, directory, size='10G', keys=None):
+    self.directory = directory
+    self.size = size
+    self.keys = keys or [
+        GitHubExpr(GitHubMapping('job', context='github')),
+        GitHubExpr(GitHubMapping('ref', context='github')),
+        GitHubExpr(GitHubMapping('sha', context='github')),
+    ]
+
+  def env(self):
+    return {'SCCACHE_DIR': self.directory, 'SCCACHE_CACHE_SIZE': self.size}
+
+  def persist(self):
+    return [GHCache(self.keys, self.directory, tool='sccache')]
+
+
+class S3:
+  # Any S3-compatible store. Credentials are read from the named secrets.
+  name = 's3'
+
+  def __init__(self,
+               bucket,
+               endpoint=None,
+               region='us-east-1',
+               prefix=None,
+               use_ssl=True,
+               access_key_secret='SCCACHE_AWS_ACCESS_KEY_ID',
+               secret_key_secret='SCCACHE_AWS_SECRET_ACCESS_KEY'):
+    self.bucket = bucket
+    self.endpoint = endpoint
+    self.region = region
+    self.prefix = prefix
+    self.use_ssl = use_ssl
+    self.access_key_secret = access_key_secret
+    self.secret_key_secret = secret_key_secret
+    self.service = None
+
+  @classmethod
+  def standin(cls, bucket='sccache', port=9000):
+    # A MinIO service container on the runner (Linux only) in place of the
+    # real store, for comparing backends without cloud credentials. Locally,
+    # `python -m ghyamlgen.s3local` serves the same role.
+    store = cls(bucket,
+                endpoint='http://localhost:{}'.format(port),
+                use_ssl=False,
+                access_key_secret=None,
+                secret_key_secret=None)
+    store.service = {
+        "image": "bitnami/minio:latest",
+        "ports": ['{}:9000'.format(port)],
+        "env": {
+            "MINIO_ROOT_USER": 'standin',
+            "MINIO_ROOT_PASSWORD": 'standin-secret',
+            "MINIO_DEFAULT_BUCKETS": bucket,
+        },
+    }
+    return store
+
+  def env(self):
+    secret = lambda name: GitHubExpr(GitHubMapping(name, context='secrets'))
+    env = {
+        'SCCACHE_BUCKET': self.bucket,
+        'SCCACHE_ENDPOINT': self.endpoint,
+        'SCCACHE_REGION': self.region,
+        'SCCACHE_S3_KEY_PREFIX': self.prefix,
+        'SCCACHE_S3_USE_SSL': 'true' if self.use_ssl else 'false',
+    }
+    if self.service is not None:
+      env['AWS_ACCESS_KEY_ID'] = self.service["env"]["MINIO_ROOT_USER"]
+      env['AWS_SECRET_ACCESS_KEY'] = self.service["env"]["MINIO_ROOT_PASSWORD"]
+    elif self.access_key_secret is not None:
+      env['AWS_ACCESS_KEY_ID'] = secret(self.access_key_secret)
+      env['AWS_SECRET_ACCESS_KEY'] = secret(self.secret_key_secret)
+    return env
+
+  def persist(self):
+    return []
+
+
+class SccacheInstall(YAMLRenderable):
+  __slots__ = ()
+
+  def __init__(self, version=None):
+    self.fields = {
+        "name": "Install sccache",
+        "uses": "mozilla-actions/sccache-action@v0.0.3",
+        "with": {
+            "version": version
+        } if version else None,
+    }
+
+
+class Sccache(CompilerCache):
+  launcher = 'sccache'
+
+  def __init__(self, storage, identifier=None, version=None):
+    self.storage = storage
+    self.identifier = identifier
+    self.version = version
+    self.name = 'sccache-{}'.format(storage.name)
+
+  def env(self):
+    return self.storage.env()
+
+  def services(self):
+    service = getattr(self.storage, 'service', None)
+    return {'s3': service} if service else None
+
+  def setup(self):
+    steps = [SccacheInstall(self.version)]
+    if isinstance(self.storage, LocalDisk):
+      # Restore before the server starts; the actions cache saves the
+      # directory again in its post step.
+      steps.extend(self.storage.persist())
+    steps.append(ExportEnv('sccache environment setup', self.env()))
+    return steps
+
+  def prolog(self):
+    commands = [
+        'sccache --start-server',
+        'sccache --zero-stats',
+        'echo "SCCACHE_BUILD_START=$(date +%s)" >> $GITHUB_ENV',
+    ]
+    return [JobShellStep(name="sccache prolog", run='\n'.join(commands))]
+
+  def epilog(self):
+    # sccache counts hits and misses per language.
+    count = "jq '[.stats.{}.counts[]] | add // 0' sccache-stats.raw.json"
+    commands = [
+        'sccache --show-stats',
+        'sccache --show-stats --stats-format=json > sccache-stats.raw.json',
+        'HITS=$({})'.format(count.format('cache_hits')),
+        'MISSES=$({})'.format(count.format('cache_misses')),
+        "SIZE_KIB=$(jq '(.cache_size // 0) / 1024 | floor'"
+        " sccache-stats.raw.json)",
+        # Hits times the mean compile time less the mean time of a hit.
+        "SAVED=$(jq --argjson hits \"$HITS\" '"
+        "def seconds(d): (d.secs // 0) + (d.nanos // 0) / 1e9;"
+        " .stats as $s | if $hits > 0 and ($s.compilations // 0) > 0"
+        " then [$hits * (seconds($s.compiler_write_duration) / $s.compilations"
+        " - seconds($s.cache_read_hit_duration) / $hits), 0] | max | floor"
+        " else 0 end' sccache-stats.raw.json)",
+    ] + publish_stats(self.identifier, 'SCCACHE_BUILD_START', [
+        ('backend', '"sccache"'),
+        ('maxsize', '"${SCCACHE_CACHE_SIZE}"'),
+    ]) + ['sccache --stop-server']
+    steps = [
+        JobShellStep(name="sccache epilog",
+                     run='\n'.join(commands),
+                     id="sccache_stats",
+                     shell="bash")
+    ]
+    if self.identifier is not None:
+      steps.append(CCacheStatsUpload(self.identifier))
+    return steps
+
+
+def _timed(name, command, id):
+  return JobShellStep(name=name,
+                      run='\n'.join([
+                          'START=$(date +%s)',
+                          command,
+                          'echo "::set-output name=seconds::'
+                          '$(($(date +%s) - START))"',
+                      ]),
+                      id=id,
+                      shell='bash')
+
+
+def comparison_workflow(backends,
+                        configure,
+                        build,
+                        clean='rm -rf build',
+                        setup=(),
+                        runs_on='ubuntu-latest'):
+  # One job per backend that builds twice and reports both timings in the
+  # job summary: first with whatever the backend restored, then again after
+  # clean, against the cache the first build filled. configure and build are
+  # shell commands; configure must pick up the launcher from
+  # CMAKE_<LANG>_COMPILER_LAUNCHER.
+  jobs = {}
+  for backend in backends:
+    jobid = 'compare_{}'.format(backend.name.replace('-', '_'))
+    if jobid in jobs:
+      raise ValueError('backend {} given twice'.format(backend.name))
+    seconds = lambda id: GitHubExpr('steps.{}.outputs.seconds'.format(id))
+    launcher = ExportEnv('Use {} as compiler launcher'.format(backend.name),
+                         backend.launcher_env())
+    report = [
+        '| backend | build | rebuild |',
+        '| --- | --- | --- |',
+        '| {} | {}s | {}s |'.format(backend.name, seconds('build'),
+                                    seconds('rebuild')),
+    ]
+    steps = [
+        Checkout(),
+        list(setup),
+        launcher,
+        backend.wrap([
+            _timed('Build', '{}\n{}'.format(configure, build), 'build'),
+            JobShellStep(name='Clean build tree', run=clean),
+            _timed('Rebuild', '{}\n{}'.format(configure, build), 'rebuild'),
+        ]),
+        JobShellStep(name='Report build times',
+                     run='\n'.join(
+                         'echo "{}" >> $GITHUB_STEP_SUMMARY'.format(line)
+                         for line in report)),
+    ]
+    job = Job(id=jobid,
+              name='Build with {}'.format(backend.name),
+              runs_on=runs_on,
+              services=backend.services(),
+              steps=Group(*steps))
+    jobs[jobid] = job
+  return Workflow(name='compiler-cache comparison',
+                  on=On(workflow_dispatch={}),
+                  jobs=jobs)
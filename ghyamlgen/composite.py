@@ -0,0 +1,364 @@
+import hashlib
+import json
+import re
+from collections import defaultdict, namedtuple
+
+from . import Snippet, YAMLRenderable, resolve
+from .emit import render
+from .expr import ExpressionError, parse, parse_expression, references, uses_status
+
+# Factors step sequences repeated across jobs into local composite actions.
+# Steps match when they have the same shape: the same keys, the same name,
+# uses, shell and id, and values anywhere else may differ. Candidate
+# sequences are found by hashing every run of matching steps; the one that
+# saves the most bytes is extracted first, and the search repeats until
+# nothing left is worth extracting.
+#
+# Values that differ between occurrences become inputs of the action, as do
+# expressions a composite action cannot evaluate itself (matrix, needs,
+# secrets, ... and outputs of steps outside the sequence). Steps that cannot
+# move into a composite action end every sequence: checkout (the action is
+# read from the checked-out repository), status functions in if:, and
+# continue-on-error or timeout-minutes.
+
+ExtractionReport = namedtuple('ExtractionReport', [
+    'actions', 'occurrences', 'steps_before', 'steps_after', 'bytes_before',
+    'bytes_after', 'action_bytes'
+])
+
+# Contexts a composite action sees as the calling job does.
+VISIBLE = frozenset(['github', 'env', 'runner', 'inputs'])
+
+_EXPRESSION = re.compile(r'\$\{\{(.*?)\}\}', re.DOTALL)
+_SHAPE_KEYS = ('name', 'uses', 'shell', 'id')
+_UNSUPPORTED = ('continue-on-error', 'timeout-minutes')
+# Composite steps must name their shell; this one is the job default.
+_DEFAULT_SHELL = 'bash -e {0}'
+
+
+class CompositeAction(YAMLRenderable):
+  __slots__ = ()
+
+  def __init__(self, name, description, inputs, steps):
+    self.fields = {
+        "name": name,
+        "description": description,
+        "inputs": {
+            key: {
+                "description": text,
+                "required": True
+            } for key, text in inputs.items()
+        } or None,
+        "runs": {
+            "using": "composite",
+            "steps": steps,
+        },
+    }
+
+
+class UseAction(YAMLRenderable):
+  __slots__ = ()
+
+  def __init__(self, name, uses, with_=None):
+    self.fields = {
+        "name": name,
+        "uses": uses,
+        "with": with_ or None,
+    }
+
+
+def _shape(value, key=None):
+  if isinstance(value, dict):
+    return {k: _shape(v, k) for k, v in value.items()}
+  if isinstance(value, list):
+    return [_shape(v) for v in value]
+  return value if key in _SHAPE_KEYS else None
+
+
+def _signature(step):
+  return json.dumps(_shape(step), sort_keys=True)
+
+
+def _movable(step):
+  if any(key in step for key in _UNSUPPORTED):
+    return False
+  if str(step.get('uses', '')).startswith('actions/checkout'):
+    return False
+  if step.get('shell') not in (None, 'bash', 'sh'):
+    return False
+  condition = step.get('if')
+  if condition is not None:
+    try:
+      if uses_status(parse_expression(str(condition))):
+        return False
+    except ExpressionError:
+      return False
+  return True
+
+
+def _visible(text, ids):
+  # Whether the expression only refers to what the action can see.
+  try:
+    node = parse(text)
+  except ExpressionError:
+    return False
+  for path in references(node):
+    if path[0] == 'steps' and len(path) > 1 and path[1] in ids:
+      continue
+    if path[0] not in VISIBLE:
+      return False
+  return True
+
+
+def _slug(text, limit=40):
+  slug = re.sub(r'\W+', '_', text).strip('_').lower() or 'value'
+  if len(slug) > limit:
+    digest = hashlib.sha1(text.encode()).hexdigest()[:6]
+    slug = '{}_{}'.format(slug[:limit - 7], digest)
+  return slug
+
+
+def _string(text):
+  return Snippet(text) if '\n' in text else text
+
+
+class _Template:
+  # Builds the action's steps and inputs from the occurrences of one
+  # sequence, and the with: of each call.
+
+  def __init__(self, count):
+    self.inputs = {}
+    self.calls = [{} for _ in range(count)]
+
+  def _input(self, name, description, values):
+    name = _slug(name)
+    while name in self.inputs and [c.get(name) for c in self.calls] != values:
+      name = _slug(name + '_')
+    self.inputs[name] = description
+    for call, value in zip(self.calls, values):
+      call[name] = value
+    return name
+
+  def _lift(self, text, ids):
+    # Replaces the expressions in text that the action cannot evaluate.
+    def replace(match):
+      if _visible(match.group(1), ids):
+        return match.group(0)
+      expression = match.group(1).strip()
+      name = self._input(expression, 'Value of {}'.format(expression),
+                         [match.group(0)] * len(self.calls))
+      return '${{{{ inputs.{} }}}}'.format(name)
+
+    return _EXPRESSION.sub(replace, text)
+
+  def condition(self, values, ids, where):
+    bare = [
+        str(v).strip()[3:-2].strip()
+        if str(v).strip().startswith('${{') else str(v) for v in values
+    ]
+    if len(set(bare)) == 1 and _visible(bare[0], ids):
+      return values[0]
+    name = self._input('{}_if'.format(where), 'Whether {} runs'.format(where),
+                       ['${{{{ {} }}}}'.format(b) for b in bare])
+    return "inputs.{} == 'true'".format(name)
+
+  def value(self, values, ids, where):
+    if isinstance(values[0], dict):
+      return {
+          k: self.value([v[k] for v in values], ids, '{}_{}'.format(where, k))
+          for k in values[0]
+      }
+    if isinstance(values[0], list):
+      return [
+          self.value([v[i]
+                      for v in values], ids, '{}_{}'.format(where, i))
+          for i in range(len(values[0]))
+      ]
+    lifted = [self._lift(v, ids) if isinstance(v, str) else v for v in values]
+    if all(v == lifted[0] for v in lifted):
+      return _string(lifted[0]) if isinstance(lifted[0], str) else lifted[0]
+    name = self._input(where, 'Value of {} at the call site'.format(where),
+                       [_string(str(v)) for v in values])
+    return '${{{{ inputs.{} }}}}'.format(name)
+
+  def step(self, variants, ids, number):
+    step = {}
+    where = 'step{}'.format(number)
+    for key in variants[0]:
+      values = [v[key] for v in variants]
+      if key in _SHAPE_KEYS:
+        step[key] = values[0]
+      elif key == 'if':
+        step[key] = self.condition(values, ids, where)
+      else:
+        step[key] = self.value(values, ids,
+                               '{}_{}'.format(where, key.replace('-', '_')))
+    if 'run' in step and 'shell' not in step:
+      step['shell'] = _DEFAULT_SHELL
+    return step
+
+
+def _build(occurrences):
+  template = _Template(len(occurrences))
+  steps = []
+  ids = set()
+  for number, variants in enumerate(zip(*occurrences)):
+    steps.append(template.step(list(variants), ids, number))
+    if variants[0].get('id'):
+      ids.add(variants[0]['id'])
+  return steps, template.inputs, template.calls
+
+
+def _size(node):
+  return len(render(node).encode())
+
+
+class _Job:
+
+  def __init__(self, jobid, job):
+    self.id = jobid
+    self.job = job
+    self.steps = resolve(job.fields.get('steps')) or []
+    # Steps before the first checkout cannot use a local action.
+    checkout = next((i for i, s in enumerate(self.steps)
+                     if str(s.get('uses', '')).startswith('actions/checkout')),
+                    None)
+    self.signatures = [
+        _signature(s)
+        if checkout is not None and i > checkout and _movable(s) else None
+        for i, s in enumerate(self.steps)
+    ]
+
+  def outside(self, start, stop):
+    # Text of everything in the job but steps[start:stop], for finding
+    # references into the sequence.
+    fields = {k: v for k, v in self.job.fields.items() if k != 'steps'}
+    rest = self.steps[:start] + self.steps[stop:]
+    return json.dumps([resolve(fields), rest], default=str)
+
+
+def _candidates(jobs, min_length):
+  found = defaultdict(list)
+  for job in jobs:
+    signatures = job.signatures
+    for start in range(len(signatures)):
+      for stop in range(start + 1, len(signatures) + 1):
+        if signatures[stop - 1] is None:
+          break
+        if stop - start >= min_length:
+          found[tuple(signatures[start:stop])].append((job, start, stop))
+  return found
+
+
+def _occurrences(places):
+  # Non-overlapping places whose step ids are not referenced from outside.
+  chosen = []
+  for job, start, stop in places:
+    if any(j is job and start < b and a < stop for j, a, b in chosen):
+      continue
+    ids = [s['id'] for s in job.steps[start:stop] if s.get('id')]
+    outside = job.outside(start, stop) if ids else ''
+    if any(
+        re.search(r'\bsteps\.{}\b'.format(re.escape(i)), outside) for i in ids):
+      continue
+    chosen.append((job, start, stop))
+  return chosen
+
+
+def _action_name(steps, inputs):
+  first = re.sub(r'[^a-z0-9]+', '-',
+                 str(steps[0].get('name') or 'steps').lower())
+  digest = hashlib.sha1(
+      json.dumps([steps, sorted(inputs)], sort_keys=True,
+                 default=str).encode()).hexdigest()[:6]
+  return '{}-{}'.format(first[:24].strip('-'), digest)
+
+
+def _best(jobs, min_length, directory):
+  best = None
+  for places in _candidates(jobs, min_length).values():
+    occurrences = _occurrences(places)
+    if len(occurrences) < 2:
+      continue
+    sequences = [job.steps[start:stop] for job, start, stop in occurrences]
+    steps, inputs, calls = _build(sequences)
+    name = _action_name(steps, inputs)
+    description = 'Steps: {}'.format(', '.join(
+        str(s.get('name') or s.get('uses') or '?') for s in steps))
+    action = CompositeAction(name, description, inputs, steps)
+    uses = './{}/{}'.format(directory.strip('/'), name)
+    replacements = [UseAction(name, uses, call) for call in calls]
+    saved = (sum(_size(s) for s in sequences) -
+             sum(_size([r]) for r in replacements) - _size(action))
+    if saved > 0 and (best is None or saved > best[0]):
+      best = (saved, name, action, occurrences, replacements)
+  return best
+
+
+def extract_composites(workflow, directory='.github/actions', min_length=2):
+  # Returns the rewritten workflow, the actions by name (to be written to
+  # <directory>/<name>/action.yml, see action_files()) and a report.
+  jobs = [
+      _Job(jobid, job)
+      for jobid, job in (workflow.fields.get('jobs') or {}).items()
+  ]
+  steps_before = sum(len(job.steps) for job in jobs)
+  bytes_before = _size(workflow)
+  actions = {}
+  occurrences = 0
+  while True:
+    best = _best(jobs, min_length, directory)
+    if best is None:
+      break
+    _, name, action, places, replacements = best
+    actions[name] = action
+    occurrences += len(places)
+    # Replace from the back so earlier positions stay valid.
+    order = sorted(zip(places, replacements), key=lambda p: -p[0][1])
+    for (job, start, stop), replacement in order:
+      job.steps[start:stop] = [resolve(replacement)]
+      job.signatures[start:stop] = [None]
+
+  rewritten = workflow.updated({
+      'jobs': {
+          job.id: job.job.updated({'steps': [_restore(s) for s in job.steps]})
+          for job in jobs
+      }
+  })
+  return rewritten, actions, ExtractionReport(
+      len(actions), occurrences, steps_before,
+      sum(len(job.steps) for job in jobs), bytes_before, _size(rewritten),
+      sum(_size(a) for a in actions.values()))
+
+
+def _restore(value):
+  # Resolved steps render like the originals once multi-line strings are
+  # block scalars again.
+  if isinstance(value, dict):
+    return {k: _restore(v) for k, v in value.items()}
+  if isinstance(value, list):
+    return [_restore(v) for v in value]
+  if isinstance(value, str):
+    return _string(value)
+  return value
+
+
+def action_files(actions, prefix='../actions'):
+  # Output entries for a spec's workflows(), relative to the workflows
+  # directory (.github/workflows renders them into .github/actions).
+  return {
+      '{}/{}/action.yml'.format(prefix, name): action
+      for name, action in actions.items()
+  }
+
+
+def describe(report):
+  saved = report.bytes_before - report.bytes_after - report.action_bytes
+  return '\n'.join([
+      '{} action(s) replacing {} sequence(s): {} -> {} steps'.format(
+          report.actions, report.occurrences, report.steps_before,
+          report.steps_after),
+      'workflow {} -> {} bytes, plus {} bytes of actions ({:+d} bytes '
+      'overall)'.format(report.bytes_before, report.bytes_after,
+                        report.action_bytes, -saved),
+  ])
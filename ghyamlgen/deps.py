@@ -0,0 +1,158 @@
+import functools
+import hashlib
+import re
+
+from . import GitHubExpr, Group, YAMLRenderable
+from .expr import conjunction
+from .gh import JobShellStep, wrap_run
+
+# Caches what dependency-install steps download or install, keyed on a hash
+# of the install script, so an unchanged script does not start from scratch
+# on every job. Each helper takes the install step and returns a Group to use
+# in its place, e.g. in the setup list of a MarianBuild. platform goes into
+# the key too: packages built for one runner image are not reused on another.
+
+
+def script_hash(step, length=16):
+  return hashlib.sha256(str(step.fields["run"]).encode()).hexdigest()[:length]
+
+
+class InstallCache(YAMLRenderable):
+  # Exact key only: a partial restore would skip an install whose script
+  # has changed since. Given the install step, the key ends in a hash of its
+  # script, taken when rendered, as ImportedSnippet reads its file then.
+  __slots__ = ('install',)
+
+  def __init__(self, name, id, path, key, install=None):
+    self.install = install
+    self.fields = {
+        "name": name,
+        "id": id,
+        "uses": "actions/cache@v2",
+        "with": {
+            "path": path,
+            "key": key,
+        }
+    }
+
+  @property
+  def fields(self):
+    if self.install is None:
+      return self._fields
+    with_ = self._fields["with"]
+    key = '-'.join([with_["key"], script_hash(self.install)])
+    return {**self._fields, "with": {**with_, "key": key}}
+
+  @fields.setter
+  def fields(self, fields):
+    YAMLRenderable.fields.fset(self, fields)
+
+
+def _cache_id(step, tool):
+  return '{}_{}'.format(
+      re.sub(r'\W+', '_', step.fields["name"].lower()).strip('_'), tool)
+
+
+def _when(step, condition):
+  return step.updated({"if": conjunction(step.fields.get("if"), condition)})
+
+
+def cached_install(install,
+                   tool,
+                   path,
+                   platform,
+                   prepare=(),
+                   before=(),
+                   after=(),
+                   on_hit=(),
+                   id=None):
+  # prepare runs first, always; before, install and after only on a cache
+  # miss; on_hit only on a hit.
+  id = id or _cache_id(install, tool)
+  hit = GitHubExpr("steps.{}.outputs.cache-hit == 'true'".format(id))
+  miss = GitHubExpr("steps.{}.outputs.cache-hit != 'true'".format(id))
+  key = '-'.join([tool, platform])
+  return Group(
+      list(prepare),
+      InstallCache(
+          'Cache-op for {} through {}'.format(install.fields["name"], tool), id,
+          path, key, install),
+      [_when(step, miss) for step in before],
+      _when(install, miss),
+      [_when(step, miss) for step in after],
+      [_when(step, hit) for step in on_hit],
+  )
+
+
+def apt_cache(install,
+              platform=GitHubExpr('runner.os'),
+              directory='~/.cache/apt-archives'):
+  # A fresh runner still needs the packages installed, so a hit installs the
+  # cached .deb files directly, without apt-get update or any download.
+  debs = '/var/cache/apt/archives'
+  keep = 'Binary::apt::APT::Keep-Downloaded-Packages "true";'
+  before = JobShellStep(
+      name="Keep downloaded apt packages",
+      run='\n'.join([
+          'sudo rm -f /etc/apt/apt.conf.d/docker-clean',
+          "echo '{}' | sudo tee /etc/apt/apt.conf.d/99keep-debs".format(keep),
+          'sudo apt-get clean',
+      ]))
+  after = JobShellStep(
+      name="Collect downloaded apt packages",
+      run='\n'.join([
+          'mkdir -p {}'.format(directory),
+          "find {} -maxdepth 1 -name '*.deb' -exec cp {{}} {} \\;".format(
+              debs, directory),
+      ]))
+  on_hit = JobShellStep(name="Install cached apt packages",
+                        run='sudo dpkg -i {}/*.deb'.format(directory))
+  return cached_install(install,
+                        'apt',
+                        directory,
+                        platform,
+                        before=[before],
+                        after=[after],
+                        on_hit=[on_hit])
+
+
+def mkl_cache(install,
+              platform=GitHubExpr('runner.os'),
+              directory='/opt/intel'):
+  # MKL lives entirely under /opt/intel, so restoring the tree skips the
+  # install. The directory is handed to the runner user for the restore.
+  prepare = JobShellStep(
+      name="Prepare {}".format(directory),
+      run='sudo mkdir -p {0}\nsudo chown "$(id -u):$(id -g)" {0}'.format(
+          directory))
+  return cached_install(install, 'mkl', directory, platform, prepare=[prepare])
+
+
+def brew_cache(install,
+               platform=GitHubExpr('runner.os'),
+               directory='~/Library/Caches/Homebrew'):
+  # Homebrew keeps the bottles it downloads in its cache. The install always
+  # runs, but on a hit it skips brew update (the slow part) and pours the
+  # cached bottles.
+  id = _cache_id(install, 'brew')
+  hit = GitHubExpr("steps.{}.outputs.cache-hit".format(id))
+  prefix = [
+      'export HOMEBREW_NO_AUTO_UPDATE=1 HOMEBREW_NO_INSTALL_CLEANUP=1',
+      'if [ "{}" = true ]; then'.format(hit),
+      '  brew() {',
+      '    if [ "$1" = update ]; then echo "Skipping brew update"',
+      '    else command brew "$@"; fi',
+      '  }',
+      'fi',
+  ]
+  key = '-'.join(['brew', platform])
+  return Group(
+      InstallCache(
+          'Cache-op for {} through brew'.format(install.fields["name"]), id,
+          directory, key, install),
+      wrap_run(install, functools.partial(_prepended, '\n'.join(prefix))),
+  )
+
+
+def _prepended(prefix, script):
+  return '\n'.join([prefix, script])
@@ -0,0 +1,172 @@
+from . import YAMLRenderable
+from .gh import JobShellStep
+
+# Build drivers: steps that size the build to the runner and run it. The
+# resources step finds the cores and memory available and exports
+#
+#   BUILD_COMPILE_JOBS  parallel compiles, one per core while memory lasts
+#   BUILD_LINK_JOBS     parallel links, which need far more memory each
+#   build_cmake         generator and job flags for the cmake invocation
+#
+# to the rest of the job. Configure steps pass ${{ env.build_cmake }} to
+# cmake next to ${{ env.ccache_cmake }}.
+
+
+class BuildResources(JobShellStep):
+  __slots__ = ()
+
+  def __init__(self, cmake='', compile_mb=1536, link_mb=4096):
+    # cmake may refer to $COMPILE_JOBS and $LINK_JOBS.
+    super().__init__(
+        name="Detect build resources",
+        id="build_resources",
+        shell="bash",
+        run='\n'.join([
+            'if [ "$(uname -s)" = Darwin ]; then',
+            '  CORES=$(sysctl -n hw.logicalcpu)',
+            '  MEMORY_MB=$(($(sysctl -n hw.memsize) / 1048576))',
+            'else',
+            '  CORES=$(nproc)',
+            "  MEMORY_MB=$(awk '/^MemAvailable:/ { print int($2 / 1024) }'"
+            " /proc/meminfo)",
+            '  # Containers may be limited below what the host has.',
+            '  LIMIT=$(cat /sys/fs/cgroup/memory.max 2> /dev/null ||',
+            '    cat /sys/fs/cgroup/memory/memory.limit_in_bytes 2> /dev/null)',
+            '  case "$LIMIT" in',
+            "    ''|*[!0-9]*) ;;",
+            '    *) [ $((LIMIT / 1048576)) -lt $MEMORY_MB ] &&'
+            ' MEMORY_MB=$((LIMIT / 1048576)) ;;',
+            '  esac',
+            'fi',
+            'COMPILE_JOBS=$((MEMORY_MB / {}))'.format(compile_mb),
+            'LINK_JOBS=$((MEMORY_MB / {}))'.format(link_mb),
+            '[ $COMPILE_JOBS -gt $CORES ] && COMPILE_JOBS=$CORES',
+            '[ $COMPILE_JOBS -lt 1 ] && COMPILE_JOBS=1',
+            '[ $LINK_JOBS -gt $COMPILE_JOBS ] && LINK_JOBS=$COMPILE_JOBS',
+            '[ $LINK_JOBS -lt 1 ] && LINK_JOBS=1',
+            'echo "$CORES cores, $MEMORY_MB MiB:'
+            ' $COMPILE_JOBS compile job(s), $LINK_JOBS link job(s)"',
+            'echo "::set-output name=cores::$CORES"',
+            'echo "::set-output name=memory_mb::$MEMORY_MB"',
+            'echo "::set-output name=compile_jobs::$COMPILE_JOBS"',
+            'echo "::set-output name=link_jobs::$LINK_JOBS"',
+            'echo "BUILD_COMPILE_JOBS=$COMPILE_JOBS" >> $GITHUB_ENV',
+            'echo "BUILD_LINK_JOBS=$LINK_JOBS" >> $GITHUB_ENV',
+            'echo "CMAKE_BUILD_PARALLEL_LEVEL=$COMPILE_JOBS" >> $GITHUB_ENV',
+            'echo "build_cmake={}" >> $GITHUB_ENV'.format(cmake),
+        ]))
+
+
+class SetupNinja(YAMLRenderable):
+  __slots__ = ()
+
+  def __init__(self):
+    self.fields = {
+        "name": "Install ninja",
+        "uses": "seanmiddleditch/gha-setup-ninja@v3",
+    }
+
+
+# Runs its arguments, a link, once fewer than $BUILD_LINK_JOBS links are
+# running. Slots are directories, which mkdir takes atomically on Linux and
+# macOS alike; a slot whose holder died is taken over.
+_LINK_SLOTS = '\n'.join([
+    '#!/bin/sh',
+    'slots="${RUNNER_TEMP:-/tmp}/link-slots"',
+    'mkdir -p "$slots"',
+    'while :; do',
+    '  i=0',
+    '  while [ $i -lt "${BUILD_LINK_JOBS:-1}" ]; do',
+    '    slot="$slots/$i"',
+    '    if mkdir "$slot" 2> /dev/null; then',
+    '      echo $$ > "$slot/pid"',
+    '      trap \'rm -rf "$slot"\' EXIT',
+    '      trap \'exit 1\' INT TERM',
+    '      "$@"',
+    '      exit $?',
+    '    fi',
+    '    PID=$(cat "$slot/pid" 2> /dev/null)',
+    '    if [ -n "$PID" ] && ! kill -0 "$PID" 2> /dev/null; then',
+    '      rm -rf "$slot"',
+    '    fi',
+    '    i=$((i + 1))',
+    '  done',
+    '  sleep 1',
+    'done',
+])
+
+
+class LinkSlots(JobShellStep):
+  __slots__ = ()
+
+  def __init__(self, path='$RUNNER_TEMP/link-slots.sh'):
+    super().__init__(name="Install link limiter",
+                     run='\n'.join([
+                         "cat > {} << 'GHYAMLGEN_LINK_SLOTS_EOF'".format(path),
+                         _LINK_SLOTS,
+                         'GHYAMLGEN_LINK_SLOTS_EOF',
+                         'chmod +x {}'.format(path),
+                     ]))
+
+
+class Make:
+  # Make has no job pools, so links are capped by a linker launcher that
+  # waits for one of $BUILD_LINK_JOBS slots (CMAKE_<LANG>_LINKER_LAUNCHER,
+  # CMake 3.21 or later; older versions ignore it and links run uncapped).
+  name = 'make'
+
+  def __init__(self, launcher=None, compile_mb=1536, link_mb=4096):
+    self.launcher = launcher
+    self.compile_mb = compile_mb
+    self.link_mb = link_mb
+
+  def launcher_flags(self):
+    if not self.launcher:
+      return []
+    return [
+        '-DCMAKE_{}_COMPILER_LAUNCHER={}'.format(lang, self.launcher)
+        for lang in ('C', 'CXX')
+    ]
+
+  def cmake_flags(self):
+    link = [
+        '-DCMAKE_{}_LINKER_LAUNCHER=$RUNNER_TEMP/link-slots.sh'.format(lang)
+        for lang in ('C', 'CXX')
+    ]
+    return ['-G \\"Unix Makefiles\\"'] + link + self.launcher_flags()
+
+  def tools(self):
+    return [LinkSlots()]
+
+  def setup(self):
+    return self.tools() + [
+        BuildResources(' '.join(self.cmake_flags()), self.compile_mb,
+                       self.link_mb)
+    ]
+
+  def build_command(self):
+    return 'make -j"$BUILD_COMPILE_JOBS"'
+
+  def build(self, working_directory='build'):
+    return JobShellStep(name="Build from source",
+                        run=self.build_command(),
+                        working_directory=working_directory)
+
+
+class Ninja(Make):
+  # Ninja runs links in their own, smaller job pool.
+  name = 'ninja'
+
+  def cmake_flags(self):
+    pools = "'-DCMAKE_JOB_POOLS=compile=$COMPILE_JOBS;link=$LINK_JOBS'"
+    flags = [
+        '-G Ninja', pools, '-DCMAKE_JOB_POOL_COMPILE=compile',
+        '-DCMAKE_JOB_POOL_LINK=link'
+    ]
+    return flags + self.launcher_flags()
+
+  def tools(self):
+    return [SetupNinja()]
+
+  def build_command(self):
+    return 'ninja -j"$BUILD_COMPILE_JOBS"'
@@ -0,0 +1,127 @@
+import io
+
+from yaml.events import (DocumentEndEvent, DocumentStartEvent, MappingEndEvent,
+                         MappingStartEvent, SequenceEndEvent,
+                         SequenceStartEvent)
+
+from . import YAMLRenderable, Group, profile
+from .yml import Dumper as DefaultDumper
+
+_MAP_TAG = 'tag:yaml.org,2002:map'
+_SEQ_TAG = 'tag:yaml.org,2002:seq'
+
+
+def _emit_leaf(dumper, data):
+  # Leaves go through the regular representer/serializer so custom
+  # representers and implicit-tag quoting behave exactly as in yaml.dump.
+  node = dumper.represent_data(data)
+  dumper.anchor_node(node)
+  dumper.serialize_node(node, None, None)
+
+  _reset(dumper)
+
+
+def _reset(dumper):
+  # Nothing is shared between leaves; drop the bookkeeping yaml.dump would
+  # only clear at the end of the document. This also sets up the Serializer
+  # state that CDumper never initializes.
+  dumper.represented_objects = {}
+  dumper.object_keeper = []
+  dumper.anchors = {}
+  dumper.serialized_nodes = {}
+
+
+def _emit(dumper, cls):
+  while isinstance(cls, YAMLRenderable):
+    cls = cls.fields
+
+  if isinstance(cls, list):
+    dumper.emit(SequenceStartEvent(None, _SEQ_TAG, True, flow_style=False))
+    for v in cls:
+      if isinstance(v, Group):
+        for w in v:
+          _emit(dumper, w)
+      elif v is not None:
+        _emit(dumper, v)
+    dumper.emit(SequenceEndEvent())
+
+  elif isinstance(cls, dict):
+    dumper.emit(MappingStartEvent(None, _MAP_TAG, True, flow_style=False))
+    for k, v in cls.items():
+      if v is not None:
+        _emit_leaf(dumper, k)
+        _emit(dumper, v)
+    dumper.emit(MappingEndEvent())
+
+  else:
+    _emit_leaf(dumper, cls)
+
+
+def _emit_profiled(dumper, cls, profiler):
+  # Same traversal as _emit, reporting renderables to the profiler.
+  profiler.count('emit', cls)
+  if isinstance(cls, YAMLRenderable):
+    token = profiler.enter()
+    _emit_profiled(dumper, cls.fields, profiler)
+    profiler.leave('emit', cls, token)
+
+  elif isinstance(cls, list):
+    dumper.emit(SequenceStartEvent(None, _SEQ_TAG, True, flow_style=False))
+    for v in cls:
+      if isinstance(v, Group):
+        for w in v:
+          _emit_profiled(dumper, w, profiler)
+      elif v is not None:
+        _emit_profiled(dumper, v, profiler)
+    dumper.emit(SequenceEndEvent())
+
+  elif isinstance(cls, dict):
+    dumper.emit(MappingStartEvent(None, _MAP_TAG, True, flow_style=False))
+    for k, v in cls.items():
+      if v is not None:
+        _emit_leaf(dumper, k)
+        _emit_profiled(dumper, v, profiler)
+    dumper.emit(MappingEndEvent())
+
+  else:
+    _emit_leaf(dumper, cls)
+
+
+def dump(cls, stream=None, Dumper=DefaultDumper, width=1024):
+  # Streams events for the renderable tree straight into the emitter. The
+  # output matches yaml.dump(resolve(cls), sort_keys=False, width=width)
+  # without materializing the resolved copy.
+  getvalue = None
+  if stream is None:
+    stream = io.StringIO()
+    getvalue = stream.getvalue
+
+  profiler = profile.current
+  if profiler is not None:
+    Dumper = profiler.wrap_dumper(Dumper)
+
+  dumper = Dumper(stream,
+                  default_flow_style=False,
+                  width=width,
+                  sort_keys=False)
+  try:
+    _reset(dumper)
+    dumper.open()
+    dumper.emit(DocumentStartEvent(explicit=False))
+    if profiler is not None:
+      _emit_profiled(dumper, cls, profiler)
+    else:
+      _emit(dumper, cls)
+    dumper.emit(DocumentEndEvent(explicit=False))
+    dumper.close()
+  finally:
+    dumper.dispose()
+
+  if getvalue:
+    return getvalue()
+
+
+def render(workflow, stream=None):
+  # Each call gets its own Dumper instance, so concurrent renders in threads
+  # share no emitter state. Uses libyaml when available.
+  return dump(workflow, stream)
@@ -0,0 +1,741 @@
+import functools
+import json
+import math
+import re
+from collections import namedtuple
+
+from . import resolve
+
+# Parser, evaluator and constant folder for GitHub Actions expressions, the
+# language inside ${{ }} and in `if:` conditions.
+
+
+class ExpressionError(ValueError):
+
+  def __init__(self, message, text=None, position=None):
+    if text is not None and position is not None:
+      message = '{} at {} in {!r}'.format(message, position, text)
+    super().__init__(message)
+    self.text = text
+    self.position = position
+
+
+Literal = namedtuple('Literal', ['value'])
+Name = namedtuple('Name', ['name'])
+Property = namedtuple('Property', ['target', 'name'])
+Index = namedtuple('Index', ['target', 'index'])
+Filter = namedtuple('Filter', ['target'])
+Call = namedtuple('Call', ['name', 'args'])
+Not = namedtuple('Not', ['operand'])
+Binary = namedtuple('Binary', ['op', 'left', 'right'])
+
+CONTEXTS = frozenset([
+    'github', 'env', 'vars', 'job', 'jobs', 'steps', 'runner', 'secrets',
+    'strategy', 'matrix', 'needs', 'inputs'
+])
+
+STATUS_FUNCTIONS = frozenset(['success', 'always', 'cancelled', 'failure'])
+
+# name -> (min args, max args); None is unbounded.
+FUNCTIONS = {
+    'contains': (2, 2),
+    'startswith': (2, 2),
+    'endswith': (2, 2),
+    'format': (1, None),
+    'join': (1, 2),
+    'tojson': (1, 1),
+    'fromjson': (1, 1),
+    'hashfiles': (1, None),
+    'success': (0, 0),
+    'always': (0, 0),
+    'cancelled': (0, 0),
+    'failure': (0, 0),
+}
+
+_PRECEDENCE = {
+    '||': 1,
+    '&&': 2,
+    '==': 3,
+    '!=': 3,
+    '<': 4,
+    '<=': 4,
+    '>': 4,
+    '>=': 4
+}
+
+_TOKEN = re.compile(
+    r'''
+    (?P<space>\s+)
+  | (?P<number>0x[0-9a-fA-F]+|-?(?:\d+\.?\d*|\.\d+)(?:[eE][+-]?\d+)?)
+  | (?P<string>'(?:[^']|'')*')
+  | (?P<ident>[A-Za-z_][A-Za-z0-9_-]*)
+  | (?P<op>==|!=|<=|>=|&&|\|\||[!<>()\[\].,*])
+''', re.VERBOSE)
+
+_WRAPPED = re.compile(r'^\s*\$\{\{(.*)\}\}\s*$', re.DOTALL)
+_EMBEDDED = re.compile(r'\$\{\{(.*?)\}\}', re.DOTALL)
+
+
+def _tokenize(text):
+  tokens = []
+  position = 0
+  while position < len(text):
+    match = _TOKEN.match(text, position)
+    if match is None:
+      raise ExpressionError('Unexpected character', text, position)
+    kind = match.lastgroup
+    if kind != 'space':
+      tokens.append((kind, match.group(), position))
+    position = match.end()
+  tokens.append(('end', '', position))
+  return tokens
+
+
+class _Parser:
+
+  def __init__(self, text):
+    self.text = text
+    self.tokens = _tokenize(text)
+    self.position = 0
+
+  def peek(self):
+    return self.tokens[self.position]
+
+  def take(self, value=None):
+    kind, token, position = self.tokens[self.position]
+    if value is not None and token != value:
+      raise ExpressionError('Expected {!r}'.format(value), self.text, position)
+    self.position += 1
+    return kind, token, position
+
+  def parse(self):
+    node = self.binary(1)
+    kind, _, position = self.peek()
+    if kind != 'end':
+      raise ExpressionError('Unexpected token', self.text, position)
+    return node
+
+  def binary(self, level):
+    if level > 4:
+      return self.unary()
+    node = self.binary(level + 1)
+    while _PRECEDENCE.get(self.peek()[1]) == level and self.peek()[0] == 'op':
+      op = self.take()[1]
+      node = Binary(op, node, self.binary(level + 1))
+    return node
+
+  def unary(self):
+    if self.peek()[1] == '!':
+      self.take()
+      return Not(self.unary())
+    return self.postfix(self.primary())
+
+  def postfix(self, node):
+    while True:
+      token = self.peek()[1]
+      if token == '.':
+        self.take()
+        kind, name, position = self.take()
+        if name == '*':
+          node = Filter(node)
+        elif kind in ('ident', 'number'):
+          node = Property(node, name)
+        else:
+          raise ExpressionError('Expected property name', self.text, position)
+      elif token == '[':
+        self.take()
+        index = self.binary(1)
+        self.take(']')
+        node = Index(node, index)
+      else:
+        return node
+
+  def primary(self):
+    kind, token, position = self.take()
+    if kind == 'number':
+      return Literal(_number(token))
+    if kind == 'string':
+      return Literal(token[1:-1].replace("''", "'"))
+    if kind == 'ident':
+      if token in ('true', 'false'):
+        return Literal(token == 'true')
+      if token == 'null':
+        return Literal(None)
+      if self.peek()[1] == '(':
+        return self.call(token, position)
+      return Name(token)
+    if token == '(':
+      node = self.binary(1)
+      self.take(')')
+      return node
+    raise ExpressionError('Unexpected token', self.text, position)
+
+  def call(self, name, position):
+    self.take('(')
+    args = []
+    if self.peek()[1] != ')':
+      args.append(self.binary(1))
+      while self.peek()[1] == ',':
+        self.take()
+        args.append(self.binary(1))
+    self.take(')')
+
+    arity = FUNCTIONS.get(name.lower())
+    if arity is None:
+      raise ExpressionError('Unknown function {!r}'.format(name), self.text,
+                            position)
+    low, high = arity
+    if len(args) < low or (high is not None and len(args) > high):
+      raise ExpressionError('Wrong number of arguments to {}'.format(name),
+                            self.text, position)
+    return Call(name, tuple(args))
+
+
+def _number(token):
+  if token.lower().startswith('0x'):
+    return int(token, 16)
+  try:
+    return int(token)
+  except ValueError:
+    return float(token)
+
+
+@functools.lru_cache(maxsize=4096)
+def parse(text):
+  # Parses a bare expression (no ${{ }}). Results are cached and immutable,
+  # so repeated conditions across a workflow are parsed once.
+  return _Parser(text).parse()
+
+
+def parse_expression(value):
+  # Accepts either a bare expression, as allowed in `if:`, or a value fully
+  # wrapped in ${{ }} such as a GitHubExpr.
+  match = _WRAPPED.match(value)
+  return parse(match.group(1) if match else value)
+
+
+@functools.lru_cache(maxsize=4096)
+def parse_template(text):
+  # Splits a string with embedded ${{ }} into literal text and expressions.
+  parts = []
+  position = 0
+  for match in _EMBEDDED.finditer(text):
+    if match.start() > position:
+      parts.append(text[position:match.start()])
+    parts.append(parse(match.group(1)))
+    position = match.end()
+  if position < len(text):
+    parts.append(text[position:])
+  return tuple(parts)
+
+
+def is_template(value):
+  return isinstance(value, str) and '${{' in value
+
+
+def unparse(node, level=0):
+  if isinstance(node, Literal):
+    value = node.value
+    if value is None:
+      return 'null'
+    if isinstance(value, bool):
+      return 'true' if value else 'false'
+    if isinstance(value, (int, float)):
+      return _to_string(value)
+    if isinstance(value, (list, dict)):
+      # Whole objects only show up here after folding in a context.
+      return 'fromJSON({})'.format(unparse(Literal(json.dumps(value))))
+    return "'{}'".format(str(value).replace("'", "''"))
+  if isinstance(node, Name):
+    return node.name
+  if isinstance(node, Property):
+    return '{}.{}'.format(unparse(node.target, 6), node.name)
+  if isinstance(node, Index):
+    return '{}[{}]'.format(unparse(node.target, 6), unparse(node.index))
+  if isinstance(node, Filter):
+    return '{}.*'.format(unparse(node.target, 6))
+  if isinstance(node, Call):
+    return '{}({})'.format(node.name,
+                           ', '.join(unparse(arg) for arg in node.args))
+  if isinstance(node, Not):
+    text = '!{}'.format(unparse(node.operand, 5))
+    return '({})'.format(text) if level > 5 else text
+
+  precedence = _PRECEDENCE[node.op]
+  text = '{} {} {}'.format(unparse(node.left, precedence), node.op,
+                           unparse(node.right, precedence + 1))
+  return '({})'.format(text) if level > precedence else text
+
+
+def conjunction(*conditions):
+  # Joins conditions with &&, flattening nested conjunctions and dropping
+  # None and repeated terms. A single condition is returned as given.
+  conditions = [c for c in conditions if c is not None]
+  terms = []
+  for condition in conditions:
+    for term in _conjuncts(parse_expression(condition)):
+      if term not in terms:
+        terms.append(term)
+  if len(conditions) <= 1 or len(terms) <= 1:
+    return conditions[0] if conditions else None
+  node = terms[0]
+  for term in terms[1:]:
+    node = Binary('&&', node, term)
+  return '${{{{ {} }}}}'.format(unparse(node))
+
+
+def _conjuncts(node):
+  if isinstance(node, Binary) and node.op == '&&':
+    return _conjuncts(node.left) + _conjuncts(node.right)
+  return [node]
+
+
+def references(node):
+  # Yields context references as tuples of literal path segments, e.g.
+  # ('steps', 'brt_run', 'outcome'). Dynamic indices end the path.
+  if isinstance(node, (Name, Property, Index, Filter)):
+    path = _path(node)
+    if path is not None:
+      yield path
+      return
+  for child in _children(node):
+    yield from references(child)
+
+
+def _path(node):
+  segments = []
+  while True:
+    if isinstance(node, Name):
+      segments.append(node.name)
+      return tuple(reversed(segments))
+    if isinstance(node, Property):
+      segments.append(node.name)
+    elif isinstance(node, Index) and isinstance(node.index, Literal):
+      segments.append(str(node.index.value))
+    elif isinstance(node, (Index, Filter)):
+      segments = []
+    else:
+      return None
+    node = node.target
+
+
+def _children(node):
+  if isinstance(node, (Property, Filter)):
+    return (node.target,)
+  if isinstance(node, Index):
+    return (node.target, node.index)
+  if isinstance(node, Call):
+    return node.args
+  if isinstance(node, Not):
+    return (node.operand,)
+  if isinstance(node, Binary):
+    return (node.left, node.right)
+  return ()
+
+
+def uses_status(node):
+  if isinstance(node, Call) and node.name.lower() in STATUS_FUNCTIONS:
+    return True
+  return any(uses_status(child) for child in _children(node))
+
+
+# Value semantics follow the documented GitHub rules: loose equality coerces
+# mismatched types to numbers, string comparison ignores case, and && / ||
+# return one of their operands.
+
+
+class _Filtered(list):
+  pass
+
+
+def _kind(value):
+  if value is None:
+    return 'null'
+  if isinstance(value, bool):
+    return 'bool'
+  if isinstance(value, (int, float)):
+    return 'number'
+  if isinstance(value, str):
+    return 'string'
+  if isinstance(value, list):
+    return 'array'
+  return 'object'
+
+
+def _to_number(value):
+  kind = _kind(value)
+  if kind == 'null':
+    return 0
+  if kind == 'bool':
+    return 1 if value else 0
+  if kind == 'number':
+    return value
+  if kind == 'string':
+    text = value.strip()
+    if not text:
+      return 0
+    try:
+      return int(text, 16) if text.lower().startswith('0x') else float(text)
+    except ValueError:
+      return math.nan
+  return math.nan
+
+
+def _to_string(value):
+  kind = _kind(value)
+  if kind == 'null':
+    return ''
+  if kind == 'bool':
+    return 'true' if value else 'false'
+  if kind == 'number':
+    if isinstance(value, float) and value.is_integer():
+      return str(int(value))
+    return str(value)
+  if kind == 'string':
+    return value
+  return 'Array' if kind == 'array' else 'Object'
+
+
+def truthy(value):
+  if value is None or value is False or value == '':
+    return False
+  if isinstance(value, (int, float)) and not isinstance(value, bool):
+    return value != 0 and not math.isnan(value)
+  return True
+
+
+def _equal(left, right):
+  lkind, rkind = _kind(left), _kind(right)
+  if lkind != rkind:
+    return _to_number(left) == _to_number(right)
+  if lkind == 'string':
+    return left.lower() == right.lower()
+  if lkind in ('array', 'object'):
+    return left is right
+  return left == right
+
+
+def _compare(op, left, right):
+  if _kind(left) == 'string' and _kind(right) == 'string':
+    left, right = left.lower(), right.lower()
+  else:
+    left, right = _to_number(left), _to_number(right)
+    if math.isnan(left) or math.isnan(right):
+      return False
+  if op == '<':
+    return left < right
+  if op == '<=':
+    return left <= right
+  if op == '>':
+    return left > right
+  return left >= right
+
+
+def _lookup(target, key):
+  if isinstance(target, _Filtered):
+    values = _Filtered()
+    for item in target:
+      value = _lookup(item, key)
+      if value is not None:
+        values.append(value)
+    return values
+  if isinstance(target, dict):
+    if key in target:
+      return target[key]
+    if isinstance(key, str):
+      for name, value in target.items():
+        if isinstance(name, str) and name.lower() == key.lower():
+          return value
+    return None
+  if isinstance(target, list) and _kind(key) == 'number':
+    index = int(key)
+    return target[index] if 0 <= index < len(target) else None
+  return None
+
+
+def _format(template, *args):
+  out = []
+  position = 0
+  for match in re.finditer(r'\{\{|\}\}|\{(\d+)\}', template):
+    out.append(template[position:match.start()])
+    token = match.group()
+    if token == '{{':
+      out.append('{')
+    elif token == '}}':
+      out.append('}')
+    else:
+      index = int(match.group(1))
+      if index >= len(args):
+        raise ExpressionError('format() index {} out of range'.format(index))
+      out.append(_to_string(args[index]))
+    position = match.end()
+  out.append(template[position:])
+  return ''.join(out)
+
+
+def _contains(search, item):
+  if isinstance(search, list):
+    return any(_equal(value, item) for value in search)
+  return _to_string(item).lower() in _to_string(search).lower()
+
+
+def _builtin(name, args, status, functions):
+  lowered = name.lower()
+  if functions and lowered in functions:
+    return functions[lowered](*args)
+  if lowered == 'success':
+    return status == 'success'
+  if lowered == 'failure':
+    return status == 'failure'
+  if lowered == 'cancelled':
+    return status == 'cancelled'
+  if lowered == 'always':
+    return True
+  if lowered == 'contains':
+    return _contains(*args)
+  if lowered == 'startswith':
+    return _to_string(args[0]).lower().startswith(_to_string(args[1]).lower())
+  if lowered == 'endswith':
+    return _to_string(args[0]).lower().endswith(_to_string(args[1]).lower())
+  if lowered == 'format':
+    return _format(_to_string(args[0]), *args[1:])
+  if lowered == 'join':
+    separator = _to_string(args[1]) if len(args) > 1 else ','
+    if isinstance(args[0], list):
+      return separator.join(_to_string(v) for v in args[0])
+    return _to_string(args[0])
+  if lowered == 'tojson':
+    return json.dumps(args[0], indent=2)
+  if lowered == 'fromjson':
+    return json.loads(_to_string(args[0]))
+  raise ExpressionError(
+      '{}() needs to be supplied through functions'.format(name))
+
+
+def evaluate(node, context=None, status='success', functions=None):
+  # context maps context names (matrix, env, steps, ...) to their values;
+  # status is the job status seen by success()/failure()/cancelled().
+  if isinstance(node, str):
+    node = parse_expression(node)
+  value = _evaluate(node, context or {}, status, functions)
+  return list(value) if isinstance(value, _Filtered) else value
+
+
+def _evaluate(node, context, status='success', functions=None):
+
+  def run(node):
+    if isinstance(node, Literal):
+      return node.value
+    if isinstance(node, Name):
+      return _lookup(context, node.name)
+    if isinstance(node, Property):
+      return _lookup(run(node.target), node.name)
+    if isinstance(node, Index):
+      return _lookup(run(node.target), run(node.index))
+    if isinstance(node, Filter):
+      target = run(node.target)
+      if isinstance(target, dict):
+        return _Filtered(target.values())
+      if isinstance(target, list):
+        return _Filtered(target)
+      return _Filtered()
+    if isinstance(node, Call):
+      return _builtin(node.name, [run(arg) for arg in node.args], status,
+                      functions)
+    if isinstance(node, Not):
+      return not truthy(run(node.operand))
+
+    if node.op == '&&':
+      left = run(node.left)
+      return run(node.right) if truthy(left) else left
+    if node.op == '||':
+      left = run(node.left)
+      return left if truthy(left) else run(node.right)
+    left, right = run(node.left), run(node.right)
+    if node.op == '==':
+      return _equal(left, right)
+    if node.op == '!=':
+      return not _equal(left, right)
+    return _compare(node.op, left, right)
+
+  return run(node)
+
+
+def render_template(text, context=None, status='success', functions=None):
+  return ''.join(part if isinstance(part, str) else _to_string(
+      evaluate(part, context, status, functions))
+                 for part in parse_template(text))
+
+
+def fold(node, context=None):
+  # Constant-folds node. References into contexts present in `context` are
+  # substituted (a missing key is null, as at runtime); everything else,
+  # including status functions and hashFiles(), is left for the runner.
+  if isinstance(node, str):
+    node = parse_expression(node)
+  context = context or {}
+
+  def constant(node):
+    return isinstance(node, Literal)
+
+  def go(node):
+    if isinstance(node, Name):
+      if node.name in context:
+        return Literal(_evaluate(node, context))
+      return node
+
+    if isinstance(node, (Property, Filter)):
+      target = go(node.target)
+      node = node._replace(target=target)
+      return Literal(_evaluate(node, {})) if constant(target) else node
+
+    if isinstance(node, Index):
+      node = Index(go(node.target), go(node.index))
+      if constant(node.target) and constant(node.index):
+        return Literal(_evaluate(node, {}))
+      return node
+
+    if isinstance(node, Call):
+      args = tuple(go(arg) for arg in node.args)
+      lowered = node.name.lower()
+      if (lowered not in STATUS_FUNCTIONS and lowered != 'hashfiles' and
+          all(constant(arg) for arg in args)):
+        return Literal(_evaluate(Call(node.name, args), {}))
+      return Call(node.name, args)
+
+    if isinstance(node, Not):
+      operand = go(node.operand)
+      if constant(operand):
+        return Literal(not truthy(operand.value))
+      return Not(operand)
+
+    if isinstance(node, Binary):
+      left = go(node.left)
+      if node.op in ('&&', '||') and constant(left):
+        # Short-circuit on a known left operand: the result is either the
+        # left value itself or whatever the right operand evaluates to.
+        stop = truthy(left.value) == (node.op == '||')
+        return left if stop else go(node.right)
+      right = go(node.right)
+      if constant(left) and constant(right):
+        return Literal(_evaluate(Binary(node.op, left, right), {}))
+      return Binary(node.op, left, right)
+
+    return node
+
+  return go(node)
+
+
+Scope = namedtuple('Scope', ['matrix', 'env', 'steps', 'needs'],
+                   defaults=[None, None, None, None])
+
+
+def check(node, scope=Scope()):
+  # Type-checks context references. Each field of scope is a collection of
+  # known names (matrix keys, env vars, earlier step ids, needed jobs), or
+  # None when that context cannot be known statically.
+  if isinstance(node, str):
+    node = parse_expression(node)
+  problems = []
+  for path in references(node):
+    root = path[0]
+    if root not in CONTEXTS:
+      problems.append('unknown context {!r}'.format(root))
+      continue
+    known = getattr(scope, root, None) if root in Scope._fields else None
+    if known is None or len(path) < 2:
+      continue
+
+    name = path[1]
+    if name not in known:
+      problems.append('{}.{} is not defined'.format(root, name))
+    elif root == 'steps' and len(path) > 2 and path[2] not in ('outputs',
+                                                               'outcome',
+                                                               'conclusion'):
+      problems.append('steps.{} has no property {!r}'.format(name, path[2]))
+    elif root == 'needs' and len(path) > 2 and path[2] not in ('outputs',
+                                                               'result'):
+      problems.append('needs.{} has no property {!r}'.format(name, path[2]))
+  return problems
+
+
+Problem = namedtuple('Problem', ['location', 'expression', 'message'])
+
+
+def _matrix_keys(strategy):
+  matrix = (strategy or {}).get('matrix')
+  if not isinstance(matrix, dict):
+    return None
+  keys = {k for k in matrix if k not in ('include', 'exclude')}
+  for entry in matrix.get('include') or []:
+    keys.update(entry)
+  return keys
+
+
+def _check_value(value, location, scope, problems, condition=False):
+  if isinstance(value, dict):
+    for k, v in value.items():
+      _check_value(v, '{}.{}'.format(location, k), scope, problems)
+  elif isinstance(value, list):
+    for i, v in enumerate(value):
+      _check_value(v, '{}[{}]'.format(location, i), scope, problems)
+  elif isinstance(value, str) and (condition or is_template(value)):
+    try:
+      if condition:
+        nodes = [parse_expression(value)]
+      else:
+        nodes = [p for p in parse_template(value) if not isinstance(p, str)]
+    except ExpressionError as e:
+      problems.append(Problem(location, value, str(e)))
+      return
+    for node in nodes:
+      for message in check(node, scope):
+        problems.append(Problem(location, value, message))
+
+
+def check_workflow(workflow):
+  # Parses and type-checks every `if:` and every ${{ }} in a workflow,
+  # returning a list of Problems. Steps may only refer to earlier step ids;
+  # env references stop being checked once a step writes to $GITHUB_ENV.
+  problems = []
+  fields = workflow.fields
+  workflow_env = set(fields.get('env') or {})
+  for jobid, job in (fields.get('jobs') or {}).items():
+    job = resolve(job)
+    location = 'jobs.{}'.format(jobid)
+    needs = job.get('needs') or []
+    needs = [needs] if isinstance(needs, str) else needs
+    env = workflow_env | set(job.get('env') or {})
+    scope = Scope(matrix=_matrix_keys(job.get('strategy')) or set(),
+                  env=env,
+                  steps=set(),
+                  needs=set(needs))
+
+    # Outputs are evaluated once every step has run.
+    for key, value in job.items():
+      if key not in ('steps', 'outputs'):
+        _check_value(value,
+                     '{}.{}'.format(location, key),
+                     scope,
+                     problems,
+                     condition=(key == 'if'))
+
+    for index, step in enumerate(job.get('steps') or []):
+      step_location = '{}.steps[{}]'.format(location, index)
+      step_scope = scope
+      if scope.env is not None:
+        step_scope = scope._replace(env=scope.env | set(step.get('env') or {}))
+      for key, value in step.items():
+        _check_value(value,
+                     '{}.{}'.format(step_location, key),
+                     step_scope,
+                     problems,
+                     condition=(key == 'if'))
+      if 'id' in step:
+        scope = scope._replace(steps=scope.steps | {step['id']})
+      if 'GITHUB_ENV' in str(step.get('run', '')):
+        scope = scope._replace(env=None)
+    if 'outputs' in job:
+      _check_value(job['outputs'], '{}.outputs'.format(location), scope,
+                   problems)
+  return problems
@@ -0,0 +1,59 @@
+import hashlib
+import os
+import stat
+import tempfile
+
+
+def write_atomic(path, data):
+  # data is written as UTF-8. The file keeps its mode, or gets the default
+  # for new files, rather than the 0600 of mkstemp.
+  dirname = os.path.dirname(os.path.abspath(path))
+  os.makedirs(dirname, exist_ok=True)
+  fd, tmp = tempfile.mkstemp(dir=dirname,
+                             prefix='.{}.'.format(os.path.basename(path)),
+                             suffix='.tmp')
+  try:
+    os.fchmod(fd, _mode(path))
+    with os.fdopen(fd, 'w', encoding='utf-8') as fp:
+      fp.write(data)
+    os.replace(tmp, path)
+  except BaseException:
+    os.unlink(tmp)
+    raise
+
+
+def _mode(path):
+  try:
+    return stat.S_IMODE(os.stat(path).st_mode)
+  except OSError:
+    umask = os.umask(0)
+    os.umask(umask)
+    return 0o666 & ~umask
+
+
+def file_digest(path):
+  with open(path, 'rb') as fp:
+    return hashlib.sha1(fp.read()).hexdigest()
+
+
+def fingerprint(path, digest=None):
+  st = os.stat(path)
+  return {
+      'mtime_ns': st.st_mtime_ns,
+      'size': st.st_size,
+      'sha1': digest or file_digest(path),
+  }
+
+
+def unchanged(path, record):
+  # stat() is enough when mtime and size agree; a touched-but-identical file
+  # costs one hash and still counts as unchanged.
+  try:
+    st = os.stat(path)
+  except OSError:
+    return False
+  if st.st_mtime_ns == record['mtime_ns'] and st.st_size == record['size']:
+    return True
+  if st.st_size != record['size']:
+    return False
+  return file_digest(path) == record['sha1']
@@ -1,7 +1,10 @@
-from . import YAMLRenderable, Snippet, GitHubExpr, QuotedExpr, GitHubMapping
+from . import YAMLRenderable, Group, Snippet, GitHubExpr, QuotedExpr, GitHubMapping
+from .expr import conjunction
+from .snippets import snippet_cache
 
 
 class On(YAMLRenderable):
+  __slots__ = ()
 
   def __init__(self,
                push=None,
@@ -17,12 +20,14 @@ class On(YAMLRenderable):
 
 
 class Workflow(YAMLRenderable):
+  __slots__ = ()
 
   def __init__(self, name, on, env=None, jobs=None):
     self.fields = {"name": name, "on": on, "env": env, "jobs": jobs}
 
 
 class Job(YAMLRenderable):
+  __slots__ = ('_id',)
 
   def __init__(
       self,
@@ -33,6 +38,8 @@ class Job(YAMLRenderable):
       outputs=None,
       condition=None,
       steps=None,
+      services=None,
+      container=None,
   ):
 
     self._id = id
@@ -42,6 +49,8 @@ class Job(YAMLRenderable):
         "runs-on": runs_on,
         "if": condition,
         "needs": None,
+        "container": container,
+        "services": services,
         "steps": steps,
         "outputs": outputs,
     }
@@ -49,17 +58,12 @@ class Job(YAMLRenderable):
   def id(self):
     return self._id
 
-  def needs(self, job, OpExpr):
-    condition = "{}".format(OpExpr(job))
-    fields = {
-        "if": condition,
-        "needs": job.id(),
-    }
-
-    self.fields.update(fields)
+  def needs(self, *jobs, job=None, OpExpr=None):
+    return _needs(self, jobs if job is None else jobs + (job,), OpExpr)
 
 
 class MatrixJob(YAMLRenderable):
+  __slots__ = ('_id',)
 
   def __init__(
       self,
@@ -69,6 +73,8 @@ class MatrixJob(YAMLRenderable):
       outputs=None,
       condition=None,
       steps=None,
+      services=None,
+      container=None,
   ):
 
     self._id = id
@@ -82,6 +88,8 @@ class MatrixJob(YAMLRenderable):
         "env": env,
         "if": condition,
         "needs": None,
+        "container": container,
+        "services": services,
         "steps": steps,
         "outputs": outputs,
     }
@@ -89,14 +97,45 @@ class MatrixJob(YAMLRenderable):
   def id(self):
     return self._id
 
+  def needs(self, *jobs, job=None, OpExpr=None):
+    return _needs(self, jobs if job is None else jobs + (job,), OpExpr)
+
+
+def job_id(job):
+  return job if isinstance(job, str) else job.id()
 
-class Group(YAMLRenderable):
 
-  def __init__(self, *renderables):
-    self.renderables = renderables
+def needed(job):
+  needs = job.fields.get("needs") or []
+  return [needs] if isinstance(needs, str) else list(needs)
+
+
+def _needs(node, jobs, OpExpr):
+  # Adds jobs (or job ids) to node's needs. OpExpr, applied to each of them,
+  # yields a condition that is and-ed with the existing if:. It must be passed
+  # by keyword: an old-style needs(job, OpExpr) call raises instead of
+  # silently treating OpExpr as another job.
+  for job in jobs:
+    if not isinstance(job, (str, Job, MatrixJob)):
+      raise TypeError('needs() takes jobs or job ids, not {!r}; pass the '
+                      'condition as OpExpr='.format(job))
+  ids = needed(node)
+  for job in jobs:
+    if job_id(job) not in ids:
+      ids.append(job_id(job))
+  fields = {"needs": ids[0] if len(ids) == 1 else ids}
+  if OpExpr is not None:
+    conditions = ["{}".format(OpExpr(job)) for job in jobs]
+    fields["if"] = conjunction(node.fields.get("if"), *conditions)
+
+  if node._frozen:
+    return node.updated(fields)
+  node.fields = node._merged(fields)
+  return node
 
 
 class Checkout(YAMLRenderable):
+  __slots__ = ()
 
   def __init__(self, ref=None):
     self.fields = {
@@ -110,6 +149,7 @@ class Checkout(YAMLRenderable):
 
 
 class JobShellStep(YAMLRenderable):
+  __slots__ = ()
 
   def __init__(self,
                name,
@@ -131,12 +171,13 @@ class JobShellStep(YAMLRenderable):
 
 
 class GHCache(YAMLRenderable):
+  __slots__ = ()
 
-  def __init__(self, keys, cache_dir):
-    transform = lambda keys: '-'.join(['ccache'] + keys)
+  def __init__(self, keys, cache_dir, tool='ccache'):
+    transform = lambda keys: '-'.join([tool] + keys)
 
     self.fields = {
-        "name": "Cache-op for build-cache through ccache",
+        "name": "Cache-op for build-cache through {}".format(tool),
         "uses": "actions/cache@v2",
         "with": {
             "path":
@@ -152,8 +193,9 @@ class GHCache(YAMLRenderable):
 
 
 class UploadArtifacts(YAMLRenderable):
+  __slots__ = ()
 
-  def __init__(self, identifier, condition=None):
+  def __init__(self, identifier, condition=None, path=None):
     self.fields = {
         "name": "Upload regression-tests artifacts",
         "uses": "actions/upload-artifact@v2",
@@ -162,7 +204,7 @@ class UploadArtifacts(YAMLRenderable):
             "name":
             "brt-{}".format(identifier),
             "path":
-            Snippet('\n'.join([
+            path or Snippet('\n'.join([
                 "bergamot-translator-tests/**/*.expected",
                 "bergamot-translator-tests/**/*.log",
                 "bergamot-translator-tests/**/*.out",
@@ -171,9 +213,28 @@ class UploadArtifacts(YAMLRenderable):
     }
 
 
+class DownloadArtifacts(YAMLRenderable):
+  __slots__ = ()
+
+  def __init__(self, path, name=None, condition=None):
+    # Without a name, every artifact of the run is downloaded, each into a
+    # directory of its own under path.
+    self.fields = {
+        "name": "Download regression-tests artifacts",
+        "uses": "actions/download-artifact@v2",
+        "if": condition,
+        "with": {
+            "name": name,
+            "path": path,
+        },
+    }
+
+
 class BRT(list):
 
-  def __init__(self, jobid, tags,
+  def __init__(self,
+               jobid,
+               tags,
                working_directory='bergamot-translator-tests'):
     brt_id = 'brt_run'
     brt_failure = GitHubExpr("always() && {} == 'failure'".format(
@@ -201,19 +262,69 @@ class BRT(list):
 
 
 class ImportedSnippet(JobShellStep):
+  __slots__ = ('fpath', 'wrappers')
 
   def __init__(self, name, fpath, working_directory=None, condition=None):
-    contents = None
-    with open(fpath) as fp:
-      contents = fp.read().strip()
+    self.fpath = fpath
+    self.wrappers = ()
     super().__init__(
         name=name,
-        run=contents,
+        run='',
         working_directory=working_directory,
         condition=condition)
 
+  @property
+  def fields(self):
+    # Contents are read when the step is rendered, through the process-wide
+    # snippet cache, rather than once per construction. The node itself is
+    # left untouched.
+    contents = snippet_cache.load(self.fpath)
+    for wrapper in self.wrappers:
+      contents = wrapper(contents)
+    run = Snippet(contents) if '\n' in contents else contents
+    return {**self._fields, "run": run}
+
+  @fields.setter
+  def fields(self, fields):
+    YAMLRenderable.fields.fset(self, fields)
+
+  def wrapped(self, wrapper):
+    # Copy whose script is passed through wrapper once it is read, so the
+    # copy still tracks the file.
+    step = self.updated({})
+    step.wrappers = self.wrappers + (wrapper,)
+    return step
+
+
+def wrap_run(step, wrapper):
+  # step with its run: script passed through wrapper (a function of the
+  # script text); every other field is kept.
+  if isinstance(step, ImportedSnippet):
+    return step.wrapped(wrapper)
+  run = wrapper(str(step.fields["run"]))
+  return step.updated({"run": Snippet(run) if '\n' in run else run})
+
+
+def prefetch_snippets(*renderables, workers=8):
+  # Loads every ImportedSnippet reachable from renderables up front, using a
+  # thread pool, so rendering never waits on file I/O.
+  fpaths = set()
+  stack = list(renderables)
+  while stack:
+    node = stack.pop()
+    if isinstance(node, ImportedSnippet):
+      fpaths.add(node.fpath)
+    elif isinstance(node, YAMLRenderable):
+      stack.append(node.fields)
+    elif isinstance(node, list):
+      stack.extend(node)
+    elif isinstance(node, dict):
+      stack.extend(node.values())
+  snippet_cache.prefetch(fpaths, workers=workers)
+
 
 class HardFailBash(JobShellStep):
+  __slots__ = ()
 
   def __init__(self):
     super().__init__(
@@ -223,6 +334,7 @@ class HardFailBash(JobShellStep):
 
 
 class LogContext(YAMLRenderable):
+  __slots__ = ()
 
   def __init__(self, context):
     self.fields = {
@@ -236,6 +348,7 @@ class LogContext(YAMLRenderable):
 
 
 class Evaluate(YAMLRenderable):
+  __slots__ = ()
 
   def __init__(self, expr):
     self.fields = {
@@ -249,7 +362,7 @@ class Evaluate(YAMLRenderable):
 
 def RunIfFailed(job):
   return GitHubExpr("always() && {} == 'failure'".format(
-      "needs.{jobid}.result".format(jobid=job.id())))
+      "needs.{jobid}.result".format(jobid=job_id(job))))
 
 
 def Always(job):
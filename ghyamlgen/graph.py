@@ -0,0 +1,176 @@
+import heapq
+import sys
+from collections import namedtuple
+
+from .gh import needed
+
+
+class GraphError(ValueError):
+  pass
+
+
+class CycleError(GraphError):
+
+  def __init__(self, cycle):
+    super().__init__('needs cycle: {}'.format(' -> '.join(cycle)))
+    self.cycle = cycle
+
+
+CriticalPath = namedtuple(
+    'CriticalPath',
+    ['length', 'path', 'work', 'parallelism', 'width', 'start', 'slack'])
+
+
+class JobGraph:
+  # The needs: relation between the jobs of a workflow. Edges run from a job
+  # to the jobs that need it.
+
+  def __init__(self, jobs=()):
+    self.jobs = {}
+    for job in (jobs.values() if isinstance(jobs, dict) else jobs):
+      self.add(job)
+
+  @classmethod
+  def from_workflow(cls, workflow):
+    return cls(workflow.fields.get('jobs') or {})
+
+  def add(self, job, needs=()):
+    # Adds job, which may be given further upstream jobs to need.
+    if needs:
+      job = job.needs(*needs)
+    self.jobs[job.id()] = job
+    return job
+
+  def needs(self, jobid):
+    return needed(self.jobs[jobid])
+
+  def dependents(self, jobid):
+    return [j for j in self.jobs if jobid in self.needs(j)]
+
+  def edges(self):
+    return [(need, j) for j in self.jobs for need in self.needs(j)]
+
+  def validate(self):
+    for jobid in self.jobs:
+      for need in self.needs(jobid):
+        if need not in self.jobs:
+          raise GraphError('{} needs unknown job {}'.format(jobid, need))
+    self.topological_order()
+
+  def topological_order(self):
+    # Kahn's algorithm; among ready jobs, declaration order wins, so the
+    # order is stable across runs.
+    position = {jobid: i for i, jobid in enumerate(self.jobs)}
+    pending = {j: len(set(self.needs(j)) & set(self.jobs)) for j in self.jobs}
+    dependents = {j: [] for j in self.jobs}
+    for need, jobid in self.edges():
+      if need in dependents:
+        dependents[need].append(jobid)
+
+    ready = [(position[j], j) for j, count in pending.items() if count == 0]
+    heapq.heapify(ready)
+    order = []
+    while ready:
+      _, jobid = heapq.heappop(ready)
+      order.append(jobid)
+      for dependent in dependents[jobid]:
+        pending[dependent] -= 1
+        if pending[dependent] == 0:
+          heapq.heappush(ready, (position[dependent], dependent))
+
+    if len(order) < len(self.jobs):
+      raise CycleError(self._cycle(set(self.jobs) - set(order)))
+    return order
+
+  def _cycle(self, remaining):
+    # Walks needs from any job left over by the topological sort until a
+    # job repeats; every such job is on or behind a cycle.
+    jobid = next(j for j in self.jobs if j in remaining)
+    path = []
+    seen = {}
+    while jobid not in seen:
+      seen[jobid] = len(path)
+      path.append(jobid)
+      jobid = next(n for n in self.needs(jobid) if n in remaining)
+    return path[seen[jobid]:] + [jobid]
+
+  def levels(self):
+    # Groups jobs into stages: each stage only needs jobs of earlier stages,
+    # so the jobs of a stage can all run at once.
+    depth = {}
+    for jobid in self.topological_order():
+      needs = [n for n in self.needs(jobid) if n in self.jobs]
+      depth[jobid] = 1 + max((depth[n] for n in needs), default=-1)
+    stages = [[] for _ in range(max(depth.values(), default=-1) + 1)]
+    for jobid, d in depth.items():
+      stages[d].append(jobid)
+    return stages
+
+  def critical_path(self, durations=None, default=600.0):
+    # durations maps job ids to estimated seconds, or is a callable taking
+    # the job. Jobs start as soon as everything they need has finished.
+    def duration(jobid):
+      if callable(durations):
+        return durations(self.jobs[jobid])
+      return (durations or {}).get(jobid, default)
+
+    order = self.topological_order()
+    seconds = {j: duration(j) for j in order}
+    start = {}
+    finish = {}
+    via = {}
+    for jobid in order:
+      needs = [n for n in self.needs(jobid) if n in self.jobs]
+      start[jobid] = max((finish[n] for n in needs), default=0.0)
+      via[jobid] = max(needs, key=lambda n: finish[n], default=None)
+      finish[jobid] = start[jobid] + seconds[jobid]
+
+    length = max(finish.values(), default=0.0)
+    latest = {}
+    for jobid in reversed(order):
+      dependents = [d for d in self.dependents(jobid) if d in latest]
+      latest[jobid] = min((latest[d] for d in dependents), default=length)
+      latest[jobid] -= seconds[jobid]
+    slack = {j: latest[j] - start[j] for j in order}
+
+    path = []
+    jobid = max(order, key=lambda j: finish[j], default=None)
+    while jobid is not None:
+      path.append(jobid)
+      jobid = via[jobid]
+    path.reverse()
+
+    work = sum(seconds.values())
+    return CriticalPath(length, path, work, work / length if length else 0.0,
+                        _width(start, finish), start, slack)
+
+
+def _width(start, finish):
+  # The most jobs running at once when each starts as early as it can.
+  # A job finishing at t frees its runner before one starting at t.
+  events = sorted([(t, 1) for t in start.values()] +
+                  [(t, -1) for t in finish.values()])
+  width = running = 0
+  for _, delta in events:
+    running += delta
+    width = max(width, running)
+  return width
+
+
+def report(graph, critical, stream=sys.stdout):
+  write = lambda line='': stream.write(line + '\n')
+  write('== stages')
+  for number, stage in enumerate(graph.levels()):
+    write('{:>4}  {}'.format(number, ', '.join(stage)))
+  write()
+  write('== critical path: {:.1f} min'.format(critical.length / 60))
+  for jobid in critical.path:
+    write('  {:>8.1f}m  {}'.format(critical.start[jobid] / 60, jobid))
+  write()
+  write('total work {:.1f} min, average parallelism {:.2f}, peak {} job(s)'.
+        format(critical.work / 60, critical.parallelism, critical.width))
+  slack = [(j, s) for j, s in critical.slack.items() if s > 0]
+  if slack:
+    write('slack:')
+    for jobid, seconds in sorted(slack, key=lambda js: -js[1]):
+      write('  {:>8.1f}m  {}'.format(seconds / 60, jobid))
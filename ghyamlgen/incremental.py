@@ -0,0 +1,83 @@
+import json
+import os
+import sys
+
+from . import walk
+from .files import fingerprint, unchanged, write_atomic
+from .gh import ImportedSnippet
+
+MANIFEST_VERSION = 2
+
+PACKAGE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def snippet_paths(workflow):
+  return {
+      node.fpath
+      for node in walk(workflow)
+      if isinstance(node, ImportedSnippet)
+  }
+
+
+def module_paths(spec_path):
+  # Helper modules imported from the spec's own directory tree are inputs
+  # too. This over-approximates inside pool workers that loaded sibling
+  # specs' helpers before, which only costs a spurious rebuild.
+  root = os.path.dirname(os.path.abspath(spec_path)) + os.sep
+  paths = {os.path.abspath(spec_path)}
+  for module in list(sys.modules.values()):
+    fpath = getattr(module, '__file__', None)
+    if fpath and os.path.abspath(fpath).startswith(root):
+      paths.add(os.path.abspath(fpath))
+  return paths
+
+
+def package_paths():
+  # ghyamlgen's own sources shape every output as much as the spec does, so
+  # upgrading or editing the package invalidates each entry.
+  return {
+      os.path.join(PACKAGE_DIR, fname)
+      for fname in os.listdir(PACKAGE_DIR)
+      if fname.endswith('.py')
+  }
+
+
+class Manifest:
+
+  def __init__(self, path):
+    self.path = path
+    self.entries = {}
+    try:
+      with open(path) as fp:
+        data = json.load(fp)
+    except (OSError, ValueError):
+      data = None
+    if data and data.get('version') == MANIFEST_VERSION:
+      self.entries = data['specs']
+
+  @staticmethod
+  def key(spec, output_dir):
+    return '{}::{}'.format(os.path.abspath(spec),
+                           os.path.abspath(output_dir or os.path.dirname(spec)))
+
+  def up_to_date(self, spec, output_dir):
+    entry = self.entries.get(self.key(spec, output_dir))
+    if entry is None:
+      return False
+    records = list(entry['deps'].items()) + list(entry['outputs'].items())
+    return all(unchanged(path, record) for path, record in records)
+
+  def update(self, spec, output_dir, deps, outputs):
+    self.entries[self.key(spec, output_dir)] = {
+        'deps': {
+            path: fingerprint(path) for path in sorted(deps)
+        },
+        'outputs': {
+            os.path.abspath(path): fingerprint(path, digest)
+            for path, digest in outputs
+        },
+    }
+
+  def save(self):
+    data = {'version': MANIFEST_VERSION, 'specs': self.entries}
+    write_atomic(self.path, json.dumps(data, indent=2, sort_keys=True) + '\n')
@@ -0,0 +1,258 @@
+import itertools
+from collections import namedtuple
+
+from . import Group, YAMLRenderable, resolve
+from .expr import (ExpressionError, Literal, evaluate, fold, is_template, parse,
+                   parse_expression, parse_template, references, truthy,
+                   unparse, uses_status)
+from .gh import MatrixJob
+from .yml import GitHubExpr
+
+EliminationReport = namedtuple('EliminationReport', [
+    'job', 'entries', 'dead', 'dropped', 'simplified', 'jobs', 'saved', 'reason'
+])
+
+# Per-entry verdicts for a step's condition.
+DEAD = 'dead'
+LIVE = 'live'
+
+
+def expand_matrix(matrix):
+  # Expands a strategy.matrix into its concrete entries, following GitHub's
+  # rules for exclude and include. Returns None if the matrix is computed at
+  # runtime (e.g. fromJSON of a step output).
+  if not isinstance(matrix, dict):
+    return None
+  dims = {k: v for k, v in matrix.items() if k not in ('include', 'exclude')}
+  for values in dims.values():
+    if not isinstance(values, list):
+      return None
+
+  entries = []
+  if dims:
+    entries = [
+        dict(zip(dims, combination))
+        for combination in itertools.product(*dims.values())
+    ]
+    for rule in matrix.get('exclude') or []:
+      entries = [
+          e for e in entries if not all(e.get(k) == v for k, v in rule.items())
+      ]
+
+  originals = [dict(e) for e in entries]
+  for include in matrix.get('include') or []:
+    # An include extends every original combination it does not contradict
+    # on an original dimension; otherwise it becomes a combination of its own.
+    matched = False
+    for entry, original in zip(entries, originals):
+      if all(original.get(k, v) == v for k, v in include.items() if k in dims):
+        entry.update(include)
+        matched = True
+    if not matched:
+      entries.append(dict(include))
+  return entries
+
+
+def job_steps(job):
+  return list(Group(job.fields.get('steps')))
+
+
+def _condition(step):
+  fields = step.fields if isinstance(step, YAMLRenderable) else step
+  return fields.get('if')
+
+
+def classify(condition, entry):
+  # Returns DEAD, LIVE (the `if` can go) or the folded expression that still
+  # needs the runner.
+  original = parse_expression(condition)
+  folded = fold(original, {'matrix': entry})
+  if uses_status(original) and not uses_status(folded):
+    # Folding dropped the status function, so GitHub would add its implicit
+    # success() to what is left; always() keeps the step running after a
+    # failure as the original did.
+    if isinstance(folded, Literal):
+      return parse('always()') if truthy(folded.value) else DEAD
+    return parse('always() && ({})'.format(unparse(folded)))
+  if isinstance(folded, Literal):
+    return LIVE if truthy(folded.value) else DEAD
+  if uses_status(folded) and not any(references(folded)):
+    # A step that is false under every job status never runs.
+    statuses = ('success', 'failure', 'cancelled')
+    try:
+      if not any(truthy(evaluate(folded, {}, status)) for status in statuses):
+        return DEAD
+    except ExpressionError:
+      pass
+  return folded
+
+
+def _with_condition(step, verdict, original):
+  if verdict == LIVE:
+    condition = None
+  else:
+    condition = GitHubExpr(unparse(verdict))
+    if condition == original:
+      return step
+  if isinstance(step, YAMLRenderable):
+    return step.updated({'if': condition})
+  step = dict(step, **{'if': condition})
+  return {k: v for k, v in step.items() if v is not None}
+
+
+def _step_ids(value, condition=False):
+  # Ids of the steps value refers to, as steps.<id>; None for a reference
+  # whose id is only known at runtime.
+  if isinstance(value, dict):
+    for k, v in value.items():
+      yield from _step_ids(v, k == 'if')
+  elif isinstance(value, list):
+    for v in value:
+      yield from _step_ids(v)
+  elif isinstance(value, str) and (condition or is_template(value)):
+    try:
+      if condition:
+        nodes = [parse_expression(value)]
+      else:
+        nodes = [p for p in parse_template(value) if not isinstance(p, str)]
+    except ExpressionError:
+      return
+    for node in nodes:
+      for path in references(node):
+        if path[0] == 'steps':
+          yield path[1] if len(path) > 1 else None
+
+
+def _specialize(steps, verdicts, referenced=frozenset()):
+  # verdicts: step index -> verdict shared by every entry of the job. Dead
+  # steps whose id is referenced stay, as if: false: other conditions may
+  # test for their outcome being 'skipped', which a removed step no longer
+  # is.
+  specialized = []
+  dropped = simplified = 0
+  for index, step in enumerate(steps):
+    verdict = verdicts.get(index)
+    if verdict == DEAD:
+      fields = step.fields if isinstance(step, YAMLRenderable) else step
+      if fields.get('id') in referenced or None in referenced:
+        verdict = Literal(False)
+    if verdict is None:
+      specialized.append(step)
+    elif verdict == DEAD:
+      continue
+    else:
+      updated = _with_condition(step, verdict, _condition(step))
+      if updated is not step:
+        if verdict == LIVE:
+          dropped += 1
+        else:
+          simplified += 1
+      specialized.append(updated)
+  return specialized, dropped, simplified
+
+
+def _shared(verdicts):
+  # The verdict all entries agree on, or None when they disagree.
+  first = verdicts[0]
+  if all(v == first for v in verdicts[1:]):
+    return first
+  return None
+
+
+def verdict_table(steps, entries):
+  # step index -> [verdict per entry], for every step with a condition that
+  # can be parsed.
+  table = {}
+  for index, step in enumerate(steps):
+    condition = _condition(step)
+    if condition is None:
+      continue
+    try:
+      table[index] = [classify(condition, entry) for entry in entries]
+    except ExpressionError:
+      continue
+  return table
+
+
+def dead_steps(table, position):
+  return frozenset(
+      i for i, verdicts in table.items() if verdicts[position] == DEAD)
+
+
+def specialize_job(job, steps, table, entries, positions, jobid=None):
+  # Specializes job to the matrix entries at positions. Given a jobid, the
+  # result is a separate job whose matrix holds only those entries.
+  # Returns (job, steps removed, conditions dropped, conditions simplified).
+  verdicts = {}
+  for index, column in table.items():
+    shared = _shared([column[p] for p in positions])
+    if shared is not None:
+      verdicts[index] = shared
+  referenced = set(_step_ids(resolve(job.fields)))
+  specialized, dropped, simplified = _specialize(steps, verdicts, referenced)
+
+  fields = {'steps': specialized}
+  if jobid is not None:
+    strategy = job.fields.get('strategy') or {}
+    matrix = {'include': [entries[p] for p in positions]}
+    fields['strategy'] = dict(strategy, matrix=matrix)
+  specialized_job = job.updated(fields)
+  if jobid is not None:
+    specialized_job._id = jobid
+  return (specialized_job, len(steps) - len(specialized), dropped, simplified)
+
+
+def eliminate_dead_steps(job, split=False):
+  # Evaluates every step condition of a MatrixJob against each matrix entry.
+  # Steps dead for all entries are removed and conditions that fold the same
+  # way everywhere are dropped or simplified. With split=True, entries with
+  # different sets of dead steps are split into specialized MatrixJobs.
+  # Returns ({job id: job}, EliminationReport).
+  jobid = job.id()
+  strategy = job.fields.get('strategy') or {}
+  entries = expand_matrix(strategy.get('matrix'))
+  if not entries:
+    reason = 'matrix cannot be expanded statically'
+    return {jobid: job}, EliminationReport(jobid, 0, 0, 0, 0, 1, 0, reason)
+
+  steps = job_steps(job)
+  table = verdict_table(steps, entries)
+  groups = {}
+  if split:
+    for position in range(len(entries)):
+      groups.setdefault(dead_steps(table, position), []).append(position)
+  else:
+    groups[frozenset()] = list(range(len(entries)))
+
+  jobs = {}
+  removed = dropped = simplified = saved = 0
+  for number, positions in enumerate(groups.values()):
+    ident = None
+    if len(groups) > 1:
+      ident = '{}_{}'.format(jobid, number + 1)
+    specialized, r, d, s = specialize_job(job, steps, table, entries, positions,
+                                          ident)
+    jobs[specialized.id()] = specialized
+    removed += r
+    dropped += d
+    simplified += s
+    saved += r * len(positions)
+
+  report = EliminationReport(jobid, len(entries), removed, dropped, simplified,
+                             len(jobs), saved, None)
+  return jobs, report
+
+
+def eliminate_workflow(workflow, split=False):
+  # Applies eliminate_dead_steps to every MatrixJob of a workflow and returns
+  # the updated workflow along with one report per matrix job.
+  jobs = {}
+  reports = []
+  for jobid, job in (workflow.fields.get('jobs') or {}).items():
+    if isinstance(job, MatrixJob):
+      optimized, report = eliminate_dead_steps(job, split=split)
+      jobs.update(optimized)
+      reports.append(report)
+    else:
+      jobs[jobid] = job
+  return workflow.updated({'jobs': jobs}), reports
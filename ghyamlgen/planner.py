@@ -0,0 +1,195 @@
+import heapq
+import math
+from collections import namedtuple
+
+from .gh import MatrixJob
+from .optimize import (DEAD, dead_steps, expand_matrix, job_steps,
+                       specialize_job, verdict_table)
+
+# Billing multipliers for GitHub-hosted runners, by runs-on prefix.
+RUNNER_MULTIPLIERS = {'ubuntu': 1, 'windows': 2, 'macos': 10}
+
+CostModel = namedtuple(
+    'CostModel',
+    [
+        'durations',  # step name -> estimated seconds
+        'default',  # seconds for steps without an estimate
+        'startup',  # seconds to provision a runner and check out
+        'skipped',  # seconds a runner spends on a step whose if: is false
+        'max_parallel',  # concurrent runners available to the workflow
+    ],
+    defaults=(None, 60.0, 30.0, 1.0, 20))
+
+Estimate = namedtuple('Estimate',
+                      ['kind', 'groups', 'minutes', 'wall', 'skipped', 'jobs'])
+
+Plan = namedtuple(
+    'Plan', ['job', 'choice', 'candidates', 'variants', 'divergence', 'jobs'])
+
+
+def _multiplier(entry):
+  runs_on = str(entry.get('os', ''))
+  for prefix, multiplier in RUNNER_MULTIPLIERS.items():
+    if runs_on.startswith(prefix):
+      return multiplier
+  return 1
+
+
+def _duration(step, model):
+  fields = step if isinstance(step, dict) else step.fields
+  return (model.durations or {}).get(fields.get('name'), model.default)
+
+
+def _makespan(seconds, max_parallel):
+  # Longest-processing-time-first onto max_parallel runners.
+  runners = [0.0] * min(max_parallel, len(seconds))
+  for duration in sorted(seconds, reverse=True):
+    heapq.heappush(runners, heapq.heappop(runners) + duration)
+  return max(runners, default=0.0)
+
+
+def estimate(kind, groups, steps, table, entries, model):
+  # Runner minutes are billed per job, rounded up to the minute and scaled
+  # by the OS multiplier. A step whose condition is false for an entry still
+  # costs that entry `skipped` seconds unless its group removes it outright.
+  minutes = 0
+  skipped = 0
+  seconds = []
+  for positions in groups:
+    removed = set.intersection(*(set(dead_steps(table, p)) for p in positions))
+    for position in positions:
+      total = model.startup
+      for index, step in enumerate(steps):
+        if index in removed:
+          continue
+        if table.get(index, [None] * len(entries))[position] == DEAD:
+          total += model.skipped
+          skipped += 1
+        else:
+          total += _duration(step, model)
+      seconds.append(total)
+      minutes += math.ceil(total / 60) * _multiplier(entries[position])
+  wall = _makespan(seconds, model.max_parallel) / 60
+  return Estimate(kind, groups, minutes, wall, skipped, len(groups))
+
+
+def candidates(steps, table, entries, model):
+  positions = list(range(len(entries)))
+  by_dead = {}
+  for position in positions:
+    by_dead.setdefault(dead_steps(table, position), []).append(position)
+
+  layouts = [('matrix', [positions])]
+  if len(by_dead) > 1:
+    layouts.append(('split', list(by_dead.values())))
+  if len(entries) > max(len(by_dead), 1):
+    layouts.append(('standalone', [[p] for p in positions]))
+  return [
+      estimate(kind, groups, steps, table, entries, model)
+      for kind, groups in layouts
+  ]
+
+
+def _rank(estimate):
+  return estimate.minutes, estimate.wall, estimate.jobs
+
+
+def _jobid(job, kind, number, entries, positions):
+  if kind == 'standalone':
+    identifier = entries[positions[0]].get('identifier')
+    if identifier:
+      return str(identifier)
+  return '{}_{}'.format(job.id(), number + 1)
+
+
+def plan(job, model=CostModel()):
+  # Chooses between keeping a MatrixJob whole, splitting it into smaller
+  # matrices of entries that run the same steps, or one job per entry. The
+  # cheapest layout in billed runner minutes wins, then wall-clock time,
+  # then the fewest jobs.
+  strategy = job.fields.get('strategy') or {}
+  entries = expand_matrix(strategy.get('matrix'))
+  if not entries:
+    return Plan(job.id(), None, [], 0, 0.0, {job.id(): job})
+
+  steps = job_steps(job)
+  table = verdict_table(steps, entries)
+  estimates = candidates(steps, table, entries, model)
+  choice = min(estimates, key=_rank)
+
+  dead_sets = [dead_steps(table, p) for p in range(len(entries))]
+  dead = sum(len(d) for d in dead_sets)
+  divergence = dead / max(len(steps) * len(entries), 1)
+
+  jobs = {}
+  for number, positions in enumerate(choice.groups):
+    ident = None
+    if choice.kind != 'matrix':
+      ident = _jobid(job, choice.kind, number, entries, positions)
+    specialized = specialize_job(job, steps, table, entries, positions,
+                                 ident)[0]
+    jobs[specialized.id()] = specialized
+  return Plan(job.id(), choice, estimates, len(set(dead_sets)), divergence,
+              jobs)
+
+
+def explain(plan):
+  if plan.choice is None:
+    return '{}: matrix cannot be expanded statically, kept as is'.format(
+        plan.job)
+  entries = len(plan.candidates[0].groups[0])
+  lines = [
+      '{}: {} entries, {} distinct step list(s), {:.0%} of step runs dead'.
+      format(plan.job, entries, plan.variants, plan.divergence)
+  ]
+  for e in plan.candidates:
+    lines.append(
+        '  {:<10}  {:>5} billed min  {:>7.1f} min wall  {:>3} skipped  '
+        '{:>3} job(s){}'.format(e.kind, e.minutes, e.wall, e.skipped, e.jobs,
+                                '  <- chosen' if e is plan.choice else ''))
+  others = [e for e in plan.candidates if e is not plan.choice]
+  if not others:
+    reason = 'every entry runs the same steps'
+  else:
+    # Explain the choice against the runner-up.
+    other = min(others, key=_rank)
+    if other.minutes > plan.choice.minutes:
+      reason = '{} fewer billed runner minutes than {}'.format(
+          other.minutes - plan.choice.minutes, other.kind)
+    elif other.wall > plan.choice.wall:
+      reason = 'same minutes as {}, {:.1f}s less wall-clock time'.format(
+          other.kind, (other.wall - plan.choice.wall) * 60)
+    else:
+      reason = 'same cost as {}, fewer jobs'.format(other.kind)
+  lines.append('  chose {}: {}'.format(plan.choice.kind, reason))
+  return '\n'.join(lines)
+
+
+def job_duration(job, model=CostModel()):
+  # Estimated wall-clock seconds of a job; for a MatrixJob, until its last
+  # entry finishes.
+  steps = job_steps(job)
+  if isinstance(job, MatrixJob):
+    strategy = job.fields.get('strategy') or {}
+    entries = expand_matrix(strategy.get('matrix'))
+    if entries:
+      table = verdict_table(steps, entries)
+      positions = list(range(len(entries)))
+      return estimate('matrix', [positions], steps, table, entries,
+                      model).wall * 60
+  return model.startup + sum(_duration(step, model) for step in steps)
+
+
+def plan_workflow(workflow, model=CostModel()):
+  # Plans every MatrixJob of a workflow; returns the updated workflow and the
+  # plans made.
+  jobs = {}
+  plans = []
+  for jobid, job in (workflow.fields.get('jobs') or {}).items():
+    if isinstance(job, MatrixJob):
+      p = plan(job, model)
+      jobs.update(p.jobs)
+      plans.append(p)
+    else:
+      jobs[jobid] = job
+  return workflow.updated({'jobs': jobs}), plans
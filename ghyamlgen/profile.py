@@ -0,0 +1,232 @@
+import atexit
+import contextlib
+import heapq
+import itertools
+import os
+import sys
+import time
+from collections import Counter, defaultdict
+
+from . import YAMLRenderable, Group
+from .yml import _representables
+
+current = None
+
+
+def label(node):
+  # Reads the stored fields only: computed ones, such as a Group's flattened
+  # steps or an ImportedSnippet's file, would cost more than the node.
+  name = type(node).__name__
+  fields = getattr(node, '_fields', None)
+  ident = getattr(node, '_id', None)
+  if ident is None and isinstance(fields, dict):
+    ident = fields.get('name')
+  return '{}({})'.format(name, ident) if ident else name
+
+
+class Profiler:
+
+  def __init__(self, largest=10):
+    self.largest = largest
+    self.counts = defaultdict(Counter)
+    # phase -> class name -> [calls, inclusive seconds, exclusive seconds]
+    self.timings = defaultdict(lambda: defaultdict(lambda: [0, 0.0, 0.0]))
+    self.representers = defaultdict(lambda: [0, 0.0])
+    self._subtrees = []
+    self._subtree_phase = None
+    self._sequence = itertools.count()
+    self._children = []
+    self._nodes = 0
+
+  def enter(self):
+    self._children.append(0.0)
+    return time.perf_counter(), self._nodes
+
+  def leave(self, phase, node, token):
+    start, nodes = token
+    elapsed = time.perf_counter() - start
+    children = self._children.pop()
+    if self._children:
+      self._children[-1] += elapsed
+
+    stats = self.timings[phase][type(node).__name__]
+    stats[0] += 1
+    stats[1] += elapsed
+    stats[2] += elapsed - children
+
+    # Subtree sizes come from whichever phase runs first, so a resolve()
+    # followed by a dump of the same tree does not list everything twice.
+    if self._subtree_phase is None:
+      self._subtree_phase = phase
+    if phase == self._subtree_phase:
+      self._subtree(self._nodes - nodes, label(node))
+
+  def _subtree(self, size, name):
+    entry = (size, next(self._sequence), name)
+    if len(self._subtrees) < self.largest:
+      heapq.heappush(self._subtrees, entry)
+    else:
+      heapq.heappushpop(self._subtrees, entry)
+
+  def count(self, phase, node):
+    self._nodes += 1
+    self.counts[phase][type(node).__name__] += 1
+
+  def resolve(self, cls):
+    self.count('resolve', cls)
+    if isinstance(cls, YAMLRenderable):
+      token = self.enter()
+      native = self.resolve(cls.fields)
+      self.leave('resolve', cls, token)
+      return native
+
+    if isinstance(cls, list):
+      native = []
+      for v in cls:
+        if isinstance(v, Group):
+          native.extend(self.resolve(v))
+        elif v is not None:
+          native.append(self.resolve(v))
+      return native
+
+    if isinstance(cls, dict):
+      return {k: self.resolve(v) for k, v in cls.items() if v is not None}
+
+    return cls
+
+  def wrap_dumper(self, Dumper):
+    # Subclass of Dumper whose custom representers are timed.
+    profiled = type('Profiled' + Dumper.__name__, (Dumper,), {})
+    for cls in _representables:
+      representer = Dumper.yaml_representers.get(cls)
+      if representer is not None:
+        profiled.add_representer(cls, self._timed(cls.__name__, representer))
+    return profiled
+
+  def _timed(self, name, representer):
+
+    def timed(dumper, data):
+      start = time.perf_counter()
+      try:
+        return representer(dumper, data)
+      finally:
+        stats = self.representers[name]
+        stats[0] += 1
+        stats[1] += time.perf_counter() - start
+
+    return timed
+
+  def snapshot(self):
+    # The collected data as plain containers, which pickle; merge() adds
+    # them to another profiler, e.g. one from a worker process.
+    return {
+        'counts': {
+            phase: dict(c) for phase, c in self.counts.items()
+        },
+        'timings': {
+            phase: {
+                name: list(stats) for name, stats in timings.items()
+            } for phase, timings in self.timings.items()
+        },
+        'representers': {
+            name: list(stats) for name, stats in self.representers.items()
+        },
+        'subtree_phase': self._subtree_phase,
+        'subtrees': self.largest_subtrees(),
+    }
+
+  def merge(self, snapshot):
+    for phase, counts in snapshot['counts'].items():
+      self.counts[phase].update(counts)
+    for phase, timings in snapshot['timings'].items():
+      for name, stats in timings.items():
+        total = self.timings[phase][name]
+        for i, value in enumerate(stats):
+          total[i] += value
+    for name, stats in snapshot['representers'].items():
+      total = self.representers[name]
+      for i, value in enumerate(stats):
+        total[i] += value
+    if self._subtree_phase is None:
+      self._subtree_phase = snapshot['subtree_phase']
+    if snapshot['subtree_phase'] == self._subtree_phase:
+      for size, name in snapshot['subtrees']:
+        self._subtree(size, name)
+
+  def largest_subtrees(self):
+    return [
+        (size, name) for size, _, name in sorted(self._subtrees, reverse=True)
+    ]
+
+  def report(self, stream=sys.stderr):
+    write = lambda line='': stream.write(line + '\n')
+    for phase, counts in self.counts.items():
+      write('== {}: node counts'.format(phase))
+      for name, count in counts.most_common():
+        write('{:>10}  {}'.format(count, name))
+      write()
+
+    for phase, timings in self.timings.items():
+      write('== {}: time per renderable class'.format(phase))
+      write('{:>10}  {:>10}  {:>10}  {}'.format('calls', 'total', 'self',
+                                                'class'))
+      for name, (calls, total, own) in sorted(timings.items(),
+                                              key=lambda kv: -kv[1][2]):
+        write('{:>10}  {:>9.4f}s  {:>9.4f}s  {}'.format(calls, total, own,
+                                                        name))
+      write()
+
+    if self.representers:
+      write('== emit: time in custom representers')
+      for name, (calls, total) in sorted(self.representers.items(),
+                                         key=lambda kv: -kv[1][1]):
+        write('{:>10}  {:>9.4f}s  {}'.format(calls, total, name))
+      write()
+
+    write('== largest subtrees (nodes)')
+    for size, name in self.largest_subtrees():
+      write('{:>10}  {}'.format(size, name))
+
+
+def enable(profiler=None):
+  global current
+  current = profiler or Profiler()
+  return current
+
+
+def disable():
+  global current
+  profiler, current = current, None
+  return profiler
+
+
+@contextlib.contextmanager
+def profiling(profiler=None):
+  previous = current
+  profiler = enable(profiler)
+  try:
+    yield profiler
+  finally:
+    if previous is not None:
+      enable(previous)
+    else:
+      disable()
+
+
+def _report_at_exit(destination):
+  if current is None:
+    return
+  if destination in ('1', '-', 'stderr'):
+    current.report(sys.stderr)
+  else:
+    with open(destination, 'w') as fp:
+      current.report(fp)
+
+
+# GHYAMLGEN_PROFILE=1 reports to stderr when the process exits; any other
+# value is taken as the path to write the report to. Worker processes of
+# batch.render_all() disable it and send their profiles to the parent, which
+# reports them all.
+if os.environ.get('GHYAMLGEN_PROFILE'):
+  enable()
+  atexit.register(_report_at_exit, os.environ['GHYAMLGEN_PROFILE'])
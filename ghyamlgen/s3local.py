@@ -0,0 +1,138 @@
+import argparse
+import hashlib
+import http.server
+import os
+import sys
+import urllib.parse
+from xml.sax.saxutils import escape
+
+# A minimal S3-compatible object store for trying out the S3 compiler-cache
+# backend locally: path-style GET, HEAD, PUT and DELETE of objects, plus
+# ListObjectsV2. Buckets are created on first use and requests are not
+# authenticated.
+
+
+class Handler(http.server.BaseHTTPRequestHandler):
+  protocol_version = 'HTTP/1.1'
+  root = None
+
+  def log_message(self, format, *args):
+    if self.server.verbose:
+      super().log_message(format, *args)
+
+  def _target(self):
+    url = urllib.parse.urlsplit(self.path)
+    bucket, _, key = urllib.parse.unquote(url.path).lstrip('/').partition('/')
+    if not bucket or '..' in bucket.split('/') + key.split('/'):
+      return None, None, url
+    return bucket, key, url
+
+  def _path(self, bucket, key):
+    return os.path.join(self.root, bucket, *key.split('/'))
+
+  def _reply(self, status, body=b'', headers=None):
+    self.send_response(status)
+    for name, value in (headers or {}).items():
+      self.send_header(name, value)
+    self.send_header('Content-Length', str(len(body)))
+    self.end_headers()
+    if self.command != 'HEAD':
+      self.wfile.write(body)
+
+  def _missing(self, code='NoSuchKey'):
+    body = ('<?xml version="1.0" encoding="UTF-8"?>'
+            '<Error><Code>{}</Code></Error>'.format(code)).encode()
+    self._reply(404, body, {'Content-Type': 'application/xml'})
+
+  def do_GET(self):
+    bucket, key, url = self._target()
+    if bucket is None:
+      return self._missing('NoSuchBucket')
+    if not key:
+      return self._list(bucket, urllib.parse.parse_qs(url.query))
+    path = self._path(bucket, key)
+    if not os.path.isfile(path):
+      return self._missing()
+    with open(path, 'rb') as fp:
+      body = fp.read()
+    self._reply(
+        200, body, {
+            'Content-Type': 'application/octet-stream',
+            'ETag': '"{}"'.format(hashlib.md5(body).hexdigest()),
+        })
+
+  do_HEAD = do_GET
+
+  def do_PUT(self):
+    bucket, key, _ = self._target()
+    if bucket is None:
+      return self._missing('NoSuchBucket')
+    length = int(self.headers.get('Content-Length') or 0)
+    body = self.rfile.read(length)
+    if key:
+      path = self._path(bucket, key)
+      os.makedirs(os.path.dirname(path), exist_ok=True)
+      with open(path + '.part', 'wb') as fp:
+        fp.write(body)
+      os.replace(path + '.part', path)
+    else:
+      os.makedirs(os.path.join(self.root, bucket), exist_ok=True)
+    self._reply(200, b'',
+                {'ETag': '"{}"'.format(hashlib.md5(body).hexdigest())})
+
+  def do_DELETE(self):
+    bucket, key, _ = self._target()
+    if bucket is not None and key and os.path.isfile(self._path(bucket, key)):
+      os.remove(self._path(bucket, key))
+    self._reply(204)
+
+  def _list(self, bucket, query):
+    prefix = query.get('prefix', [''])[0]
+    base = os.path.join(self.root, bucket)
+    keys = []
+    for directory, _, fnames in os.walk(base):
+      for fname in fnames:
+        key = os.path.relpath(os.path.join(directory, fname), base)
+        key = key.replace(os.sep, '/')
+        if key.startswith(prefix) and not key.endswith('.part'):
+          keys.append(key)
+    contents = ''.join(
+        '<Contents><Key>{}</Key><Size>{}</Size></Contents>'.format(
+            escape(key), os.path.getsize(self._path(bucket, key)))
+        for key in sorted(keys))
+    body = ('<?xml version="1.0" encoding="UTF-8"?>'
+            '<ListBucketResult><Name>{}</Name><Prefix>{}</Prefix>'
+            '<KeyCount>{}</KeyCount><IsTruncated>false</IsTruncated>{}'
+            '</ListBucketResult>'.format(escape(bucket), escape(prefix),
+                                         len(keys), contents)).encode()
+    self._reply(200, body, {'Content-Type': 'application/xml'})
+
+
+def serve(root, host='127.0.0.1', port=9000, verbose=False):
+  handler = type('Handler', (Handler,), {'root': os.path.abspath(root)})
+  server = http.server.ThreadingHTTPServer((host, port), handler)
+  server.verbose = verbose
+  return server
+
+
+def main(argv=None):
+  parser = argparse.ArgumentParser(
+      prog='python -m ghyamlgen.s3local',
+      description='Serve a local S3-compatible stand-in for sccache')
+  parser.add_argument('root', help='Directory to keep buckets in')
+  parser.add_argument('--host', default='127.0.0.1')
+  parser.add_argument('--port', type=int, default=9000)
+  parser.add_argument('-v', '--verbose', action='store_true')
+  args = parser.parse_args(argv)
+  server = serve(args.root, args.host, args.port, args.verbose)
+  sys.stderr.write('Serving {} on http://{}:{}\n'.format(
+      args.root, args.host, server.server_address[1]))
+  try:
+    server.serve_forever()
+  except KeyboardInterrupt:
+    pass
+  return 0
+
+
+if __name__ == '__main__':
+  sys.exit(main())
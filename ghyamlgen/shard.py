@@ -0,0 +1,214 @@
+import heapq
+import json
+import os
+import re
+import statistics
+from collections import namedtuple
+
+from . import GitHubExpr, GitHubMapping, Group, Snippet
+from .expr import render_template
+from .gh import (BRT, Always, DownloadArtifacts, Job, JobShellStep,
+                 UploadArtifacts)
+from .optimize import expand_matrix
+
+# Splits the BRT regression suite across matrix entries. Each shard runs
+# run_brt.sh on its own list of test files, either fixed at generation time
+# (balanced on durations recorded by earlier runs) or picked round-robin on
+# the runner when no test list is known. A fan-in job merges the logs of all
+# shards and carries their combined pass/fail status.
+
+RUN_LOG = 'brt-run.log'
+DEFAULT_SECONDS = 60.0
+
+Shard = namedtuple('Shard', ['tests', 'seconds'])
+
+# run_brt.sh prints "Running <test> ... OK" followed by "Test took
+# HH:MM:SS.sss"; previous.log lists failed tests as "  - <test>".
+_RUNNING = re.compile(r'Running (\S+\.sh)')
+_TOOK = re.compile(r'took (?:(\d+):)?(\d+):(\d+(?:\.\d+)?)s?')
+_LISTED = re.compile(r'^\s*-\s*(\S+\.sh)\s*$')
+
+
+def parse_log(text):
+  # Returns {test: seconds}; tests listed without a timing map to None.
+  durations = {}
+  test = None
+  for line in text.splitlines():
+    running = _RUNNING.search(line)
+    if running:
+      test = running.group(1)
+      durations.setdefault(test, None)
+    took = _TOOK.search(line)
+    if took and test is not None:
+      hours, minutes, seconds = took.groups()
+      durations[test] = (int(hours or 0) * 3600 + int(minutes) * 60 +
+                         float(seconds))
+      test = None
+    listed = _LISTED.match(line)
+    if listed:
+      durations.setdefault(listed.group(1), None)
+  return durations
+
+
+def _log_files(paths):
+  for path in paths:
+    if not os.path.isdir(path):
+      yield path
+      continue
+    for root, _, fnames in os.walk(path):
+      for fname in sorted(fnames):
+        if fname in (RUN_LOG, 'previous.log'):
+          yield os.path.join(root, fname)
+
+
+def load_durations(*paths):
+  # Reads run logs and previous.log files, directories of downloaded
+  # artifacts holding them, or a JSON file written by save_durations(). A
+  # test timed by several runs gets the mean.
+  timings = {}
+  for fpath in _log_files(paths):
+    with open(fpath, errors='replace') as fp:
+      if fpath.endswith('.json'):
+        durations = json.load(fp)
+      else:
+        durations = parse_log(fp.read())
+      for test, seconds in durations.items():
+        timings.setdefault(test, [])
+        if seconds is not None:
+          timings[test].append(seconds)
+  return {
+      test: statistics.mean(seconds) if seconds else None
+      for test, seconds in timings.items()
+  }
+
+
+def save_durations(path, durations):
+  with open(path, 'w') as fp:
+    json.dump(durations, fp, indent=2, sort_keys=True)
+
+
+def balance(tests, durations, shards):
+  # Longest-processing-time-first: the slowest remaining test goes to the
+  # least loaded shard. Tests without a timing are assumed to take the
+  # median of the known ones.
+  known = [s for s in durations.values() if s is not None]
+  fallback = statistics.median(known) if known else DEFAULT_SECONDS
+  cost = lambda test: durations.get(test) or fallback
+
+  heap = [(0.0, i, []) for i in range(shards)]
+  for test in sorted(set(tests), key=lambda t: (-cost(t), t)):
+    seconds, i, assigned = heapq.heappop(heap)
+    assigned.append(test)
+    heapq.heappush(heap, (seconds + cost(test), i, assigned))
+  return [
+      Shard(sorted(assigned), seconds)
+      for seconds, _, assigned in sorted(heap, key=lambda s: s[1])
+  ]
+
+
+def shard_matrix(matrix, shards):
+  # Multiplies every entry of matrix by the shards, given as a count (tests
+  # split on the runner) or as balanced Shards. Entries gain brt_shard
+  # (1-based) and brt_tests, and their names say which shard they are.
+  entries = expand_matrix(matrix)
+  if entries is None:
+    raise ValueError('matrix cannot be expanded statically')
+  if isinstance(shards, int):
+    shards = [Shard([], None)] * shards
+
+  include = []
+  for entry in entries or [{}]:
+    for number, shard in enumerate(shards, start=1):
+      sharded = dict(entry, brt_shard=number, brt_tests=' '.join(shard.tests))
+      if 'name' in entry:
+        sharded['name'] = '{} (BRT {}/{})'.format(entry['name'], number,
+                                                  len(shards))
+      include.append(sharded)
+  return {"include": include}
+
+
+class ShardedBRT(list):
+  # The steps of BRT for a job whose matrix came from shard_matrix(). Test
+  # output is also written to brt-run.log so later runs can balance on it.
+
+  def __init__(self,
+               jobid,
+               tags,
+               shards,
+               working_directory='bergamot-translator-tests'):
+    matrix = lambda key: GitHubExpr(GitHubMapping(key, context='matrix'))
+    count = shards if isinstance(shards, int) else len(shards)
+    install, run, print_logs, upload = BRT(jobid, tags, working_directory)
+    command = '\n'.join([
+        'set -o pipefail',
+        'TESTS="{}"'.format(matrix('brt_tests')),
+        'if [ -z "$TESTS" ]; then',
+        "  TESTS=$(find tests -name 'test_*.sh' | sort"
+        " | awk -v n={} -v i={} 'NR % n == i % n')".format(
+            count, matrix('brt_shard')),
+        'fi',
+        '[ -n "$TESTS" ] || { echo "No tests in this shard"; exit 0; }',
+        'MARIAN=../build ./run_brt.sh {} $TESTS 2>&1 | tee {}'.format(
+            tags, RUN_LOG),
+    ])
+    identifier = '{}-{}'.format(jobid, matrix('brt_shard'))
+    super().__init__([
+        install,
+        run.updated({"run": Snippet(command)}),
+        print_logs,
+        UploadArtifacts(identifier, condition=upload.fields["if"]),
+    ])
+
+
+def shard_artifacts(job):
+  # Names of the BRT artifacts that the matrix entries of job upload.
+  matrix = (job.fields.get('strategy') or {}).get('matrix')
+  entries = [] if matrix is None else expand_matrix(matrix)
+  if entries is None:
+    raise ValueError('matrix of {} cannot be expanded statically'.format(
+        job.id()))
+  names = []
+  for step in Group(job.fields.get('steps')):
+    if not isinstance(step, UploadArtifacts):
+      continue
+    template = str(step.fields['with']['name'])
+    for entry in entries or [{}]:
+      name = render_template(template, {'matrix': entry})
+      if name not in names:
+        names.append(name)
+  return names
+
+
+def fan_in(job, runs_on='ubuntu-latest', directory='brt-shards'):
+  # A job that waits for every shard of job, merges their logs into one
+  # artifact and fails unless all shards passed. Only the shards' own
+  # artifacts are downloaded, each by name; a shard that failed before
+  # running its tests uploaded nothing, so a missing artifact is not an
+  # error.
+  merged = '{}-merged'.format(directory)
+  result = GitHubExpr('needs.{}.result'.format(job.id()))
+  downloads = [
+      DownloadArtifacts(os.path.join(directory, name),
+                        name=name).updated({"continue-on-error": True})
+      for name in shard_artifacts(job)
+  ]
+  steps = downloads + [
+      JobShellStep(
+          name="Merge BRT shard logs",
+          run='\n'.join([
+              'mkdir -p {} {}'.format(directory, merged),
+              "find {} -name previous.log -exec cat {{}} + > {}/previous.log".
+              format(directory, merged),
+              "find {} -name {} -exec cat {{}} + > {}/{}".format(
+                  directory, RUN_LOG, merged, RUN_LOG),
+              'cat {}/previous.log'.format(merged),
+          ])),
+      UploadArtifacts('{}-merged'.format(job.id()), path=merged),
+      JobShellStep(name="Check BRT shards",
+                   run='test "{}" = success'.format(result)),
+  ]
+  merge = Job(id='{}_brt'.format(job.id()),
+              name='Merge regression-tests (BRT)',
+              runs_on=runs_on,
+              steps=steps)
+  return merge.needs(job, OpExpr=Always)
@@ -0,0 +1,57 @@
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from .cache import CacheInfo
+
+
+class SnippetCache:
+
+  def __init__(self, maxsize=512):
+    self.maxsize = maxsize
+    self._entries = OrderedDict()
+    self._lock = threading.Lock()
+    self._hits = 0
+    self._misses = 0
+
+  def cache_info(self):
+    return CacheInfo(self._hits, self._misses, self.maxsize, len(self._entries))
+
+  def cache_clear(self):
+    with self._lock:
+      self._entries.clear()
+      self._hits = 0
+      self._misses = 0
+
+  def load(self, fpath):
+    # Entries are validated against (mtime, size) on every lookup, so an
+    # edited snippet is picked up by the next render in a long-lived process.
+    key = os.path.abspath(fpath)
+    st = os.stat(key)
+    stamp = (st.st_mtime_ns, st.st_size)
+    with self._lock:
+      entry = self._entries.get(key)
+      if entry is not None and entry[0] == stamp:
+        self._entries.move_to_end(key)
+        self._hits += 1
+        return entry[1]
+
+    with open(key) as fp:
+      contents = fp.read().strip()
+
+    with self._lock:
+      self._misses += 1
+      self._entries[key] = (stamp, contents)
+      self._entries.move_to_end(key)
+      while len(self._entries) > self.maxsize:
+        self._entries.popitem(last=False)
+    return contents
+
+  def prefetch(self, fpaths, workers=8):
+    fpaths = sorted(set(fpaths))
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+      list(executor.map(self.load, fpaths))
+
+
+snippet_cache = SnippetCache()
@@ -0,0 +1,238 @@
+import functools
+import json
+import os
+import statistics
+
+from . import GitHubExpr, Group, YAMLRenderable
+from .gh import JobShellStep, wrap_run
+
+# Opt-in instrumentation of generated jobs. instrument(job) runs every shell
+# step under a wrapper that records its wall time, peak RSS and exit status,
+# and adds a final step that writes the job's records to step-timings.json
+# (uploaded as an artifact) and to the job summary. `ghyamlgen timings`
+# merges downloaded records into a duration database, which durations()
+# turns into step estimates for CostModel.
+
+TIMINGS_FILE = 'step-timings.json'
+DEFAULT_IDENTIFIER = '${{ github.job }}-${{ strategy.job-index }}'
+SAMPLES = 50  # recent samples kept per step in the database
+
+_RECORDS = '$RUNNER_TEMP/ghyamlgen-step-timings'
+_DELIMITER = 'GHYAMLGEN_STEP_EOF'
+
+# How GitHub runs each shell; instrumented steps run their script the same
+# way. Steps in other shells are left alone.
+_SHELLS = {
+    None: 'bash -e',
+    'bash': 'bash --noprofile --norc -eo pipefail',
+    'sh': 'sh -e',
+}
+
+# ru_maxrss is in KiB on Linux and in bytes on macOS.
+_RUSAGE = '\n'.join([
+    "python3 -c 'import resource, subprocess, sys",
+    'status = subprocess.call(sys.argv[2:])',
+    'rss = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss',
+    'rss = rss // 1024 if sys.platform == "darwin" else rss',
+    'open(sys.argv[1], "w").write(str(rss))',
+    "sys.exit(128 - status if status < 0 else status)' \\",
+])
+
+
+def _literal(text):
+  # text as a JSON string inside single quotes, with ${{ escaped so GitHub
+  # leaves the step name as written in the spec.
+  encoded = json.dumps(text).replace('${{', '\\u0024{{')
+  return "'{}'".format(encoded.replace("'", "'\\''"))
+
+
+def _timed(step):
+  # Only run: changes, so env:, timeout-minutes and the like are kept, and an
+  # ImportedSnippet stays one.
+  fields = step.fields
+  inner = _SHELLS[fields.get("shell")]
+  name = str(fields.get("name") or '')
+  return wrap_run(step, functools.partial(_timed_script, name, inner))
+
+
+def _timed_script(name, inner, script):
+  return '\n'.join([
+      'STEP_SCRIPT=$(mktemp)',
+      "cat > \"$STEP_SCRIPT\" << '{}'".format(_DELIMITER),
+      script,
+      _DELIMITER,
+      'STEP_STATUS=0',
+      'STEP_RSS_KIB=0',
+      'STEP_START=$(date +%s)',
+      'if command -v python3 > /dev/null; then',
+      _RUSAGE,
+      '    "$STEP_SCRIPT.rss" {} "$STEP_SCRIPT" || STEP_STATUS=$?'.format(
+          inner),
+      '  STEP_RSS_KIB=$(cat "$STEP_SCRIPT.rss" 2> /dev/null || echo 0)',
+      'else',
+      '  {} "$STEP_SCRIPT" || STEP_STATUS=$?'.format(inner),
+      'fi',
+      'STEP_SECONDS=$(($(date +%s) - STEP_START))',
+      'printf \'{{"step": %s, "seconds": %d, "max_rss_kib": %d, '
+      '"exit_status": %d}}\\n\' {} "$STEP_SECONDS" "$STEP_RSS_KIB" '
+      '"$STEP_STATUS" >> "{}.jsonl"'.format(_literal(name), _RECORDS),
+      'printf \'| %s | %d | %d | %d |\\n\' {} "$STEP_SECONDS" '
+      '"$((STEP_RSS_KIB / 1024))" "$STEP_STATUS" >> "{}.md"'.format(
+          "'{}'".format(name.replace("'", "'\\''")), _RECORDS),
+      'exit $STEP_STATUS',
+  ])
+
+
+class PublishTimings(JobShellStep):
+  __slots__ = ()
+
+  def __init__(self, identifier):
+    super().__init__(
+        name="Publish step timings",
+        condition=GitHubExpr('always()'),
+        shell="bash",
+        run='\n'.join([
+            'touch "{0}.jsonl" "{0}.md"'.format(_RECORDS),
+            '{',
+            '  echo "{"',
+            '  echo "  \\"job\\": \\"$GITHUB_JOB\\","',
+            '  echo "  \\"identifier\\": \\"{}\\","'.format(identifier),
+            '  echo "  \\"run_id\\": \\"$GITHUB_RUN_ID\\","',
+            '  echo "  \\"sha\\": \\"$GITHUB_SHA\\","',
+            '  echo "  \\"ref\\": \\"$GITHUB_REF\\","',
+            '  echo "  \\"os\\": \\"$RUNNER_OS\\","',
+            '  echo "  \\"time\\": $(date +%s),"',
+            '  echo "  \\"steps\\": ["',
+            "  sed -e '$!s/$/,/' -e 's/^/    /' \"{}.jsonl\"".format(_RECORDS),
+            '  echo "  ]"',
+            '  echo "}"',
+            '}} > {}'.format(TIMINGS_FILE),
+            '{',
+            '  echo "### Step timings: {}"'.format(identifier),
+            '  echo',
+            '  echo "| step | seconds | peak RSS (MiB) | exit status |"',
+            '  echo "| --- | ---: | ---: | ---: |"',
+            '  cat "{}.md"'.format(_RECORDS),
+            '} >> $GITHUB_STEP_SUMMARY',
+        ]))
+
+
+class UploadTimings(YAMLRenderable):
+  __slots__ = ()
+
+  def __init__(self, identifier):
+    self.fields = {
+        "name": "Upload step timings",
+        "uses": "actions/upload-artifact@v2",
+        "if": GitHubExpr('always()'),
+        "with": {
+            "name": "step-timings-{}".format(identifier),
+            "path": TIMINGS_FILE,
+        },
+    }
+
+
+def instrument(job, identifier=DEFAULT_IDENTIFIER):
+  steps = []
+  for step in Group(job.fields.get('steps')):
+    fields = step.fields
+    if (isinstance(step, YAMLRenderable) and "run" in fields and
+        "uses" not in fields and fields.get("shell") in _SHELLS):
+      step = _timed(step)
+    steps.append(step)
+  steps.extend([PublishTimings(identifier), UploadTimings(identifier)])
+  return job.updated({'steps': steps})
+
+
+def instrument_workflow(workflow, identifier=DEFAULT_IDENTIFIER):
+  jobs = {
+      jobid: instrument(job, identifier)
+      for jobid, job in (workflow.fields.get('jobs') or {}).items()
+  }
+  return workflow.updated({'jobs': jobs})
+
+
+def load_records(*paths):
+  # Reads step-timings.json files, or directories of downloaded artifacts
+  # holding them.
+  records = []
+  for path in paths:
+    if os.path.isdir(path):
+      fpaths = [
+          os.path.join(root, fname)
+          for root, _, fnames in os.walk(path)
+          for fname in sorted(fnames)
+          if fname == TIMINGS_FILE
+      ]
+    else:
+      fpaths = [path]
+    for fpath in fpaths:
+      with open(fpath) as fp:
+        records.append(json.load(fp))
+  return records
+
+
+def load_database(path):
+  if not os.path.exists(path):
+    return {'records': [], 'steps': {}, 'jobs': {}}
+  with open(path) as fp:
+    return json.load(fp)
+
+
+def save_database(path, database):
+  with open(path, 'w') as fp:
+    json.dump(database, fp, indent=2, sort_keys=True)
+
+
+def merge(database, records):
+  # Adds the samples of records not merged before; returns how many were
+  # new. Only steps that succeeded are timed, and only the most recent
+  # SAMPLES per step are kept.
+  seen = set(database['records'])
+  added = 0
+  for record in sorted(records, key=lambda r: r.get('time') or 0):
+    key = '{}/{}'.format(record.get('run_id'), record.get('identifier'))
+    if key in seen:
+      continue
+    seen.add(key)
+    database['records'].append(key)
+    added += 1
+    total = 0
+    for sample in record.get('steps') or []:
+      entry = database['steps'].setdefault(sample['step'], {
+          'samples': [],
+          'max_rss_kib': 0
+      })
+      entry['max_rss_kib'] = max(entry['max_rss_kib'],
+                                 sample.get('max_rss_kib') or 0)
+      total += sample['seconds']
+      if sample.get('exit_status') == 0:
+        entry['samples'] = (entry['samples'] + [sample['seconds']])[-SAMPLES:]
+    job = database['jobs'].setdefault(record.get('job') or '?', [])
+    job.append(total)
+    del job[:-SAMPLES]
+  return added
+
+
+def durations(database):
+  # Step name -> median seconds, as CostModel takes them.
+  return {
+      name: statistics.median(entry['samples'])
+      for name, entry in database['steps'].items()
+      if entry['samples']
+  }
+
+
+def describe(database, top=20):
+  rows = sorted(database['steps'].items(),
+                key=lambda item: -statistics.median(item[1]['samples'] or [0]))
+  lines = [
+      '{} record(s), {} step(s)'.format(len(database['records']),
+                                        len(database['steps']))
+  ]
+  for name, entry in rows[:top]:
+    samples = entry['samples']
+    lines.append('  {:>8.1f}s  {:>8.1f} MiB  {:>3} run(s)  {}'.format(
+        statistics.median(samples) if samples else 0.0,
+        entry['max_rss_kib'] / 1024, len(samples), name))
+  return '\n'.join(lines)
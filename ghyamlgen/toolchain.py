@@ -0,0 +1,209 @@
+import hashlib
+import os
+import re
+
+from . import GitHubExpr, GitHubMapping, Group, YAMLRenderable
+from .expr import (ExpressionError, Literal, fold, parse_expression, references,
+                   truthy)
+from .gh import Job, JobShellStep, MatrixJob
+from .optimize import expand_matrix
+
+# Bakes the setup snippets of a build into a container image, so jobs run
+# inside it (container:) instead of installing their toolchain on a bare
+# runner. The image is tagged with a hash of its base and snippets: the
+# toolchain job only builds and pushes when no image with that tag exists,
+# that is when a snippet changed.
+
+GHCR = 'ghcr.io/${{ github.repository }}'
+
+# Needed by the snippets (sudo, wget, apt-key) and by actions/checkout, which
+# only clones submodules with git installed in the container.
+PACKAGES = ('sudo', 'ca-certificates', 'wget', 'gnupg', 'git')
+
+_DELIMITER = 'GHYAMLGEN_TOOLCHAIN_EOF'
+
+
+class DockerLogin(YAMLRenderable):
+  __slots__ = ()
+
+  def __init__(self, registry):
+    self.fields = {
+        "name": "Log in to {}".format(registry),
+        "uses": "docker/login-action@v2",
+        "with": {
+            "registry":
+                registry,
+            "username":
+                GitHubExpr(GitHubMapping('actor', context='github')),
+            "password":
+                GitHubExpr(GitHubMapping('GITHUB_TOKEN', context='secrets')),
+        }
+    }
+
+
+class Toolchain:
+  # setup: shell steps, as given to MarianBuild. registry may also be a
+  # local one such as localhost:5000 (`docker run -d -p 5000:5000
+  # registry:2`), which jobs can reach when they share the Docker host, e.g.
+  # under act or on a single self-hosted runner.
+
+  def __init__(self, name, base, setup, registry=GHCR, packages=PACKAGES):
+    self.name = name
+    self.base = base
+    self.setup = setup
+    self.registry = registry
+    self.packages = packages
+
+  def local(self):
+    return self.registry.split('/')[0].split(':')[0] in ('localhost',
+                                                         '127.0.0.1')
+
+  def scripts(self):
+    # (filename, contents) of every setup step baked into the image, in
+    # order. Action steps (uses:) are skipped, since the image replaces what
+    # they set up, e.g. apt_cache's actions/cache step. An if: is decided
+    # as if those actions ran without outputs; steps whose if: cannot be
+    # decided that way, or that run in a shell other than bash, are
+    # rejected.
+    skipped = {}
+    scripts = []
+    for step in Group(self.setup):
+      fields = step.fields
+      name = fields.get("name")
+      if "uses" in fields:
+        if fields.get("id"):
+          skipped[fields["id"]] = {'outputs': {}}
+        continue
+      if "run" not in fields or fields.get("shell") not in (None, 'bash'):
+        raise ValueError('cannot bake step {!r} into an image'.format(name))
+      if not _runs(fields.get("if"), skipped, name):
+        continue
+      slug = re.sub(r'\W+', '-', str(name or 'step').lower())
+      fname = '{:02d}-{}.sh'.format(len(scripts), slug.strip('-'))
+      scripts.append((fname, str(fields["run"]) + '\n'))
+    return scripts
+
+  def dockerfile(self):
+    lines = [
+        'FROM {}'.format(self.base),
+        'ENV DEBIAN_FRONTEND=noninteractive',
+        'RUN apt-get update && apt-get install -y --no-install-recommends '
+        '{} && rm -rf /var/lib/apt/lists/*'.format(' '.join(self.packages)),
+    ]
+    for fname, _ in self.scripts():
+      lines.append('COPY {} /toolchain/'.format(fname))
+      lines.append('RUN bash -e /toolchain/{}'.format(fname))
+    return '\n'.join(lines) + '\n'
+
+  def tag(self):
+    digest = hashlib.sha256(self.dockerfile().encode())
+    for fname, contents in self.scripts():
+      digest.update(fname.encode())
+      digest.update(contents.encode())
+    return digest.hexdigest()[:16]
+
+  def image(self):
+    return '{}/{}:{}'.format(self.registry, self.name, self.tag())
+
+  def jobid(self):
+    return 'toolchain_{}'.format(re.sub(r'\W+', '_', self.name))
+
+  def write_context(self, directory):
+    # The Docker build context, for building the image by hand.
+    os.makedirs(directory, exist_ok=True)
+    files = self.scripts() + [('Dockerfile', self.dockerfile())]
+    for fname, contents in files:
+      with open(os.path.join(directory, fname), 'w') as fp:
+        fp.write(contents)
+    return directory
+
+  def job(self, runs_on='ubuntu-latest', directory='toolchain'):
+    # Pushing to ghcr.io needs the packages: write permission for
+    # GITHUB_TOKEN.
+    files = self.scripts() + [('Dockerfile', self.dockerfile())]
+    context = ['mkdir -p {}'.format(directory)]
+    for fname, contents in files:
+      context.append("cat > {}/{} << '{}'".format(directory, fname, _DELIMITER))
+      context.append(contents.rstrip('\n'))
+      context.append(_DELIMITER)
+    inspect = 'docker manifest inspect{}'.format(
+        ' --insecure' if self.local() else '')
+    steps = [
+        None if self.local() else DockerLogin(self.registry.split('/')[0]),
+        JobShellStep(name="Write toolchain build context",
+                     run='\n'.join(context)),
+        JobShellStep(
+            name="Build and push toolchain image",
+            id="image",
+            run='\n'.join([
+                # Image names must be lowercase; repository names need not.
+                'IMAGE=$(echo "{}" | tr A-Z a-z)'.format(self.image()),
+                'if {} "$IMAGE" > /dev/null 2>&1; then'.format(inspect),
+                '  echo "$IMAGE is up to date"',
+                'else',
+                '  docker build -t "$IMAGE" {}'.format(directory),
+                '  docker push "$IMAGE"',
+                'fi',
+                'echo "::set-output name=image::$IMAGE"',
+            ])),
+    ]
+    image = GitHubExpr('steps.image.outputs.image')
+    return Job(id=self.jobid(),
+               name='Toolchain image {}'.format(self.name),
+               runs_on=runs_on,
+               outputs={"image": image},
+               steps=[step for step in steps if step is not None])
+
+  def container(self):
+    image = GitHubExpr('needs.{}.outputs.image'.format(self.jobid()))
+    if self.local():
+      return image
+    return {
+        "image": image,
+        "credentials": {
+            "username":
+                GitHubExpr(GitHubMapping('actor', context='github')),
+            "password":
+                GitHubExpr(GitHubMapping('GITHUB_TOKEN', context='secrets')),
+        }
+    }
+
+  def use(self, job):
+    # job, running inside the image once the toolchain job has pushed it.
+    # Containers only run on Linux runners, so jobs (or matrix entries) on
+    # macOS or Windows are refused.
+    for runs_on in _runners(job):
+      if str(runs_on).startswith(('macos', 'windows')):
+        raise ValueError('{} runs on {}, which cannot run containers'.format(
+            job.id(), runs_on))
+    return job.updated({"container": self.container()}).needs(self.jobid())
+
+
+def _runs(condition, skipped, name):
+  if condition is None:
+    return True
+  try:
+    node = parse_expression(str(condition))
+  except ExpressionError as e:
+    raise ValueError('cannot bake step {!r} into an image: {}'.format(
+        name, e)) from None
+  steps = [
+      path[1] if len(path) > 1 else None
+      for path in references(node)
+      if path[0] == 'steps'
+  ]
+  value = fold(node, {'steps': skipped})
+  if not isinstance(value, Literal) or not set(steps) <= set(skipped):
+    raise ValueError('cannot bake step {!r} into an image: if: {} is only '
+                     'known at runtime'.format(name, condition))
+  return truthy(value.value)
+
+
+def _runners(job):
+  # The runs-on of job, or of each of its matrix entries where the matrix
+  # can be expanded statically.
+  if isinstance(job, MatrixJob):
+    strategy = job.fields.get("strategy") or {}
+    entries = expand_matrix(strategy.get("matrix")) or []
+    return [entry.get("os") for entry in entries]
+  return [job.fields.get("runs-on")]
@@ -0,0 +1,200 @@
+import ctypes
+import ctypes.util
+import importlib
+import os
+import select
+import struct
+import sys
+import time
+
+from .batch import discover, load_spec, spec_workflows, write_if_changed
+from .emit import render
+from .gh import prefetch_snippets
+from .incremental import module_paths, snippet_paths
+
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_CLOEXEC = 0o2000000
+IN_NONBLOCK = 0o4000
+
+_EVENT = struct.Struct('iIII')
+
+
+class InotifyWatcher:
+  # Watches the directories holding the files of interest rather than the
+  # files themselves, so editors that save by renaming are still seen.
+  MASK = IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+
+  def __init__(self):
+    libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+    self._add_watch = libc.inotify_add_watch
+    self._add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+    self.fd = libc.inotify_init1(IN_CLOEXEC | IN_NONBLOCK)
+    if self.fd < 0:
+      raise OSError(ctypes.get_errno(), 'inotify_init1 failed')
+    self.directories = {}
+
+  def watch(self, paths):
+    for path in paths:
+      directory = path if os.path.isdir(path) else os.path.dirname(path)
+      if directory in self.directories.values():
+        continue
+      wd = self._add_watch(self.fd, os.fsencode(directory), self.MASK)
+      if wd < 0:
+        raise OSError(ctypes.get_errno(), 'inotify_add_watch failed', directory)
+      self.directories[wd] = directory
+
+  def wait(self, timeout, settle=0.01):
+    ready, _, _ = select.select([self.fd], [], [], timeout)
+    if not ready:
+      return set()
+    changed = self._read()
+    # Saves often arrive as a short burst of events; collect the rest of it.
+    while select.select([self.fd], [], [], settle)[0]:
+      changed |= self._read()
+    return changed
+
+  def _read(self):
+    changed = set()
+    data = os.read(self.fd, 64 * 1024)
+    offset = 0
+    while offset < len(data):
+      wd, _, _, length = _EVENT.unpack_from(data, offset)
+      offset += _EVENT.size
+      name = data[offset:offset + length].rstrip(b'\0')
+      offset += length
+      if wd in self.directories and name:
+        changed.add(os.path.join(self.directories[wd], os.fsdecode(name)))
+    return changed
+
+  def close(self):
+    os.close(self.fd)
+
+
+class PollingWatcher:
+
+  def __init__(self, interval=0.1):
+    self.interval = interval
+    self.stamps = {}
+
+  def watch(self, paths):
+    for path in paths:
+      if path not in self.stamps and not os.path.isdir(path):
+        self.stamps[path] = self._stamp(path)
+
+  def wait(self, timeout):
+    deadline = time.monotonic() + timeout
+    while True:
+      changed = set()
+      for path, stamp in self.stamps.items():
+        current = self._stamp(path)
+        if current != stamp:
+          self.stamps[path] = current
+          changed.add(path)
+      if changed or time.monotonic() >= deadline:
+        return changed
+      time.sleep(self.interval)
+
+  @staticmethod
+  def _stamp(path):
+    try:
+      st = os.stat(path)
+    except OSError:
+      return None
+    return st.st_mtime_ns, st.st_size
+
+  def close(self):
+    pass
+
+
+def make_watcher(poll=False, interval=0.1):
+  if not poll and sys.platform.startswith('linux'):
+    try:
+      return InotifyWatcher()
+    except (OSError, AttributeError, TypeError):
+      pass
+  return PollingWatcher(interval)
+
+
+class Watch:
+  # Keeps every spec module loaded. A changed spec, helper module or snippet
+  # reloads the spec and re-renders all its outputs. Re-rendering the trees
+  # already built is not enough for snippets, since steps may derive values
+  # from their contents when built (composite actions, for one).
+
+  def __init__(self, paths, output_dir=None, watcher=None, stream=sys.stderr):
+    self.paths = paths
+    self.output_dir = output_dir
+    self.watcher = watcher or make_watcher()
+    self.stream = stream
+    self.modules = {}  # spec -> module paths
+    self.snippets = {}  # spec -> snippet paths
+
+  def load(self, spec):
+    start = time.perf_counter()
+    try:
+      workflows = spec_workflows(load_spec(spec))
+      prefetch_snippets(*workflows.values())
+    except Exception as e:
+      self.log(start, spec, '{}: {}'.format(type(e).__name__, e))
+      self.modules.setdefault(spec, {os.path.abspath(spec)})
+      self.watcher.watch(self.modules[spec])
+      return
+
+    output_dir = self.output_dir or os.path.dirname(spec)
+    self.modules[spec] = module_paths(spec)
+    self.snippets[spec] = set()
+    self.watcher.watch(self.modules[spec])
+    for fname, workflow in workflows.items():
+      self.render(spec, os.path.join(output_dir, fname), workflow, start)
+
+  def render(self, spec, opath, workflow, start):
+    try:
+      _, written = write_if_changed(opath, render(workflow))
+    except Exception as e:
+      self.log(start, opath, '{}: {}'.format(type(e).__name__, e))
+      return
+    finally:
+      # Snippets are read while rendering, so some are only known now.
+      snippets = {os.path.abspath(p) for p in snippet_paths(workflow)}
+      self.snippets[spec].update(snippets)
+      self.watcher.watch(snippets)
+    self.log(start, opath, 'written' if written else 'unchanged')
+
+  def log(self, start, path, status):
+    self.stream.write('{:8.1f}ms  {}  [{}]\n'.format(
+        (time.perf_counter() - start) * 1000, path, status))
+    self.stream.flush()
+
+  def update(self, changed):
+    for module in list(sys.modules.values()):
+      fpath = getattr(module, '__file__', None)
+      if fpath and os.path.abspath(fpath) in changed:
+        importlib.reload(module)
+
+    for spec in discover(self.paths):
+      if (spec not in self.modules or self.modules[spec] & changed or
+          self.snippets.get(spec, set()) & changed):
+        self.load(spec)
+
+  def run(self, timeout=1.0):
+    self.watcher.watch(os.path.abspath(p) for p in self.paths)
+    for spec in discover(self.paths):
+      self.load(spec)
+    self.stream.write('Watching {} spec(s) for changes\n'.format(
+        len(self.modules)))
+    self.stream.flush()
+    try:
+      while True:
+        changed = self.watcher.wait(timeout)
+        if changed:
+          self.update({os.path.abspath(p) for p in changed})
+        else:
+          new = [s for s in discover(self.paths) if s not in self.modules]
+          for spec in new:
+            self.load(spec)
+    finally:
+      self.watcher.close()
@@ -1,10 +1,15 @@
+import yaml
+
+
 class Snippet(str):
 
   @staticmethod
   def representer(dumper, data):
     if len(data.splitlines()) > 1:  # check for multiline string
-      return dumper.represent_scalar('tag:yaml.org,2002:str', data, style='|')
-    return dumper.represent_scalar('tag:yaml.org,2002:str', data)
+      return dumper.represent_scalar('tag:yaml.org,2002:str',
+                                     str(data),
+                                     style='|')
+    return dumper.represent_scalar('tag:yaml.org,2002:str', str(data))
 
 
 class GitHubExpr(str):
@@ -15,7 +20,7 @@ class GitHubExpr(str):
 
   @staticmethod
   def representer(dumper, data):
-    return dumper.represent_scalar('tag:yaml.org,2002:str', data)
+    return dumper.represent_scalar('tag:yaml.org,2002:str', str(data))
 
 
 class GitHubMapping(str):
@@ -26,11 +31,40 @@ class GitHubMapping(str):
 
   @staticmethod
   def representer(dumper, data):
-    return dumper.represent_scalar('tag:yaml.org,2002:str', data)
+    return dumper.represent_scalar('tag:yaml.org,2002:str', str(data))
 
 
 class QuotedExpr(str):
 
   @staticmethod
   def representer(dumper, data):
-    return dumper.represent_scalar('tag:yaml.org,2002:str', data, style='"')
+    return dumper.represent_scalar('tag:yaml.org,2002:str',
+                                   str(data),
+                                   style='"')
+
+
+_representables = (Snippet, GitHubExpr, GitHubMapping, QuotedExpr)
+
+
+# Representers live on package-owned Dumper subclasses rather than PyYAML's
+# global default, so other PyYAML users in the process are left untouched.
+class PyDumper(yaml.Dumper):
+  pass
+
+
+for _cls in _representables:
+  PyDumper.add_representer(_cls, _cls.representer)
+
+try:
+  from yaml import CDumper as _CDumper
+except ImportError:
+  CDumper = None
+else:
+
+  class CDumper(_CDumper):
+    pass
+
+  for _cls in _representables:
+    CDumper.add_representer(_cls, _cls.representer)
+
+Dumper = CDumper or PyDumper
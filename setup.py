@@ -14,6 +14,9 @@ setup(name='ghyamlgen',
       url='https://github.com/jerinphilip/ghyaml-gen',
       packages=find_packages(),
       install_requires=required,
+      entry_points={
+          'console_scripts': ['ghyamlgen=ghyamlgen.cli:main'],
+      },
 )
 
 
@@ -0,0 +1,90 @@
+import io
+import os
+import stat
+import subprocess
+import sys
+
+from ghyamlgen.batch import (discover, render_all, summarize, write_if_changed)
+from ghyamlgen.cli import main
+
+SPEC = '''
+from ghyamlgen.gh import Job, JobShellStep, On, Workflow
+
+
+def workflows():
+  job = Job(id='build', name='Build {name}', runs_on='ubuntu-latest',
+            steps=[JobShellStep(name='Build', run='echo \\u00e9')])
+  return {{'{name}.yml': Workflow(name='{name}', on=On(push={{}}),
+                                  jobs={{'build': job}})}}
+'''
+
+
+def _specs(tmp_path, *names):
+  for name in names:
+    (tmp_path / '{}.py'.format(name)).write_text(SPEC.format(name=name))
+  (tmp_path / '_helper.py').write_text('')
+  return discover([str(tmp_path)])
+
+
+def test_discover_skips_private_modules(tmp_path):
+  specs = _specs(tmp_path, 'b', 'a')
+  assert specs == [str(tmp_path / 'a.py'), str(tmp_path / 'b.py')]
+
+
+def test_render_all_in_parallel(tmp_path):
+  specs = _specs(tmp_path, 'a', 'b', 'c')
+  out = tmp_path / 'out'
+  results = list(render_all(specs, str(out), jobs=2))
+  assert sorted(r.spec for r in results) == specs
+  assert all(r.error is None for r in results)
+  assert sorted(os.listdir(out)) == ['a.yml', 'b.yml', 'c.yml']
+  assert 'name: Build b' in (out / 'b.yml').read_text()
+
+  stream = io.StringIO()
+  assert summarize(results, 1.0, stream) == 0
+  assert 'total: 3 spec(s), 3 output(s), 0 failed' in stream.getvalue()
+
+  again = list(render_all(specs, str(out), jobs=2))
+  assert not any(o.written for r in again for o in r.outputs)
+
+
+def test_failures_are_reported(tmp_path):
+  (tmp_path / 'broken.py').write_text('def workflow():\n  raise KeyError(1)\n')
+  results = list(render_all(discover([str(tmp_path)]), str(tmp_path)))
+  assert results[0].error == 'KeyError: 1'
+  stream = io.StringIO()
+  assert summarize(results, 1.0, stream) == 1
+
+
+def test_write_if_changed(tmp_path):
+  path = tmp_path / 'out.yml'
+  digest, written = write_if_changed(str(path), 'name: é\n')
+  assert written
+  assert path.read_bytes() == 'name: é\n'.encode('utf-8')
+  # Not 0600, as mkstemp creates files.
+  umask = os.umask(0)
+  os.umask(umask)
+  assert stat.S_IMODE(path.stat().st_mode) == 0o666 & ~umask
+
+  assert write_if_changed(str(path), 'name: é\n') == (digest, False)
+  path.chmod(0o640)
+  assert write_if_changed(str(path), 'name: x\n')[1]
+  assert stat.S_IMODE(path.stat().st_mode) == 0o640
+
+
+def test_cli_render(tmp_path, capsys):
+  specs = _specs(tmp_path, 'a')
+  out = tmp_path / 'out'
+  assert main(['render', *specs, '-o', str(out)]) == 0
+  assert (out / 'a.yml').exists()
+
+
+def test_cli_imports_subcommands_lazily():
+  loaded = subprocess.check_output([
+      sys.executable, '-c', 'import sys, ghyamlgen.cli; '
+      'print(sorted(m for m in sys.modules if m.startswith("ghyamlgen.")))'
+  ],
+                                   universal_newlines=True)
+  for module in ('watch', 'cachesim', 'changes', 'composite', 'graph',
+                 'planner', 'timing'):
+    assert 'ghyamlgen.{}'.format(module) not in loaded
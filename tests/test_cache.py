@@ -0,0 +1,63 @@
+import yaml
+
+from ghyamlgen import Job, JobShellStep, ResolveCache, Workflow, resolve
+from ghyamlgen.batch import load_spec
+from ghyamlgen.gh import ImportedSnippet
+
+
+def _workflow(make_step):
+  jobs = {}
+  for i in range(3):
+    jobs['job{}'.format(i)] = Job('job{}'.format(i),
+                                  'Job {}'.format(i),
+                                  'ubuntu-latest',
+                                  steps=[make_step(j) for j in range(3)])
+  return Workflow('CI', {'push': None}, jobs=jobs)
+
+
+def _step(j):
+  return JobShellStep(name='step {}'.format(j), run='echo {}'.format(j))
+
+
+def test_matches_plain_resolve_without_aliases():
+  workflow = load_spec('examples/bergamot-translator/main.py').native()
+  cache = ResolveCache()
+  for _ in range(2):
+    native = resolve(workflow, cache)
+    assert native == resolve(workflow)
+    text = yaml.dump(native)
+    assert '&id' not in text and '*id' not in text
+
+
+def test_identical_subtrees_built_separately_hit():
+  cache = ResolveCache()
+  native = resolve(_workflow(_step), cache)
+  # Three distinct steps, once each; the other jobs' copies are hits.
+  assert cache.cache_info().misses < 3 * 3
+  assert cache.cache_info().hits >= 2 * 3
+  assert native == resolve(_workflow(_step))
+  text = yaml.dump(native)
+  assert '&id' not in text and '*id' not in text
+
+
+def test_mutable_changes_between_calls_are_seen():
+  step = _step(0)
+  workflow = Workflow(
+      'CI', {'push': None},
+      jobs={'job': Job('job', 'Job', 'ubuntu-latest', steps=[step])})
+  cache = ResolveCache()
+  resolve(workflow, cache)
+  step.fields = {**step.fields, 'run': 'echo changed'}
+  native = resolve(workflow, cache)
+  assert native['jobs']['job']['steps'][0]['run'] == 'echo changed'
+
+
+def test_frozen_snippet_is_read_again(tmp_path):
+  script = tmp_path / 'install.sh'
+  script.write_text('echo one')
+  step = ImportedSnippet('Install', str(script)).freeze()
+  cache = ResolveCache()
+  assert resolve(step, cache)['run'] == 'echo one'
+  # A different size, so the snippet cache sees the edit whatever the mtime.
+  script.write_text('echo three')
+  assert resolve(step, cache)['run'] == 'echo three'
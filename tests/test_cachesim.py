@@ -0,0 +1,110 @@
+import json
+
+from ghyamlgen.cachesim import (Run, load_history, scheme_from_keys, simulate)
+
+MAIN = 'refs/heads/main'
+FEATURE = 'refs/pull/1/merge'
+ENTRY = {'identifier': 'ubuntu'}
+DAY = 86400
+
+
+def _sources(history, keys):
+  key, restore_keys = scheme_from_keys(keys)
+  return simulate(history, key, restore_keys).sources
+
+
+def test_pull_request_restores_from_base_ref():
+  history = [
+      Run(0, MAIN, ENTRY, 'h1'),
+      Run(1, FEATURE, ENTRY, 'h1', base_ref=MAIN),
+      Run(2, FEATURE, ENTRY, 'h1', base_ref=MAIN),
+  ]
+  key, restore_keys = scheme_from_keys(
+      ['matrix.identifier', 'steps.ccache_vars.outputs.hash', 'github.ref'])
+  report = simulate(history, key, restore_keys)
+  assert (report.exact, report.partial, report.misses) == (1, 1, 1)
+  assert report.sources == {
+      'restore-keys[0] from {}'.format(MAIN): 1,
+      'key': 1,
+  }
+  assert report.saves == 2
+
+
+def test_push_falls_back_to_default_branch():
+  history = [
+      Run(0, MAIN, ENTRY, 'h1'),
+      Run(1, 'refs/heads/topic', ENTRY, 'h2'),
+  ]
+  sources = _sources(history, ['matrix.identifier', 'github.ref'])
+  assert sources == {'restore-keys[0] from {}'.format(MAIN): 1}
+
+
+def test_own_scope_is_searched_before_base_ref():
+  # main holds the exact key, but a restore-key match in the run's own scope
+  # is found first.
+  history = [
+      Run(0, FEATURE, ENTRY, 'h1', base_ref=MAIN),
+      Run(1, MAIN, ENTRY, 'h2'),
+      Run(2, FEATURE, ENTRY, 'h2', base_ref=MAIN),
+  ]
+  sources = _sources(history,
+                     ['matrix.identifier', 'steps.ccache_vars.outputs.hash'])
+  assert sources == {'restore-keys[0]': 1}
+
+
+def test_sibling_branches_are_not_visible():
+  history = [
+      Run(0, MAIN, ENTRY, 'h1'),
+      Run(1, FEATURE, ENTRY, 'h2', base_ref=MAIN),
+      Run(2, 'refs/pull/2/merge', ENTRY, 'h2', base_ref=MAIN),
+  ]
+  sources = _sources(history,
+                     ['matrix.identifier', 'steps.ccache_vars.outputs.hash'])
+  assert sources == {'restore-keys[0] from {}'.format(MAIN): 2}
+
+
+def test_matrix_entries_do_not_share_entries():
+  history = [
+      Run(0, MAIN, ENTRY, 'h1'),
+      Run(1, MAIN, {'identifier': 'mac'}, 'h1'),
+  ]
+  key, restore_keys = scheme_from_keys(['matrix.identifier', 'github.ref'])
+  assert simulate(history, key, restore_keys).misses == 2
+
+
+def test_expiry_and_eviction():
+  key, restore_keys = scheme_from_keys(
+      ['matrix.identifier', 'steps.ccache_vars.outputs.hash'])
+  expired = simulate(
+      [Run(0, MAIN, ENTRY, 'h1'),
+       Run(8 * DAY, MAIN, ENTRY, 'h1')], key, restore_keys)
+  assert (expired.misses, expired.evicted) == (2, expired.stored // 2)
+
+  history = [Run(t, MAIN, ENTRY, 'h{}'.format(t), bytes=4) for t in range(3)]
+  evicted = simulate(history, key, restore_keys, limit=10)
+  assert (evicted.partial, evicted.evicted, evicted.final) == (2, 4, 8)
+
+
+def test_load_history(tmp_path):
+  path = tmp_path / 'history.jsonl'
+  path.write_text('\n'.join(
+      json.dumps(record) for record in [
+          {
+              'time': '2024-01-02T00:00:00Z',
+              'ref': MAIN,
+              'hash': 'b',
+              'identifier': 'ubuntu'
+          },
+          {
+              'time': 0,
+              'ref': MAIN,
+              'hash': 'a',
+              'entry': ENTRY,
+              'bytes': 5
+          },
+      ]))
+  runs = load_history(str(path))
+  assert [run.hash for run in runs] == ['a', 'b']
+  assert runs[0].bytes == 5
+  assert runs[1].entry == ENTRY
+  assert runs[1].time == 1704153600.0
@@ -0,0 +1,123 @@
+import json
+import os
+import shutil
+import subprocess
+
+import pytest
+
+from ghyamlgen.ccache import CCacheEpilog
+from ghyamlgen.compilercache import LocalDisk, Sccache
+
+CCACHE_S = '''cache directory                     /home/runner/.ccache
+cache hit (direct)                    10
+cache hit (preprocessed)               2
+cache miss                             4
+cleanups performed                     0
+files in cache                        30
+cache size                           1.5 {unit}
+max cache size                     200.0 MB
+'''
+
+# Misses take 2s (across midnight) and 3s, hits 0.5s; ccache 4 logs more
+# than one Result line per invocation.
+CCACHE_LOG = '''[2024-05-01T23:59:59.000000 100] === CCACHE 3.4.1 STARTED ===
+[2024-05-01T23:59:59.500000 101] === CCACHE 3.4.1 STARTED ===
+[2024-05-02T00:00:01.000000 100] Result: cache miss
+[2024-05-02T00:00:00.000000 101] Result: cache hit (direct)
+[2024-05-02T00:00:02.000000 102 ] Command line: g++ -c b.cpp
+[2024-05-02T00:00:05.000000 102 ] Result: cache_miss
+[2024-05-02T00:00:05.000000 102 ] Result: local_storage_miss
+[2024-05-02T00:00:06.000000 103 ] Command line: g++ -c c.cpp
+[2024-05-02T00:00:06.500000 103 ] Result: direct_cache_hit
+'''
+
+SCCACHE_STATS = {
+    'stats': {
+        'cache_hits': {
+            'counts': {
+                'C/C++': 6
+            }
+        },
+        'cache_misses': {
+            'counts': {
+                'C/C++': 2
+            }
+        },
+        'compilations': 2,
+        'compiler_write_duration': {
+            'secs': 10,
+            'nanos': 0
+        },
+        'cache_read_hit_duration': {
+            'secs': 2,
+            'nanos': 999999999
+        },
+    },
+    'cache_size': 4096,
+}
+
+
+def _run(tmp_path, script, tool, output, env=()):
+  # Runs script with a fake tool on PATH that prints output for its stats
+  # command and fails --print-stats, and returns the stats file written.
+  bin_dir = tmp_path / 'bin'
+  bin_dir.mkdir(exist_ok=True)
+  fake = bin_dir / tool
+  (tmp_path / 'output').write_text(output)
+  fake.write_text('#!/bin/sh\n'
+                  'case "$*" in\n'
+                  '  --print-stats) exit 1 ;;\n'
+                  '  -s|*json*) cat "{}" ;;\n'
+                  'esac\n'.format(tmp_path / 'output'))
+  fake.chmod(0o755)
+  (tmp_path / 'step.sh').write_text(script)
+  subprocess.run(['bash', '-e', str(tmp_path / 'step.sh')],
+                 check=True,
+                 cwd=tmp_path,
+                 capture_output=True,
+                 env=dict(os.environ,
+                          PATH='{}:{}'.format(bin_dir, os.environ['PATH']),
+                          **dict(env)))
+  return json.loads((tmp_path / 'ccache-stats.json').read_text())
+
+
+@pytest.mark.parametrize('unit, kib', [('MB', 1464), ('MiB', 1536),
+                                       ('GB', 1464843), ('kB', 1)])
+def test_ccache_3_sizes_in_kib(tmp_path, unit, kib):
+  stats = _run(tmp_path,
+               CCacheEpilog('x').fields['run'], 'ccache',
+               CCACHE_S.format(unit=unit))
+  assert (stats['hits'], stats['misses']) == (12, 4)
+  assert stats['size_kib'] == kib
+
+
+def test_ccache_saved_seconds_from_log(tmp_path):
+  log = tmp_path / 'ccache.log'
+  log.write_text(CCACHE_LOG)
+  stats = _run(tmp_path,
+               CCacheEpilog('x').fields['run'], 'ccache',
+               CCACHE_S.format(unit='MB'), {
+                   'CCACHE_LOGFILE': str(log),
+                   'CCACHE_BUILD_START': '0'
+               })
+  # 12 hits, each 2.5s - 0.5s faster than a miss; not the whole build.
+  assert stats['saved_seconds'] == 24
+  assert stats['elapsed_seconds'] > 24
+
+
+def test_ccache_without_log_saves_nothing(tmp_path):
+  stats = _run(tmp_path,
+               CCacheEpilog('x').fields['run'], 'ccache',
+               CCACHE_S.format(unit='MB'),
+               {'CCACHE_LOGFILE': str(tmp_path / 'missing.log')})
+  assert stats['saved_seconds'] == 0
+
+
+@pytest.mark.skipif(shutil.which('jq') is None, reason='needs jq')
+def test_sccache_saved_seconds(tmp_path):
+  epilog = Sccache(LocalDisk('/tmp/sccache'), 'x').epilog()[0]
+  stats = _run(tmp_path, epilog.fields['run'], 'sccache',
+               json.dumps(SCCACHE_STATS))
+  assert (stats['hits'], stats['misses'], stats['size_kib']) == (6, 2, 4)
+  # 6 hits, each 5s - 0.5s faster than compiling.
+  assert stats['saved_seconds'] == 27
@@ -0,0 +1,55 @@
+from ghyamlgen.changes import (affected, compile_rules, gate_jobs, matches,
+                               path_filters, triggered)
+from ghyamlgen.gh import Always, Job, On, Workflow
+
+PATHS = {
+    'build': ['src/**', '**/CMakeLists.txt', '!src/docs/**'],
+    'docs': ['doc/*.md'],
+}
+
+
+def _workflow(*jobs):
+  return Workflow(name='ci',
+                  on=On(push={'branches': ['main']}, pull_request={}),
+                  jobs={job.id(): job for job in jobs})
+
+
+def _job(jobid):
+  return Job(id=jobid, name=jobid, runs_on='ubuntu-latest')
+
+
+def test_patterns():
+  rules = compile_rules(PATHS['build'])
+  assert matches(rules, 'src/a/b.cpp')
+  assert matches(rules, 'CMakeLists.txt')
+  assert matches(rules, 'third_party/x/CMakeLists.txt')
+  assert not matches(rules, 'src/docs/index.md')
+  assert not matches(compile_rules(PATHS['docs']), 'doc/api/x.md')
+  assert affected(PATHS, ['doc/x.md', 'README.md']) == ['docs']
+
+
+def test_path_filters():
+  workflow = path_filters(_workflow(_job('build'), _job('docs')), PATHS)
+  on = workflow.fields['on'].fields
+  union = ['src/**', '**/CMakeLists.txt', 'doc/*.md']
+  assert on['push'] == {'branches': ['main'], 'paths': union}
+  assert on['pull_request'] == {'paths': union}
+  assert triggered(workflow, ['README.md']) == (False, [])
+  assert triggered(workflow, ['doc/a.md']) == (True, ['build', 'docs'])
+
+
+def test_skips_propagate_unless_status_checked():
+  workflow = gate_jobs(
+      _workflow(
+          _job('build'),
+          _job('docs'),
+          _job('test').needs('build'),
+          _job('report').needs('test', OpExpr=Always),
+          _job('lint'),
+      ), PATHS)
+  assert triggered(workflow,
+                   ['doc/a.md']) == (True,
+                                     ['changes', 'docs', 'report', 'lint'])
+  assert triggered(workflow, ['src/a.cpp'], 'pull_request') == (True, [
+      'changes', 'build', 'test', 'report', 'lint'
+  ])
@@ -0,0 +1,86 @@
+from ghyamlgen import resolve
+from ghyamlgen.composite import action_files, describe, extract_composites
+from ghyamlgen.gh import Checkout, Job, JobShellStep, On, Workflow
+
+
+def _steps(target):
+  return [
+      JobShellStep(name='Configure',
+                   run='cmake -S . -B build -DCMAKE_BUILD_TYPE=Release'),
+      JobShellStep(name='Build',
+                   working_directory=target,
+                   run='\n'.join([
+                       'cmake --build build --parallel',
+                       'ctest --test-dir build --output-on-failure',
+                       'cmake --install build --prefix install',
+                       'tar czf install.tar.gz install',
+                   ])),
+      JobShellStep(
+          name='Report',
+          run='\n'.join([
+              'echo "Built on ${{ matrix.os }}" >> $GITHUB_STEP_SUMMARY',
+              'ls -l install >> $GITHUB_STEP_SUMMARY',
+              'du -sh install >> $GITHUB_STEP_SUMMARY',
+          ])),
+  ]
+
+
+def _workflow(*targets, before=(), after=()):
+  jobs = {}
+  for target in targets:
+    steps = list(before) + [Checkout()] + _steps(target) + list(after)
+    jobs[target] = Job(id=target,
+                       name=target,
+                       runs_on='ubuntu-latest',
+                       steps=steps)
+  return Workflow(name='CI', on=On(push={}), jobs=jobs)
+
+
+def test_repeated_sequence_becomes_an_action():
+  workflow, actions, report = extract_composites(
+      _workflow('cpu', 'gpu', 'arm', 'wasm'))
+  assert len(actions) == 1
+  (name, action), = actions.items()
+  action = resolve(action)
+  assert action['runs']['using'] == 'composite'
+  assert [s['name'] for s in action['runs']['steps']
+         ] == ['Configure', 'Build', 'Report']
+  assert all(s['shell'] for s in action['runs']['steps'])
+  # The differing value and the matrix expression become inputs.
+  inputs = action['inputs']
+  assert len(inputs) == 2
+  _, build, report_step = action['runs']['steps']
+  assert build['working-directory'].startswith('${{ inputs.')
+  assert '${{ inputs.matrix_os }}' in report_step['run']
+
+  jobs = resolve(workflow)['jobs']
+  for target in ('cpu', 'gpu', 'arm', 'wasm'):
+    steps = jobs[target]['steps']
+    assert [s.get('uses') for s in steps
+           ] == ['actions/checkout@v2', './.github/actions/{}'.format(name)]
+    assert target in steps[1]['with'].values()
+    assert '${{ matrix.os }}' in steps[1]['with'].values()
+  assert report.steps_before == 16 and report.steps_after == 8
+  assert 'action(s)' in describe(report)
+  assert list(
+      action_files(actions)) == ['../actions/{}/action.yml'.format(name)]
+
+
+def test_unmovable_steps_are_left_in_place():
+  before = [JobShellStep(name='Prepare', run='true')]
+  after = [
+      JobShellStep(name='Notify', run='true', condition='failure()'),
+  ]
+  workflow, actions, _ = extract_composites(
+      _workflow('cpu', 'gpu', 'arm', 'wasm', before=before, after=after))
+  assert len(actions) == 1
+  steps = resolve(workflow)['jobs']['cpu']['steps']
+  assert [s['name'] for s in steps
+         ] == ['Prepare', 'Checkout', steps[2]['name'], 'Notify']
+
+
+def test_single_occurrence_is_not_extracted():
+  workflow, actions, report = extract_composites(_workflow('cpu'))
+  assert actions == {}
+  assert report.steps_before == report.steps_after
+  assert resolve(workflow) == resolve(_workflow('cpu'))
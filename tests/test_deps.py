@@ -0,0 +1,76 @@
+import hashlib
+
+from ghyamlgen import resolve
+from ghyamlgen.deps import apt_cache, brew_cache, mkl_cache
+from ghyamlgen.gh import ImportedSnippet, JobShellStep
+from ghyamlgen.incremental import snippet_paths
+
+
+def _hash(text):
+  return hashlib.sha256(text.encode()).hexdigest()[:16]
+
+
+def _install(tmp_path, contents):
+  script = tmp_path / 'install.sh'
+  script.write_text(contents)
+  return script, ImportedSnippet('Install dependencies', str(script))
+
+
+def test_apt_cache_steps():
+  install = JobShellStep(name='Install', run='sudo apt-get install -y x')
+  steps = resolve(apt_cache(install, platform='ubuntu-22.04'))
+  assert [s['name'] for s in steps] == [
+      'Cache-op for Install through apt',
+      'Keep downloaded apt packages',
+      'Install',
+      'Collect downloaded apt packages',
+      'Install cached apt packages',
+  ]
+  cache = steps[0]
+  assert cache['id'] == 'install_apt'
+  assert cache['with'] == {
+      'path': '~/.cache/apt-archives',
+      'key': 'apt-ubuntu-22.04-' + _hash('sudo apt-get install -y x'),
+  }
+  miss = "${{ steps.install_apt.outputs.cache-hit != 'true' }}"
+  assert [s.get('if') for s in steps[1:]] == [
+      miss, miss, miss, "${{ steps.install_apt.outputs.cache-hit == 'true' }}"
+  ]
+
+
+def test_mkl_cache_prepares_first():
+  install = JobShellStep(name='Install MKL', run='install-mkl')
+  steps = resolve(mkl_cache(install, platform='linux'))
+  assert steps[0]['name'] == 'Prepare /opt/intel'
+  assert 'if' not in steps[0]
+  assert steps[1]['with']['path'] == '/opt/intel'
+
+
+def test_key_follows_snippet_edits(tmp_path):
+  # A long-lived process re-renders trees that are already built, so the key
+  # is derived when rendering, not when the step is built.
+  script, install = _install(tmp_path, 'brew install a')
+  group = apt_cache(install, platform='linux')
+  assert resolve(
+      group)[0]['with']['key'] == 'apt-linux-' + _hash('brew install a')
+  script.write_text('brew install a b')
+  assert resolve(
+      group)[0]['with']['key'] == 'apt-linux-' + _hash('brew install a b')
+
+
+def test_brew_cache_keeps_snippet(tmp_path):
+  script, install = _install(tmp_path, 'brew install a')
+  install = install.updated({'env': {'X': '1'}})
+  group = brew_cache(install, platform='macos')
+  assert snippet_paths(group) == {str(script)}
+
+  cache, step = resolve(group)
+  assert cache['with']['key'] == 'brew-macos-' + _hash('brew install a')
+  assert step['env'] == {'X': '1'}
+  assert step['run'].startswith('export HOMEBREW_NO_AUTO_UPDATE=1')
+  assert step['run'].endswith('\nbrew install a')
+
+  script.write_text('brew install a b')
+  cache, step = resolve(group)
+  assert cache['with']['key'] == 'brew-macos-' + _hash('brew install a b')
+  assert step['run'].endswith('\nbrew install a b')
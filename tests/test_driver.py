@@ -0,0 +1,69 @@
+import os
+import subprocess
+
+from ghyamlgen import resolve
+from ghyamlgen.driver import BuildResources, LinkSlots, Make, Ninja
+
+
+def _bash(tmp_path, script, **env):
+  (tmp_path / 'step.sh').write_text(script)
+  return subprocess.run(['bash', '-e', str(tmp_path / 'step.sh')],
+                        check=True,
+                        cwd=tmp_path,
+                        capture_output=True,
+                        text=True,
+                        env=dict(os.environ, RUNNER_TEMP=str(tmp_path), **env))
+
+
+def _outputs(stdout):
+  prefix = '::set-output name='
+  return dict(line[len(prefix):].split('::', 1)
+              for line in stdout.splitlines()
+              if line.startswith(prefix))
+
+
+def test_build_resources(tmp_path):
+  github_env = tmp_path / 'env'
+  step = BuildResources('-j $COMPILE_JOBS/$LINK_JOBS')
+  outputs = _outputs(
+      _bash(tmp_path, step.fields['run'], GITHUB_ENV=str(github_env)).stdout)
+  cores, compile_jobs, link_jobs = (
+      int(outputs[k]) for k in ('cores', 'compile_jobs', 'link_jobs'))
+  assert 1 <= link_jobs <= compile_jobs <= cores
+  assert 'build_cmake=-j {}/{}\n'.format(compile_jobs,
+                                         link_jobs) in github_env.read_text()
+
+
+def test_build_resources_with_little_memory(tmp_path):
+  github_env = tmp_path / 'env'
+  step = BuildResources(compile_mb=10**9, link_mb=10**9)
+  outputs = _outputs(
+      _bash(tmp_path, step.fields['run'], GITHUB_ENV=str(github_env)).stdout)
+  assert (outputs['compile_jobs'], outputs['link_jobs']) == ('1', '1')
+
+
+def test_link_slots_serialize_links(tmp_path):
+  _bash(tmp_path, LinkSlots().fields['run'])
+  # Each "link" fails if another one holds the lock while it runs.
+  link = ('mkdir "$RUNNER_TEMP/busy" || exit 3; sleep 0.2; '
+          'rmdir "$RUNNER_TEMP/busy"')
+  script = '\n'.join([
+      'for i in 1 2 3; do',
+      '  "$RUNNER_TEMP/link-slots.sh" sh -c \'{}\' &'.format(link),
+      'done',
+      'for job in $(jobs -p); do wait $job; done',
+  ])
+  _bash(tmp_path, script, BUILD_LINK_JOBS='1')
+  assert os.listdir(tmp_path / 'link-slots') == []
+
+
+def test_generators():
+  make, ninja = Make(launcher='ccache'), Ninja()
+  assert [s['name'] for s in resolve(make.setup())
+         ] == ['Install link limiter', 'Detect build resources']
+  assert '-DCMAKE_CXX_COMPILER_LAUNCHER=ccache' in make.cmake_flags()
+  assert resolve(make.build())['run'] == 'make -j"$BUILD_COMPILE_JOBS"'
+  assert resolve(
+      ninja.setup())[0]['uses'].startswith('seanmiddleditch/gha-setup-ninja')
+  assert '-DCMAKE_JOB_POOL_LINK=link' in ninja.cmake_flags()
+  assert resolve(ninja.build())['run'] == 'ninja -j"$BUILD_COMPILE_JOBS"'
@@ -0,0 +1,42 @@
+import io
+
+import pytest
+import yaml
+
+from ghyamlgen import resolve
+from ghyamlgen.batch import load_spec, spec_workflows
+from ghyamlgen.emit import dump, render
+from ghyamlgen.yml import CDumper, Dumper, PyDumper
+
+
+def _workflows():
+  spec = load_spec('examples/bergamot-translator/main.py')
+  workflows = dict(spec_workflows(spec))
+  workloads = load_spec('benchmarks/workloads.py')
+  workflows['synthetic.yml'] = workloads.build_workflow(200)
+  workflows['shared.yml'] = workloads.build_shared_workflow(200)
+  return workflows
+
+
+WORKFLOWS = _workflows()
+
+
+@pytest.mark.parametrize('name', sorted(WORKFLOWS))
+def test_streamed_matches_yaml_dump(name):
+  workflow = WORKFLOWS[name]
+  expected = yaml.dump(resolve(workflow),
+                       Dumper=Dumper,
+                       default_flow_style=False,
+                       width=1024,
+                       sort_keys=False)
+  assert render(workflow) == expected
+  stream = io.StringIO()
+  render(workflow, stream)
+  assert stream.getvalue() == expected
+
+
+@pytest.mark.skipif(CDumper is None, reason='PyYAML built without libyaml')
+@pytest.mark.parametrize('name', sorted(WORKFLOWS))
+def test_cdumper_matches_pydumper(name):
+  workflow = WORKFLOWS[name]
+  assert dump(workflow, Dumper=CDumper) == dump(workflow, Dumper=PyDumper)
@@ -0,0 +1,126 @@
+import pytest
+
+from ghyamlgen.expr import (Binary, Call, ExpressionError, Literal, Name, Not,
+                            Property, Scope, _tokenize, check, conjunction,
+                            evaluate, fold, parse, parse_expression, unparse,
+                            uses_status)
+
+
+def test_tokenize():
+  tokens = [(kind, token) for kind, token, _ in _tokenize("a.b == 'it''s'")]
+  assert tokens == [('ident', 'a'), ('op', '.'), ('ident', 'b'), ('op', '=='),
+                    ('string', "'it''s'"), ('end', '')]
+  assert [t[1] for t in _tokenize('0xff -1.5e3 !x')[:-1]
+         ] == ['0xff', '-1.5e3', '!', 'x']
+
+
+def test_tokenize_rejects_unknown_characters():
+  with pytest.raises(ExpressionError) as error:
+    _tokenize('a + b')
+  assert error.value.position == 2
+
+
+def test_parse_literals():
+  assert parse("'it''s'") == Literal("it's")
+  assert parse('0x10') == Literal(16)
+  assert parse('1.5') == Literal(1.5)
+  assert parse('true') == Literal(True)
+  assert parse('null') == Literal(None)
+
+
+def test_parse_precedence():
+  # ! binds tighter than comparisons, which bind tighter than && and ||.
+  assert parse('a || b && c') == Binary('||', Name('a'),
+                                        Binary('&&', Name('b'), Name('c')))
+  assert parse('!a == b') == Binary('==', Not(Name('a')), Name('b'))
+  assert parse('a == b && c < d') == Binary('&&',
+                                            Binary('==', Name('a'), Name('b')),
+                                            Binary('<', Name('c'), Name('d')))
+  assert parse('(a || b) && c') == Binary('&&',
+                                          Binary('||', Name('a'), Name('b')),
+                                          Name('c'))
+
+
+def test_parse_calls_and_properties():
+  assert parse('success()') == Call('success', ())
+  assert parse('github.ref') == Property(Name('github'), 'ref')
+  assert parse_expression('${{ matrix.os }}') == parse('matrix.os')
+
+
+@pytest.mark.parametrize(
+    'text',
+    ['a ==', 'unknown()', 'contains(a)', 'a b', '(a', 'a.', 'success(1)'])
+def test_parse_errors(text):
+  with pytest.raises(ExpressionError):
+    parse(text)
+
+
+@pytest.mark.parametrize('text', [
+    'a || b && c', '(a || b) && c', '!(a == b)', "format('{0}', matrix.os)",
+    "steps['x-y'].outputs.z", 'github.event.*.id', "a == 'it''s'"
+])
+def test_unparse_round_trip(text):
+  assert parse(unparse(parse(text))) == parse(text)
+
+
+def test_evaluate_values():
+  context = {'matrix': {'os': 'Ubuntu', 'n': 3}, 'env': {}}
+  assert evaluate("matrix.os == 'ubuntu'", context) is True
+  assert evaluate("matrix.n == '3'", context) is True
+  assert evaluate('matrix.missing', context) is None
+  assert evaluate("env.X || 'default'", context) == 'default'
+  assert evaluate("matrix.n > 2 && matrix.os", context) == 'Ubuntu'
+  assert evaluate("format('{0}-{{x}}', matrix.n)", context) == '3-{x}'
+  assert evaluate("contains(fromJSON('[1, 2]'), 2)") is True
+  assert evaluate("fromJSON('[{\"a\": 1}, {\"a\": 2}]').*.a") == [1, 2]
+
+
+def test_evaluate_status_functions():
+  condition = parse('failure() || cancelled()')
+  assert evaluate(condition, status='success') is False
+  assert evaluate(condition, status='failure') is True
+  assert evaluate(condition, status='cancelled') is True
+  assert evaluate('always()', status='failure') is True
+  assert evaluate('success()', status='failure') is False
+
+
+def test_fold_substitutes_known_contexts():
+  folded = fold("matrix.os == 'ubuntu' && steps.s.outcome == 'success'",
+                {'matrix': {
+                    'os': 'ubuntu'
+                }})
+  assert unparse(folded) == "steps.s.outcome == 'success'"
+  assert fold("matrix.os == 'mac' && x", {'matrix': {
+      'os': 'ubuntu'
+  }}) == (Literal(False))
+  assert fold("format('{0}', matrix.os)", {'matrix': {
+      'os': 'ubuntu'
+  }}) == Literal('ubuntu')
+
+
+def test_fold_leaves_status_functions_and_hashfiles():
+  assert fold('always() && true') == Binary('&&', Call('always', ()),
+                                            Literal(True))
+  assert unparse(fold("hashFiles('a') != ''")) == "hashFiles('a') != ''"
+  # A known left operand short-circuits past the status function.
+  assert fold("matrix.x || failure()", {'matrix': {'x': 'a'}}) == Literal('a')
+
+
+def test_uses_status():
+  assert uses_status(parse("always() && matrix.os == 'x'"))
+  assert uses_status(parse('!Failure()'))
+  assert not uses_status(parse("contains(matrix.os, 'x')"))
+
+
+def test_conjunction():
+  assert conjunction(None, 'a') == 'a'
+  assert conjunction('a', '${{ a && b }}', 'c') == '${{ a && b && c }}'
+
+
+def test_check():
+  assert check('foo.bar') == ["unknown context 'foo'"]
+  assert check('matrix.os', Scope(matrix={'os'})) == []
+  assert check('matrix.arch',
+               Scope(matrix={'os'})) == ['matrix.arch is not defined']
+  assert check('steps.s.output',
+               Scope(steps={'s'})) == ["steps.s has no property 'output'"]
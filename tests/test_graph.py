@@ -0,0 +1,82 @@
+import pytest
+
+from ghyamlgen.gh import Always, Job
+from ghyamlgen.graph import CycleError, GraphError, JobGraph
+
+
+def _job(jobid, *needs):
+  job = Job(id=jobid, name=jobid, runs_on='ubuntu-latest')
+  return job.needs(*needs) if needs else job
+
+
+def _diamond():
+  #   a -> b -> d
+  #   a -> c -> d
+  return JobGraph([
+      _job('a'),
+      _job('b', 'a'),
+      _job('c', 'a'),
+      _job('d', 'b', 'c'),
+  ])
+
+
+def test_topological_order_and_levels():
+  graph = _diamond()
+  assert graph.topological_order() == ['a', 'b', 'c', 'd']
+  assert graph.levels() == [['a'], ['b', 'c'], ['d']]
+  assert graph.dependents('a') == ['b', 'c']
+
+
+def test_needs_accumulate():
+  job = _job('d', 'b').needs('c', 'b')
+  assert job.fields['needs'] == ['b', 'c']
+
+
+def test_needs_condition_is_keyword_only():
+  a = _job('a')
+  job = _job('b').needs(a, OpExpr=Always)
+  assert job.fields['needs'] == 'a'
+  assert 'always()' in str(job.fields['if'])
+  with pytest.raises(TypeError):
+    _job('c').needs(a, Always)
+
+
+def test_cycle_detection():
+  graph = JobGraph([_job('a', 'c'), _job('b', 'a'), _job('c', 'b'), _job('d')])
+  with pytest.raises(CycleError) as error:
+    graph.topological_order()
+  cycle = error.value.cycle
+  assert cycle[0] == cycle[-1]
+  assert sorted(cycle[:-1]) == ['a', 'b', 'c']
+  with pytest.raises(GraphError):
+    graph.validate()
+
+
+def test_self_need_is_a_cycle():
+  with pytest.raises(CycleError) as error:
+    JobGraph([_job('a', 'a')]).topological_order()
+  assert error.value.cycle == ['a', 'a']
+
+
+def test_unknown_need():
+  with pytest.raises(GraphError, match='b needs unknown job x'):
+    JobGraph([_job('a'), _job('b', 'x')]).validate()
+
+
+def test_critical_path():
+  critical = _diamond().critical_path({'a': 10, 'b': 30, 'c': 5, 'd': 10})
+  assert critical.length == 50
+  assert critical.path == ['a', 'b', 'd']
+  assert critical.work == 55
+  assert critical.parallelism == pytest.approx(55 / 50)
+  assert critical.width == 2
+  assert critical.start == {'a': 0, 'b': 10, 'c': 10, 'd': 40}
+  assert critical.slack == {'a': 0, 'b': 0, 'c': 25, 'd': 0}
+
+
+def test_critical_path_defaults_and_callables():
+  graph = JobGraph([_job('a'), _job('b')])
+  assert graph.critical_path().length == 600.0
+  assert graph.critical_path(default=60).width == 2
+  critical = graph.critical_path(lambda job: len(job.id()) * 7)
+  assert (critical.length, critical.parallelism) == (7, 2.0)
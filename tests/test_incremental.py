@@ -0,0 +1,50 @@
+import os
+
+from ghyamlgen import incremental
+from ghyamlgen.batch import render_all
+from ghyamlgen.incremental import Manifest
+
+SPEC = '''
+from ghyamlgen.gh import Job, JobShellStep, On, Workflow
+
+
+def workflow():
+  job = Job(id='build', name='Build', runs_on='ubuntu-latest',
+            steps=[JobShellStep(name='Build', run='make')])
+  return Workflow(name='spec', on=On(push={}), jobs={'build': job})
+'''
+
+
+def _statuses(spec, out, manifest):
+  return [r.deps is None for r in render_all([spec], out, 1, manifest)]
+
+
+def test_package_change_invalidates_manifest(tmp_path, monkeypatch):
+  package = tmp_path / 'package'
+  package.mkdir()
+  source = package / 'gh.py'
+  source.write_text('A = 1\n')
+  monkeypatch.setattr(incremental, 'PACKAGE_DIR', str(package))
+
+  spec = tmp_path / 'specs' / 'spec.py'
+  spec.parent.mkdir()
+  spec.write_text(SPEC)
+  out = str(tmp_path / 'out')
+  path = str(tmp_path / 'manifest.json')
+
+  manifest = Manifest(path)
+  assert _statuses(str(spec), out, manifest) == [False]
+  manifest.save()
+  assert os.path.exists(os.path.join(out, 'spec.yml'))
+
+  manifest = Manifest(path)
+  assert _statuses(str(spec), out, manifest) == [True]
+
+  source.write_text('A = 22\n')
+  assert _statuses(str(spec), out, Manifest(path)) == [False]
+
+
+def test_old_manifest_versions_are_ignored(tmp_path):
+  path = tmp_path / 'manifest.json'
+  path.write_text('{"version": 1, "specs": {"x::y": {}}}')
+  assert Manifest(str(path)).entries == {}
@@ -0,0 +1,156 @@
+from ghyamlgen import GitHubExpr, JobShellStep, MatrixJob, resolve
+from ghyamlgen.expr import unparse
+from ghyamlgen.optimize import (DEAD, LIVE, classify, eliminate_dead_steps,
+                                expand_matrix)
+
+
+def test_expand_matrix_include_and_exclude():
+  matrix = {
+      'os': ['ubuntu', 'mac'],
+      'build': ['full', 'minimal'],
+      'exclude': [{
+          'os': 'mac',
+          'build': 'minimal'
+      }],
+      'include': [{
+          'os': 'mac',
+          'extra': 'yes'
+      }, {
+          'os': 'windows'
+      }],
+  }
+  assert expand_matrix(matrix) == [
+      {
+          'os': 'ubuntu',
+          'build': 'full'
+      },
+      {
+          'os': 'ubuntu',
+          'build': 'minimal'
+      },
+      {
+          'os': 'mac',
+          'build': 'full',
+          'extra': 'yes'
+      },
+      {
+          'os': 'windows'
+      },
+  ]
+
+
+def test_expand_matrix_computed_at_runtime():
+  assert expand_matrix('${{ fromJSON(needs.setup.outputs.matrix) }}') is None
+
+
+def test_classify_matrix_conditions():
+  assert classify("matrix.x == 'a'", {'x': 'a'}) == LIVE
+  assert classify("matrix.x == 'a'", {'x': 'b'}) == DEAD
+  folded = classify("matrix.x == 'a' && steps.s.outcome == 'success'",
+                    {'x': 'a'})
+  assert unparse(folded) == "steps.s.outcome == 'success'"
+
+
+def test_classify_status_only_never_true():
+  assert classify('success() && failure()', {}) == DEAD
+
+
+def test_classify_keeps_status_semantics_when_folded_away():
+  # The if: cannot just be dropped: GitHub would then add its implicit
+  # success() and skip the step after a failure.
+  condition = "matrix.x == 'a' || failure()"
+  assert unparse(classify(condition, {'x': 'a'})) == 'always()'
+  assert unparse(classify(condition, {'x': 'b'})) == 'failure()'
+  assert classify("matrix.x == 'a' && failure()", {'x': 'b'}) == DEAD
+  folded = classify("(matrix.x == 'a' || failure()) && steps.s.outcome == 'x'",
+                    {'x': 'a'})
+  assert unparse(folded) == "always() && steps.s.outcome == 'x'"
+
+
+def _job(*steps):
+  matrix = {'include': [{'x': 'a'}, {'x': 'b'}]}
+  return MatrixJob(id='build', matrix=matrix, steps=list(steps))
+
+
+def test_eliminate_dead_steps_drops_and_splits():
+  job = _job(
+      JobShellStep(name='always', run='true'),
+      JobShellStep(name='only a',
+                   run='true',
+                   condition=GitHubExpr("matrix.x == 'a'")),
+      JobShellStep(name='never',
+                   run='true',
+                   condition=GitHubExpr("matrix.x == 'c'")),
+  )
+  jobs, report = eliminate_dead_steps(job)
+  steps = resolve(jobs['build'].fields['steps'])
+  assert [s['name'] for s in steps] == ['always', 'only a']
+  assert report.dead == 1
+
+  jobs, report = eliminate_dead_steps(job, split=True)
+  assert sorted(jobs) == ['build_1', 'build_2']
+  names = [
+      [s['name'] for s in resolve(j.fields['steps'])] for j in jobs.values()
+  ]
+  assert names == [['always', 'only a'], ['always']]
+  # Conditions that hold for every entry of a split job are dropped.
+  assert 'if' not in resolve(jobs['build_1'].fields['steps'])[1]
+  assert report.saved == 3
+
+
+def test_eliminate_keeps_failure_steps_running():
+  job = _job(
+      JobShellStep(name='build', run='false'),
+      JobShellStep(name='only a',
+                   run='true',
+                   condition=GitHubExpr("matrix.x == 'a'")),
+      JobShellStep(name='logs',
+                   run='cat log',
+                   condition=GitHubExpr("matrix.x == 'a' || failure()")),
+  )
+  jobs, _ = eliminate_dead_steps(job, split=True)
+  logs = [resolve(j.fields['steps'])[-1] for j in jobs.values()]
+  assert [step['if'] for step in logs
+         ] == ['${{ always() }}', '${{ failure() }}']
+
+
+def test_referenced_dead_steps_stay_skipped():
+  # Removing brt_run would make its outcome null rather than 'skipped', and
+  # the upload guarded by it would start running.
+  unskipped = GitHubExpr("always() && steps.brt_run.outcome != 'skipped'")
+  job = _job(
+      JobShellStep(name='build', run='make'),
+      JobShellStep(name='brt',
+                   id='brt_run',
+                   run='./run_brt.sh',
+                   condition=GitHubExpr("matrix.x == 'a'")),
+      JobShellStep(name='never',
+                   run='true',
+                   condition=GitHubExpr("matrix.x == 'c'")),
+      JobShellStep(name='upload', run='upload', condition=unskipped),
+  )
+  jobs, report = eliminate_dead_steps(job, split=True)
+  steps = {
+      jobid: [(s['name'], s.get('if')) for s in resolve(j.fields['steps'])]
+      for jobid, j in jobs.items()
+  }
+  assert steps == {
+      'build_1': [('build', None), ('brt', None), ('upload', unskipped)],
+      'build_2': [('build', None), ('brt', '${{ false }}'),
+                  ('upload', unskipped)],
+  }
+  assert report.dead == 2
+
+
+def test_dynamic_step_references_keep_dead_steps():
+  job = _job(
+      JobShellStep(name='a',
+                   id='a',
+                   run='true',
+                   condition=GitHubExpr("matrix.x == 'c'")),
+      JobShellStep(name='b', run='echo ${{ steps[matrix.x].outcome }}'),
+  )
+  jobs, _ = eliminate_dead_steps(job)
+  steps = resolve(jobs['build'].fields['steps'])
+  assert [(s['name'], s.get('if')) for s in steps] == [('a', '${{ false }}'),
+                                                       ('b', None)]
@@ -0,0 +1,87 @@
+from ghyamlgen import JobShellStep, MatrixJob, Workflow, resolve
+from ghyamlgen.gh import Job, On
+from ghyamlgen.planner import (CostModel, explain, job_duration, plan,
+                               plan_workflow)
+
+DURATIONS = {'Build': 330.0, 'Heavy': 600.0}
+MODEL = CostModel(durations=DURATIONS, default=60.0, startup=30.0, skipped=1.0)
+
+
+def _job(entries, condition="matrix.heavy == 'yes'"):
+  matrix = entries if isinstance(entries, str) else {'include': entries}
+  return MatrixJob(id='build',
+                   matrix=matrix,
+                   steps=[
+                       JobShellStep(name='Build', run='make'),
+                       JobShellStep(name='Heavy',
+                                    run='make heavy',
+                                    condition=condition),
+                   ])
+
+
+def _entry(name, heavy, os='ubuntu-22.04'):
+  return {'name': name, 'os': os, 'identifier': name, 'heavy': heavy}
+
+
+def test_uniform_matrix_stays_whole():
+  p = plan(_job([_entry('a', 'yes'), _entry('b', 'yes')]), MODEL)
+  assert p.choice.kind == 'matrix'
+  assert p.variants == 1 and p.divergence == 0
+  assert list(p.jobs) == ['build']
+  assert 'chose matrix: same cost as standalone, fewer jobs' in explain(p)
+
+
+def test_divergent_entries_are_split():
+  entries = [_entry('a', 'yes'), _entry('b', 'yes'), _entry('c', 'no')]
+  p = plan(_job(entries), MODEL)
+  assert [e.kind for e in p.candidates] == ['matrix', 'split', 'standalone']
+  assert p.choice.kind == 'split'
+  assert p.choice.groups == [[0, 1], [2]]
+  jobs = {jobid: resolve(job) for jobid, job in p.jobs.items()}
+  assert list(jobs) == ['build_1', 'build_2']
+  assert [s['name'] for s in jobs['build_2']['steps']] == ['Build']
+  assert [e['name'] for e in jobs['build_2']['strategy']['matrix']['include']
+         ] == ['c']
+  # Skipping Heavy takes entry c from 6 to 7 billed minutes.
+  assert p.choice.minutes == 2 * 16 + 6
+  assert p.candidates[0].minutes == 2 * 16 + 7
+  assert 'chose split: same cost as standalone, fewer jobs' in explain(p)
+
+
+def test_runner_multipliers_and_minutes():
+  entries = [_entry('a', 'yes'), _entry('m', 'yes', os='macos-12')]
+  matrix = plan(_job(entries), MODEL).candidates[0]
+  # 30 + 330 + 600 seconds is 16 billed minutes, times 10 on macOS.
+  assert matrix.minutes == 16 + 160
+
+
+def test_unexpandable_matrix_is_kept():
+  job = _job('${{ fromJSON(needs.setup.outputs.matrix) }}')
+  p = plan(job, MODEL)
+  assert p.choice is None and p.jobs == {'build': job}
+  assert 'cannot be expanded statically' in explain(p)
+
+
+def test_job_duration():
+  job = Job(id='lint',
+            name='Lint',
+            runs_on='ubuntu-latest',
+            steps=[JobShellStep(name='Build', run='make')])
+  assert job_duration(job, MODEL) == 30.0 + 330.0
+  entries = [_entry('a', 'yes'), _entry('b', 'no')]
+  # The matrix lasts as long as its slowest entry.
+  assert job_duration(_job(entries), MODEL) == 30.0 + 330.0 + 600.0
+
+
+def test_plan_workflow_replaces_matrix_jobs():
+  entries = [_entry('a', 'yes'), _entry('b', 'yes'), _entry('c', 'no')]
+  lint = Job(id='lint', name='Lint', runs_on='ubuntu-latest', steps=[])
+  workflow = Workflow(name='CI',
+                      on=On(push={}),
+                      jobs={
+                          'lint': lint,
+                          'build': _job(entries)
+                      })
+  planned, plans = plan_workflow(workflow, MODEL)
+  assert list(resolve(planned)['jobs']) == ['lint', 'build_1', 'build_2']
+  assert [p.job for p in plans] == ['build']
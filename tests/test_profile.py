@@ -0,0 +1,86 @@
+import io
+import os
+import subprocess
+import sys
+
+from ghyamlgen import Group, profile, render
+from ghyamlgen.batch import discover, render_all
+from ghyamlgen.gh import Job, JobShellStep
+
+SPEC = '''
+from ghyamlgen.gh import Job, JobShellStep, On, Workflow
+
+
+def workflow():
+  steps = [JobShellStep(name='Step {{}}'.format(i), run='true')
+           for i in range({steps})]
+  return Workflow(name='w', on=On(push={{}}),
+                  jobs={{'build': Job(id='build', name='Build',
+                                      runs_on='ubuntu-latest', steps=steps)}})
+'''
+
+
+def _specs(tmp_path):
+  for name, steps in [('a', 3), ('b', 5)]:
+    (tmp_path / '{}.py'.format(name)).write_text(SPEC.format(steps=steps))
+  return discover([str(tmp_path)])
+
+
+class _Flattening(Group):
+  __slots__ = ()
+
+  @property
+  def fields(self):
+    raise AssertionError('label() flattened a Group')
+
+
+def test_label_does_not_compute_fields():
+  job = Job(id='build', name='Build', runs_on='ubuntu-latest')
+  assert profile.label(job) == 'Job(build)'
+  assert profile.label(JobShellStep(name='Test',
+                                    run='true')) == ('JobShellStep(Test)')
+  assert profile.label(_Flattening()) == '_Flattening'
+
+
+def test_worker_profiles_are_merged(tmp_path):
+  specs = _specs(tmp_path)
+  with profile.profiling() as profiler:
+    results = list(render_all(specs, str(tmp_path / 'out'), jobs=2))
+  assert all(r.error is None for r in results)
+  assert profiler.counts['emit']['JobShellStep'] == 3 + 5
+  assert profiler.timings['emit']['Workflow'][0] == 2
+  names = [name for _, name in profiler.largest_subtrees()]
+  assert names.count('Job(build)') == 2
+
+
+def test_snapshot_round_trip():
+  job = Job(id='build',
+            name='Build',
+            runs_on='ubuntu-latest',
+            steps=[JobShellStep(name='Test', run='true')])
+  with profile.profiling() as profiler:
+    render(job)
+  merged = profile.Profiler()
+  merged.merge(profiler.snapshot())
+  merged.merge(profiler.snapshot())
+  assert merged.counts['emit'] == {
+      name: 2 * count for name, count in profiler.counts['emit'].items()
+  }
+  stream = io.StringIO()
+  merged.report(stream)
+  assert 'Job(build)' in stream.getvalue()
+
+
+def test_environment_profile_covers_workers(tmp_path):
+  specs = _specs(tmp_path)
+  report = tmp_path / 'profile.txt'
+  env = dict(os.environ, GHYAMLGEN_PROFILE=str(report))
+  subprocess.run([
+      sys.executable, '-m', 'ghyamlgen', 'render', '-j', '2', '-o',
+      str(tmp_path / 'out')
+  ] + specs,
+                 check=True,
+                 env=env,
+                 cwd=os.path.dirname(os.path.dirname(__file__)),
+                 capture_output=True)
+  assert '8  JobShellStep' in report.read_text()
@@ -0,0 +1,85 @@
+import copy
+import pickle
+
+import pytest
+
+from ghyamlgen import Group, resolve
+from ghyamlgen.gh import Job, JobShellStep
+
+
+def _job():
+  steps = [JobShellStep(name='Build', run='make')]
+  return Job(id='build',
+             name='Build',
+             runs_on='ubuntu-latest',
+             env={'CC': 'gcc'},
+             steps=steps)
+
+
+def test_frozen_nodes_reject_mutation():
+  job = _job().freeze()
+  step = job.fields['steps'][0]
+  with pytest.raises(AttributeError):
+    job.fields = {'name': 'Other'}
+  with pytest.raises(AttributeError):
+    step.fields = {'run': 'true'}
+  for mutate in [
+      lambda: job.fields.update(name='Other'),
+      lambda: job.fields.__setitem__('name', 'Other'),
+      lambda: job.fields['steps'].append(step),
+      lambda: job.fields['steps'].pop(),
+      lambda: job.fields['env'].__setitem__('CC', 'clang'),
+      lambda: job.fields['env'].clear(),
+  ]:
+    with pytest.raises(TypeError):
+      mutate()
+  assert resolve(job) == resolve(_job())
+
+
+def test_frozen_nodes_pickle_frozen():
+  job = _job().freeze()
+  for loaded in [pickle.loads(pickle.dumps(job)), copy.deepcopy(job)]:
+    assert resolve(loaded) == resolve(job)
+    with pytest.raises(TypeError):
+      loaded.fields['env']['CC'] = 'clang'
+
+
+def test_updated_shares_structure():
+  job = _job().freeze()
+  steps = job.fields['steps']
+  variant = job.updated({'name': 'Variant'})
+  assert variant.fields['steps'] is steps
+  assert variant.fields['steps'][0] is steps[0]
+  assert job.fields['name'] == 'Build'
+  # The copy is not frozen, but what it shares with the original still is.
+  variant.fields = {**variant.fields, 'env': {'A': '1'}}
+  with pytest.raises(TypeError):
+    variant.fields['steps'].append(None)
+  assert job.fields['env'] == {'CC': 'gcc'}
+
+
+def test_needs_on_frozen_job_returns_a_copy():
+  job = _job().freeze()
+  needed = job.needs('setup')
+  assert needed is not job
+  assert needed.fields['needs'] == 'setup'
+  assert 'needs' not in job.fields
+
+
+def test_frozen_group():
+  a, b = JobShellStep(name='a', run='a'), JobShellStep(name='b', run='b')
+  group = Group(a, [b]).freeze()
+  assert list(group) == [a, b]
+  assert a._frozen and b._frozen
+
+
+def test_nodes_are_slotted_and_sparse():
+  step = JobShellStep(name='Build', run='make')
+  assert not hasattr(step, '__dict__')
+  assert step.fields == {'name': 'Build', 'run': 'make'}
+
+
+def test_fields_set_later_keep_their_position():
+  job = Job(id='build', name='Build', runs_on='ubuntu-latest', steps=[])
+  job = job.needs('setup').updated({'if': 'success()'})
+  assert list(job.fields) == ['name', 'runs-on', 'if', 'needs', 'steps']
@@ -0,0 +1,71 @@
+import hashlib
+import threading
+import urllib.error
+import urllib.request
+from xml.etree import ElementTree
+
+import pytest
+
+from ghyamlgen.s3local import serve
+
+
+@pytest.fixture
+def store(tmp_path):
+  server = serve(str(tmp_path), port=0)
+  thread = threading.Thread(target=server.serve_forever, daemon=True)
+  thread.start()
+  yield 'http://127.0.0.1:{}'.format(server.server_address[1]), tmp_path
+  server.shutdown()
+  server.server_close()
+
+
+def _request(url, method='GET', data=None):
+  request = urllib.request.Request(url, data=data, method=method)
+  try:
+    with urllib.request.urlopen(request) as response:
+      return response.status, dict(response.headers), response.read()
+  except urllib.error.HTTPError as error:
+    return error.code, dict(error.headers), error.read()
+
+
+def _keys(body):
+  return [element.text for element in ElementTree.fromstring(body).iter('Key')]
+
+
+def test_round_trip(store):
+  url, root = store
+  body = b'\x00compiled object\xff'
+  status, headers, _ = _request(url + '/cache/a/b/obj', 'PUT', body)
+  assert status == 200
+  etag = '"{}"'.format(hashlib.md5(body).hexdigest())
+  assert headers['ETag'] == etag
+  assert (root / 'cache' / 'a' / 'b' / 'obj').read_bytes() == body
+
+  status, headers, fetched = _request(url + '/cache/a/b/obj')
+  assert (status, fetched, headers['ETag']) == (200, body, etag)
+
+  status, headers, fetched = _request(url + '/cache/a/b/obj', 'HEAD')
+  assert (status, fetched) == (200, b'')
+  assert headers['Content-Length'] == str(len(body))
+
+  _request(url + '/cache/a/other', 'PUT', b'x')
+  _request(url + '/cache/c', 'PUT', b'y')
+  status, _, listing = _request(url + '/cache?list-type=2&prefix=a/')
+  assert status == 200
+  assert _keys(listing) == ['a/b/obj', 'a/other']
+
+  assert _request(url + '/cache/a/b/obj', 'DELETE')[0] == 204
+  status, _, error = _request(url + '/cache/a/b/obj')
+  assert status == 404
+  assert b'<Code>NoSuchKey</Code>' in error
+  assert _keys(_request(url + '/cache')[2]) == ['a/other', 'c']
+
+
+def test_paths_cannot_leave_the_root(store):
+  url, root = store
+  status = _request(url + '/cache/../../escape', 'PUT', b'x')[0]
+  assert status == 404
+  assert not (root.parent / 'escape').exists()
+  status, _, error = _request(url + '/%2E%2E/secret')
+  assert status == 404
+  assert b'<Code>NoSuchBucket</Code>' in error
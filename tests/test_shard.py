@@ -0,0 +1,75 @@
+from ghyamlgen import GitHubExpr, GitHubMapping, resolve
+from ghyamlgen.gh import MatrixJob
+from ghyamlgen.shard import (ShardedBRT, Shard, balance, fan_in, parse_log,
+                             shard_artifacts, shard_matrix)
+
+MATRIX = {
+    'include': [
+        {
+            'name': 'Full',
+            'identifier': 'full'
+        },
+        {
+            'name': 'Minimal',
+            'identifier': 'minimal'
+        },
+    ]
+}
+
+
+def _job(shards):
+  jobid = GitHubExpr(GitHubMapping('identifier', context='matrix'))
+  return MatrixJob(id='build',
+                   matrix=shard_matrix(MATRIX, shards),
+                   steps=ShardedBRT(jobid, '', shards))
+
+
+def test_parse_log():
+  log = '\n'.join([
+      'Running tests/a/test_x.sh ... OK',
+      'Test took 00:01:02.5s',
+      'Running tests/b/test_y.sh ... FAILED',
+      '  - tests/c/test_z.sh',
+  ])
+  assert parse_log(log) == {
+      'tests/a/test_x.sh': 62.5,
+      'tests/b/test_y.sh': None,
+      'tests/c/test_z.sh': None,
+  }
+
+
+def test_balance_splits_on_durations():
+  durations = {'a': 10.0, 'b': 6.0, 'c': 5.0, 'd': None}
+  shards = balance(['a', 'b', 'c', 'd'], durations, 2)
+  # d takes the median, 6s.
+  assert shards == [Shard(['a', 'c'], 15.0), Shard(['b', 'd'], 12.0)]
+
+
+def test_shard_matrix():
+  shards = [Shard(['a', 'b'], 2.0), Shard(['c'], 1.0)]
+  include = shard_matrix(MATRIX, shards)['include']
+  assert [(e['name'], e['brt_shard'], e['brt_tests']) for e in include] == [
+      ('Full (BRT 1/2)', 1, 'a b'),
+      ('Full (BRT 2/2)', 2, 'c'),
+      ('Minimal (BRT 1/2)', 1, 'a b'),
+      ('Minimal (BRT 2/2)', 2, 'c'),
+  ]
+
+
+def test_fan_in_downloads_only_shard_artifacts():
+  job = _job(2)
+  names = [
+      'brt-full-1',
+      'brt-full-2',
+      'brt-minimal-1',
+      'brt-minimal-2',
+  ]
+  assert shard_artifacts(job) == names
+  merge = resolve(fan_in(job))
+  assert merge['needs'] == 'build'
+  assert merge['if'] == '${{ always() }}'
+  downloads = [s for s in merge['steps'] if 'download' in s.get('uses', '')]
+  assert [d['with']['name'] for d in downloads] == names
+  assert all(d['continue-on-error'] for d in downloads)
+  assert merge['steps'][-1]['run'] == (
+      'test "${{ needs.build.result }}" = success')
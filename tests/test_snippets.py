@@ -0,0 +1,37 @@
+from ghyamlgen import Snippet, resolve
+from ghyamlgen.gh import ImportedSnippet, prefetch_snippets
+from ghyamlgen.snippets import SnippetCache
+
+
+def test_cache_hits_until_the_file_changes(tmp_path):
+  script = tmp_path / 'a.sh'
+  script.write_text('echo one\n')
+  cache = SnippetCache()
+  assert cache.load(str(script)) == 'echo one'
+  assert cache.load(str(script)) == 'echo one'
+  assert cache.cache_info()[:2] == (1, 1)
+  script.write_text('echo three\n')
+  assert cache.load(str(script)) == 'echo three'
+  assert cache.cache_info()[:2] == (1, 2)
+
+
+def test_cache_is_bounded(tmp_path):
+  cache = SnippetCache(maxsize=2)
+  for name in 'abc':
+    (tmp_path / name).write_text(name)
+    cache.load(str(tmp_path / name))
+  assert cache.cache_info().currsize == 2
+
+
+def test_imported_snippet_reads_lazily(tmp_path):
+  script = tmp_path / 'install.sh'
+  step = ImportedSnippet('Install', str(script))
+  script.write_text('apt-get update\napt-get install -y x\n')
+  prefetch_snippets([step])
+  run = resolve(step)['run']
+  assert isinstance(run, Snippet)
+  assert run == 'apt-get update\napt-get install -y x'
+  script.write_text('true')
+  assert resolve(step)['run'] == 'true'
+  # Reading does not store the contents on the node.
+  assert step._fields['run'] == ''
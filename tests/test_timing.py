@@ -0,0 +1,104 @@
+import json
+import os
+import subprocess
+
+import pytest
+
+from ghyamlgen import Checkout, GitHubExpr, LogContext, resolve
+from ghyamlgen.gh import ImportedSnippet, Job, JobShellStep
+from ghyamlgen.incremental import snippet_paths
+from ghyamlgen.timing import durations, instrument, merge
+
+
+def _job(*steps):
+  return Job(id='build',
+             name='Build',
+             runs_on='ubuntu-latest',
+             steps=list(steps))
+
+
+def test_instrument_keeps_step_fields(tmp_path):
+  script = tmp_path / 'a.sh'
+  script.write_text('echo a\necho b')
+  step = JobShellStep(name='Build',
+                      run='make',
+                      id='build',
+                      condition=GitHubExpr('always()')).updated({
+                          'env': {
+                              'X': '1'
+                          },
+                          'timeout-minutes': 30
+                      })
+  job = instrument(
+      _job(Checkout(), step, ImportedSnippet('Snippet', str(script)),
+           LogContext('github')))
+  checkout, build, snippet, context, publish, upload = resolve(
+      job.fields['steps'])
+  assert 'STEP_SCRIPT' not in str(checkout)
+  assert {
+      k: v for k, v in build.items() if k != 'run'
+  } == {
+      'name': 'Build',
+      'id': 'build',
+      'if': '${{ always() }}',
+      'env': {
+          'X': '1'
+      },
+      'timeout-minutes': 30,
+  }
+  assert '\nmake\n' in build['run']
+  assert '\necho a\necho b\n' in snippet['run']
+  assert context['env'] == {'GITHUB_CONTEXT': '${{ toJSON(github) }}'}
+  assert 'STEP_SCRIPT' in context['run']
+  assert [publish['name'],
+          upload['name']] == ['Publish step timings', 'Upload step timings']
+  assert snippet_paths(job) == {str(script)}
+
+
+@pytest.mark.parametrize('script, status', [('echo hi', 0), ('exit 3', 3)])
+def test_wrapper_records_and_keeps_status(tmp_path, script, status):
+  job = instrument(_job(JobShellStep(name="it's ${{ x }}", run=script)))
+  run = resolve(job.fields['steps'])[0]['run']
+  env = dict(os.environ, RUNNER_TEMP=str(tmp_path))
+  result = subprocess.run(['bash', '-e', '-c', run], env=env)
+  assert result.returncode == status
+  records = tmp_path / 'ghyamlgen-step-timings.jsonl'
+  record = json.loads(records.read_text())
+  assert record['step'] == "it's ${{ x }}"
+  assert record['exit_status'] == status
+  assert record['seconds'] >= 0
+  assert (tmp_path / 'ghyamlgen-step-timings.md').exists()
+
+
+def _record(run_id, *samples, time=0):
+  return {
+      'run_id':
+          run_id,
+      'identifier':
+          'build-0',
+      'job':
+          'build',
+      'time':
+          time,
+      'steps': [{
+          'step': name,
+          'seconds': seconds,
+          'max_rss_kib': rss,
+          'exit_status': status
+      } for name, seconds, rss, status in samples],
+  }
+
+
+def test_merge_and_durations():
+  database = {'records': [], 'steps': {}, 'jobs': {}}
+  records = [
+      _record(1, ('a', 10, 100, 0), ('b', 5, 50, 0)),
+      _record(2, ('a', 30, 300, 0), ('b', 99, 10, 1), time=1),
+      _record(3, ('a', 20, 200, 0), time=2),
+  ]
+  assert merge(database, records) == 3
+  assert merge(database, records[:1]) == 0
+  # Failed steps count towards the job but not the step estimate.
+  assert durations(database) == {'a': 20, 'b': 5}
+  assert database['steps']['a']['max_rss_kib'] == 300
+  assert database['jobs'] == {'build': [15, 129, 20]}
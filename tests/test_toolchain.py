@@ -0,0 +1,79 @@
+import pytest
+
+from ghyamlgen import resolve
+from ghyamlgen.deps import apt_cache
+from ghyamlgen.gh import Job, JobShellStep, MatrixJob
+from ghyamlgen.toolchain import Toolchain
+
+
+def _toolchain(setup, registry='localhost:5000'):
+  return Toolchain('marian', 'ubuntu:22.04', setup, registry=registry)
+
+
+def test_scripts_skip_actions_and_decide_their_conditions():
+  install = JobShellStep(name='Install', run='sudo apt-get install -y x')
+  toolchain = _toolchain([
+      JobShellStep(name='Fetch', run='wget x'),
+      apt_cache(install, 'ubuntu-22.04')
+  ])
+  assert [fname for fname, _ in toolchain.scripts()] == [
+      '00-fetch.sh',
+      '01-keep-downloaded-apt-packages.sh',
+      '02-install.sh',
+      '03-collect-downloaded-apt-packages.sh',
+  ]
+  assert toolchain.scripts()[2][1] == 'sudo apt-get install -y x\n'
+  assert 'actions/cache' not in toolchain.dockerfile()
+
+
+@pytest.mark.parametrize('step', [
+    JobShellStep(name='Power', run='Get-Date', shell='pwsh'),
+    JobShellStep(name='Later', run='x', condition='steps.build.outcome'),
+    JobShellStep(name='Failed', run='x', condition='failure()'),
+])
+def test_scripts_reject_undecidable_steps(step):
+  with pytest.raises(ValueError):
+    _toolchain([step]).scripts()
+
+
+def test_local_registry():
+  toolchain = _toolchain([JobShellStep(name='Fetch', run='wget x')])
+  assert toolchain.local()
+  job = resolve(toolchain.job())
+  assert [step['name'] for step in job['steps']] == [
+      'Write toolchain build context', 'Build and push toolchain image'
+  ]
+  build = job['steps'][1]['run']
+  assert 'docker manifest inspect --insecure' in build
+  assert 'localhost:5000/marian:{}'.format(toolchain.tag()) in build
+  used = resolve(
+      toolchain.use(Job(id='build', name='Build', runs_on='ubuntu-latest')))
+  assert used['container'] == '${{ needs.toolchain_marian.outputs.image }}'
+  assert used['needs'] == 'toolchain_marian'
+
+
+def test_remote_registry_logs_in():
+  toolchain = _toolchain([JobShellStep(name='Fetch', run='wget x')],
+                         registry='ghcr.io/org')
+  assert not toolchain.local()
+  job = resolve(toolchain.job())
+  assert job['steps'][0]['uses'] == 'docker/login-action@v2'
+  assert job['steps'][0]['with']['registry'] == 'ghcr.io'
+  assert 'credentials' in resolve(toolchain.container())
+
+
+def test_use_refuses_non_linux_runners():
+  toolchain = _toolchain([])
+  with pytest.raises(ValueError):
+    toolchain.use(Job(id='mac', name='Mac', runs_on='macos-12'))
+  matrix = MatrixJob(
+      id='build',
+      matrix={'include': [{
+          'os': 'ubuntu-22.04'
+      }, {
+          'os': 'macos-12'
+      }]})
+  with pytest.raises(ValueError):
+    toolchain.use(matrix)
+  linux = MatrixJob(id='build', matrix={'include': [{'os': 'ubuntu-22.04'}]})
+  assert toolchain.use(linux).fields['needs'] == 'toolchain_marian'
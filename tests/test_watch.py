@@ -0,0 +1,84 @@
+import io
+import os
+
+from ghyamlgen.watch import PollingWatcher, Watch
+
+SPEC = '''
+import os
+
+from ghyamlgen.gh import ImportedSnippet, Job, On, Workflow
+
+SNIPPET = os.path.join(os.path.dirname(__file__), 'build.sh')
+
+
+def workflow():
+  # The job name is taken from the snippet when the spec is built.
+  with open(SNIPPET) as fp:
+    name = fp.readline().strip('# \\n')
+  job = Job(id='build', name=name, runs_on='ubuntu-latest',
+            steps=[ImportedSnippet('Build', SNIPPET)])
+  return Workflow(name='spec', on=On(push={}), jobs={'build': job})
+'''
+
+
+class FakeWatcher:
+
+  def __init__(self):
+    self.watched = set()
+
+  def watch(self, paths):
+    self.watched.update(paths)
+
+  def close(self):
+    pass
+
+
+def _write(path, text):
+  # A different size, so the snippet cache sees the change whatever the
+  # file system's timestamp granularity.
+  path.write_text(text)
+  os.utime(path, ns=(0, len(text)))
+
+
+def test_snippet_change_reloads_spec(tmp_path):
+  spec = tmp_path / 'spec.py'
+  spec.write_text(SPEC)
+  snippet = tmp_path / 'build.sh'
+  _write(snippet, '# first\nmake')
+  out = tmp_path / 'out'
+
+  watcher = FakeWatcher()
+  watch = Watch([str(tmp_path)], str(out), watcher, io.StringIO())
+  watch.load(str(spec))
+  rendered = (out / 'spec.yml').read_text()
+  assert 'name: first' in rendered
+  assert str(snippet) in watcher.watched
+  assert str(spec) in watcher.watched
+
+  _write(snippet, '# second name\nmake all')
+  watch.update({str(snippet)})
+  rendered = (out / 'spec.yml').read_text()
+  assert 'name: second name' in rendered
+  assert 'make all' in rendered
+
+
+def test_unrelated_change_renders_nothing(tmp_path):
+  spec = tmp_path / 'spec.py'
+  spec.write_text(SPEC)
+  _write(tmp_path / 'build.sh', '# first\nmake')
+  stream = io.StringIO()
+  watch = Watch([str(tmp_path)], str(tmp_path / 'out'), FakeWatcher(), stream)
+  watch.load(str(spec))
+  logged = stream.getvalue()
+  watch.update({str(tmp_path / 'README.md')})
+  assert stream.getvalue() == logged
+
+
+def test_polling_watcher(tmp_path):
+  path = tmp_path / 'a.sh'
+  path.write_text('a')
+  watcher = PollingWatcher(interval=0.01)
+  watcher.watch([str(path)])
+  assert watcher.wait(0.02) == set()
+  _write(path, 'ab')
+  assert watcher.wait(1) == {str(path)}
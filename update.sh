@@ -3,7 +3,7 @@
 git -C bergamot-translator pull || git clone git@github.com:jerinphilip/bergamot-translator.git
 git -C bergamot-translator fetch -a
 git -C bergamot-translator checkout workflow-gen-exps
-(python3 examples/bergamot-translator/main.py > bergamot-translator/.github/workflows/native.yml &&
+(python3 -m ghyamlgen render --incremental examples/bergamot-translator -o bergamot-translator/.github/workflows &&
 cd bergamot-translator &&
         git add .github/workflows/native.yml &&
         git commit -m "Updating native.yml" &&